@@ -1,6 +1,30 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-from .seamanager import SeafileContentManager
-from .seacheckpoints import SeafileCheckpoints
-from .seaopen import SeafileFS
+# Classes are imported on first access, so using SeafileFS does not import
+# the Jupyter server packages needed by the contents manager.
+import importlib
+
+_exports = {
+    'SeafileContentManager': '.seamanager',
+    'SeafileCheckpoints': '.seacheckpoints',
+    'SeafileFS': '.seaopen',
+    'SeafileMultiContentManager': '.seamulti',
+    'SeafileMultiCheckpoints': '.seamulti',
+    }
+
+__all__ = list(_exports)
+
+
+def __getattr__(name):
+    if name in _exports:
+        value = getattr(importlib.import_module(_exports[name], __name__), name)
+        globals()[name] = value
+        return value
+    raise AttributeError(
+        "module {0!r} has no attribute {1!r}".format(__name__, name)
+        )
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Command line tools, run as python -m SeafileContentManager."""
+import argparse
+import sys
+
+
+def syncCommand(args):
+    from .seafilemixin import connect, getConnection, readCredentials
+    from .seaopen import SeafileFS
+    from .seasync import sync
+    if args.library:
+        seafileURL, token = readCredentials()[:2]
+        connection = connect(seafileURL, token, args.library, 'True')
+    else:
+        connection = getConnection()
+    client = SeafileFS(connection)
+
+    def report(action, path):
+        if args.verbose or action == 'failed' or args.dry_run:
+            print('{0:8} {1}'.format(action, path))
+
+    result = sync(
+        client, args.local, args.remote, download=args.download,
+        delete=args.delete, exclude=args.exclude, checksum=args.checksum,
+        dryRun=args.dry_run, workers=args.workers, report=report
+        )
+    print(
+        '{0} {1}, {2} deleted, {3} unchanged, {4} failed, {5} bytes{6}'.format(
+            len(result.transferred),
+            'downloaded' if args.download else 'uploaded',
+            len(result.deleted), result.unchanged, len(result.failed),
+            result.bytes, ' (dry run)' if args.dry_run else ''
+            )
+        )
+    return 1 if result.failed else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m SeafileContentManager')
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+    syncParser = commands.add_parser(
+        'sync', help='mirror a local folder into a library folder',
+        description='Mirror a local folder into a library folder, or back '
+                    'with --download. Only changed files are transferred. '
+                    'Credentials and library are read like for the '
+                    'contents manager.'
+        )
+    syncParser.add_argument('local', help='local folder')
+    syncParser.add_argument(
+        'remote', nargs='?', default='/', help='folder in the library, default /'
+        )
+    syncParser.add_argument(
+        '--download', action='store_true',
+        help='copy from the library to the local folder'
+        )
+    syncParser.add_argument(
+        '--delete', action='store_true',
+        help='delete files missing in the source from the target'
+        )
+    syncParser.add_argument(
+        '--exclude', action='append', default=[], metavar='PATTERN',
+        help='skip paths or names matching PATTERN, repeatable'
+        )
+    syncParser.add_argument(
+        '--checksum', action='store_true',
+        help='compare files with a new mtime but the same size by checksum'
+        )
+    syncParser.add_argument(
+        '-n', '--dry-run', action='store_true',
+        help='only show what would be done'
+        )
+    syncParser.add_argument(
+        '--workers', type=int, default=4, help='parallel transfers, default 4'
+        )
+    syncParser.add_argument(
+        '--library', help='library name, instead of SEAFILE_LIBRARY'
+        )
+    syncParser.add_argument('-v', '--verbose', action='store_true')
+    syncParser.set_defaults(function=syncCommand)
+    args = parser.parse_args(argv)
+    return args.function(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,222 @@
+#! python3
+# -*- coding: utf-8 -*-
+import io
+import mmap
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from .seafilemixin import ensureBase
+
+
+def blobCacheEnabled():
+    return os.environ.get('SEAFILE_BLOB_CACHE', False) == 'True'
+
+
+# partial downloads untouched for this long were left by a crashed process
+STALE_SECONDS = 3600
+
+
+@contextmanager
+def fileLock(path, shared=False):
+    """Lock between processes, a no-op where fcntl is missing."""
+    with open(path, 'a') as lockFile:
+        if fcntl is not None:
+            fcntl.flock(lockFile, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lockFile, fcntl.LOCK_UN)
+
+
+class BlobCache(object):
+    """On-disk cache of file contents keyed by Seafile file ID.
+
+    A file ID identifies immutable content, so cached blobs never need
+    validation. Downloads of a blob are serialized between processes with
+    lock files in .locks, so concurrent kernels fetch it once. The least
+    recently used blobs are removed when the cache exceeds
+    SEAFILE_BLOB_CACHE_BYTES, holding the lock of the blob exclusively.
+    Readers hold it shared until the blob is opened. Removing a blob which
+    is mapped by another process is safe, the mapping stays valid until it
+    is closed.
+    """
+
+    def __init__(self, directory=None, maxBytes=None):
+        self.directory = directory or ensureBase() + 'blobs'
+        self.locks = os.path.join(self.directory, '.locks')
+        os.makedirs(self.locks, mode=0o700, exist_ok=True)
+        if maxBytes is None:
+            maxBytes = int(os.environ.get('SEAFILE_BLOB_CACHE_BYTES', 4 * 2**30))
+        self.maxBytes = maxBytes
+
+    def blobPath(self, fileID):
+        return os.path.join(self.directory, fileID)
+
+    def lockPath(self, fileID):
+        """Lock file of a blob, shared by IDs with the same first two digits.
+
+        Lock files are never removed, a process could otherwise lock a
+        new file of the same name while another still holds the old one.
+        """
+        return os.path.join(self.locks, fileID[:2])
+
+    def fetch(self, fileID, chunks):
+        """Return path of the blob, downloading it from chunks() if missing.
+
+        The blob may be evicted any time after, open() reads it safely.
+        """
+        return self.use(fileID, chunks, lambda path: path)
+
+    def use(self, fileID, chunks, opener):
+        """Return opener(path) of the blob, downloading it if missing.
+
+        opener runs under the shared lock of the blob, so it is not
+        evicted before it is opened.
+        """
+        target = self.blobPath(fileID)
+        while True:
+            with fileLock(self.lockPath(fileID), shared=True):
+                try:
+                    os.utime(target)
+                    return opener(target)
+                except FileNotFoundError:
+                    pass
+            self.download(fileID, chunks)
+
+    def download(self, fileID, chunks):
+        """Download a missing blob from chunks(), once between processes."""
+        target = self.blobPath(fileID)
+        with fileLock(self.lockPath(fileID)):
+            if not os.path.exists(target):
+                tmp = '{0}.{1}.{2}.tmp'.format(
+                    target, os.getpid(), threading.get_ident()
+                    )
+                try:
+                    with open(tmp, 'wb') as file:
+                        for chunk in chunks():
+                            file.write(chunk)
+                    os.replace(tmp, target)
+                finally:
+                    if os.path.exists(tmp):
+                        os.remove(tmp)
+        self.evict(keep=fileID)
+
+    def evict(self, keep=None):
+        """Remove least recently used blobs until the budget is met."""
+        with fileLock(os.path.join(self.directory, '.evict.lock')):
+            blobs = []
+            total = 0
+            stale = time.time() - STALE_SECONDS
+            for entry in os.scandir(self.directory):
+                if entry.name.endswith('.tmp'):
+                    try:
+                        if entry.stat().st_mtime < stale:
+                            os.remove(entry.path)
+                    except FileNotFoundError:
+                        pass
+                    continue
+                if entry.name.startswith('.') or '.' in entry.name:
+                    continue
+                stat = entry.stat()
+                blobs.append((stat.st_mtime, stat.st_size, entry.path, entry.name))
+                total += stat.st_size
+            for mtime, size, path, name in sorted(blobs):
+                if total <= self.maxBytes:
+                    break
+                if name == keep:
+                    continue
+                with fileLock(self.lockPath(name)):
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+                total -= size
+
+    def open(self, fileID, chunks):
+        """Return a memory mapped, read only file for the blob."""
+        return self.use(fileID, chunks, SeafileBlobFile)
+
+
+class SeafileBlobFile(io.RawIOBase):
+    """Read only binary file served from a memory mapped blob.
+
+    Only getbuffer() and the buffer protocol (Python 3.12+) expose the
+    mapping without copying, e.g. numpy.frombuffer(file.getbuffer()).
+    read() and readinto() copy from the mapping like reads of a regular
+    file, though without a system call.
+    """
+
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        size = os.fstat(self.file.fileno()).st_size
+        if size:
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self.map = b''
+        self.pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def read(self, size=-1):
+        end = len(self.map) if size is None or size < 0 else self.pos + size
+        data = self.map[self.pos:end]
+        self.pos += len(data)
+        return data
+
+    def readinto(self, buffer):
+        data = memoryview(self.map)[self.pos:self.pos + len(buffer)]
+        buffer[:len(data)] = data
+        self.pos += len(data)
+        return len(data)
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self.pos
+        elif whence == io.SEEK_END:
+            offset += len(self.map)
+        self.pos = max(0, offset)
+        return self.pos
+
+    def tell(self):
+        return self.pos
+
+    def getbuffer(self):
+        return memoryview(self.map)
+
+    def __buffer__(self, flags):
+        return memoryview(self.map)
+
+    def close(self):
+        if not self.closed:
+            if isinstance(self.map, mmap.mmap):
+                try:
+                    self.map.close()
+                except BufferError:
+                    # exported buffers still in use, unmapped when released
+                    pass
+            self.file.close()
+        super().close()
+
+
+_blobCache = None
+_blobLock = threading.Lock()
+
+
+def getBlobCache():
+    global _blobCache
+    with _blobLock:
+        if _blobCache is None:
+            _blobCache = BlobCache()
+        return _blobCache
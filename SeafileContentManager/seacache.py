@@ -0,0 +1,377 @@
+#! python3
+# -*- coding: utf-8 -*-
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+def normPath(path):
+    """Return path with exactly one leading slash and no trailing slash."""
+    if not path:
+        return '/'
+    return '/' + path.strip('/')
+
+
+def headCheckInterval():
+    """Seconds between head commit checks, None if the mode is off."""
+    value = os.environ.get('SEAFILE_HEAD_CHECK_INTERVAL', '')
+    return float(value) if value else None
+
+
+def splitPath(path):
+    """Split normalized path into parent directory and name."""
+    path = normPath(path)
+    parent, name = path.rsplit('/', 1)
+    return (parent or '/', name)
+
+
+class LRUCache(object):
+    """Thread safe LRU cache with an optional time to live in seconds.
+
+    With maxBytes set, values have to support len() and the cache evicts
+    until their total length fits into the budget.
+    """
+
+    def __init__(self, maxItems=1024, ttl=None, maxBytes=None):
+        self.maxItems = maxItems
+        self.ttl = ttl
+        self.maxBytes = maxBytes
+        self.size = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _sizeOf(self, value):
+        return len(value) if self.maxBytes is not None else 0
+
+    def _remove(self, key):
+        stamp, value = self._data.pop(key)
+        self.size -= self._sizeOf(value)
+
+    def get(self, key, default=None):
+        """Return cached value or default if missing or expired."""
+        with self._lock:
+            try:
+                stamp, value = self._data[key]
+            except KeyError:
+                return default
+            if self.ttl is not None and time.monotonic() - stamp > self.ttl:
+                self._remove(key)
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        """Store value, evict least recently used entries if full."""
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = (time.monotonic(), value)
+            self.size += self._sizeOf(value)
+            while len(self._data) > self.maxItems or (
+                    self.maxBytes is not None and self.size > self.maxBytes):
+                self._remove(next(iter(self._data)))
+
+    def pop(self, key):
+        """Remove key if present."""
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+
+    def popPrefix(self, prefix):
+        """Remove all string keys starting with prefix."""
+        with self._lock:
+            for key in [x for x in self._data if x.startswith(prefix)]:
+                self._remove(key)
+
+    def keys(self):
+        """Return a list of the current keys, including expired ones."""
+        with self._lock:
+            return list(self._data)
+
+    def fits(self, size):
+        """Check if a value of this size may be cached at all."""
+        return self.maxBytes is None or size <= self.maxBytes // 8
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.size = 0
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def __len__(self):
+        return len(self._data)
+
+
+class LibraryCaches(object):
+    """Caches shared by all managers working on the same library.
+
+    dirs:
+        normalized dir path -> list of raw Seafile dirents
+    details:
+        normalized file path -> raw Seafile file detail
+    uploads:
+        normalized file path -> (content hash, file ID) of the last upload
+    contents:
+        file ID -> raw bytes, bounded by SEAFILE_CACHE_CONTENT_BYTES
+    history:
+        normalized file path -> checkpoint list
+    trees:
+        normalized dir path -> tree snapshot of everything below, see seatree
+
+    Listings, details and checkpoint lists expire after SEAFILE_CACHE_TTL
+    seconds. With SEAFILE_HEAD_CHECK_INTERVAL set, they do not expire and
+    are validated by the library's head commit instead, see validate().
+    Where that is not possible, listings are revalidated by folder IDs,
+    see revalidate().
+
+    store is an optional persistent MetadataStore backing the listings. It
+    implies validation by the head commit, by default every
+    SEAFILE_CACHE_TTL seconds.
+    """
+
+    def __init__(self, store=None):
+        ttl = float(os.environ.get('SEAFILE_CACHE_TTL', 10))
+        maxItems = int(os.environ.get('SEAFILE_CACHE_ITEMS', 2048))
+        self.store = store
+        self.headInterval = headCheckInterval()
+        if self.headInterval is None and store is not None:
+            self.headInterval = ttl
+        if self.headInterval is not None:
+            ttl = None
+        self.dirs = LRUCache(maxItems, ttl)
+        self.details = LRUCache(maxItems, ttl)
+        self.history = LRUCache(maxItems, ttl)
+        self.uploads = LRUCache(maxItems)
+        self.contents = LRUCache(
+            maxItems, None,
+            int(os.environ.get('SEAFILE_CACHE_CONTENT_BYTES', 64 * 2**20))
+            )
+        self.trees = LRUCache(16)
+        # incremented when tree snapshots need to be revalidated, see
+        # seatree.treeFor
+        self.treeEpoch = 0
+        self.head = None
+        self.headChecked = None
+        self.headLock = threading.Lock()
+        self.checking = False
+        # roots of the folder trees whose cached listings are current,
+        # None if all are, see revalidate
+        self.verified = None
+        self.verifyLock = threading.RLock()
+
+    def invalidate(self, path, recursive=False):
+        """Forget everything known about path and its parent listing."""
+        path = normPath(path)
+        parent = splitPath(path)[0]
+        self.dirs.pop(parent)
+        self.dirs.pop(path)
+        self.details.pop(path)
+        self.history.pop(path)
+        if recursive:
+            self.dirs.popPrefix(path + '/')
+            self.details.popPrefix(path + '/')
+            self.history.popPrefix(path + '/')
+        # trees containing path and, for moved or deleted folders, trees
+        # rooted below it
+        for root in self.trees.keys():
+            if root == '/' or path == root or path.startswith(root + '/') \
+                    or root.startswith(path.rstrip('/') + '/'):
+                self.trees.pop(root)
+        if self.store is not None:
+            self.store.invalidate(path, recursive)
+
+    def isVerified(self, path):
+        """Check if cached listings of path may be used."""
+        with self.verifyLock:
+            if self.verified is None:
+                return True
+            while True:
+                if path in self.verified:
+                    return True
+                if path == '/':
+                    return False
+                path = splitPath(path)[0]
+
+    def cachedListing(self, path):
+        files = self.dirs.get(path)
+        if files is None and self.store is not None:
+            files = self.store.listing(path)
+            if files is not None:
+                self.dirs.put(path, files)
+        return files
+
+    def listing(self, path):
+        """Return the cached listing of path, from the store if needed."""
+        if not self.isVerified(path):
+            return None
+        return self.cachedListing(path)
+
+    def putListing(self, path, files):
+        with self.verifyLock:
+            if not self.isVerified(path):
+                self.revalidate(path, files)
+            self.dirs.put(path, files)
+            if self.store is not None:
+                self.store.putListing(path, files)
+
+    def putTree(self, path, listings):
+        """Store the listings of a tree walked from path."""
+        with self.verifyLock:
+            self.dirs.pop(path)
+            self.dirs.popPrefix(path.rstrip('/') + '/')
+            if self.store is not None:
+                self.store.putListings(listings)
+            if self.verified is not None:
+                self.verified.add(path)
+
+    def forgetTree(self, path):
+        """Forget the cached listings of path and all folders below."""
+        self.dirs.pop(path)
+        self.dirs.popPrefix(path.rstrip('/') + '/')
+        if self.store is not None:
+            self.store.invalidateTree(path)
+
+    def revalidate(self, path, files):
+        """Check cached listings below path against its new listing files.
+
+        Seafile folder IDs are hashes over everything below a folder. So
+        the cached listings below subfolders with unchanged IDs are still
+        current, those below changed subfolders are dropped. Afterwards
+        all listings cached below path are current.
+        """
+        old = self.cachedListing(path)
+        if old is None:
+            self.forgetTree(path)
+        else:
+            ids = {x['name']: x.get('id') for x in files if x['type'] == 'dir'}
+            for entry in old:
+                if entry['type'] != 'dir':
+                    continue
+                if entry.get('id') is None or \
+                        ids.get(entry['name']) != entry.get('id'):
+                    self.forgetTree(
+                        path.rstrip('/') + '/' + entry['name']
+                        )
+        self.verified.add(path)
+        if path == '/':
+            self.verified = None
+
+    def unverify(self):
+        """Keep listings, but revalidate them by folder IDs before use."""
+        self.details.clear()
+        self.history.clear()
+        self.unverifyTrees()
+        with self.verifyLock:
+            self.verified = set()
+
+    def unverifyTrees(self):
+        """Keep tree snapshots, but revalidate them by folder IDs before use."""
+        with self.verifyLock:
+            self.treeEpoch += 1
+
+    def dropListings(self):
+        """Forget everything which is not keyed by immutable file IDs."""
+        self.dirs.clear()
+        self.details.clear()
+        self.history.clear()
+        self.trees.clear()
+        with self.verifyLock:
+            self.verified = None
+        if self.store is not None:
+            self.store.clear()
+
+    def validate(self, client, interval=None):
+        """Invalidate what changed since the last known head commit.
+
+        Checks the head commit of the client's library at most every
+        interval seconds, by default SEAFILE_HEAD_CHECK_INTERVAL, and does
+        nothing if neither is set. Changed paths are taken from the diffs
+        of the new commits. Where the head commit or the diffs are not
+        available, listings are kept but revalidated by folder IDs, see
+        revalidate. So the root folder is listed again after each check.
+        Without head checks configured, listings expire by their TTL and
+        only tree snapshots are revalidated, see unverifyTrees.
+        Contents are keyed by file ID and never need to be dropped.
+        Returns the head commit.
+        """
+        if interval is None:
+            interval = self.headInterval
+        if interval is None:
+            return self.head
+        with self.headLock:
+            now = time.monotonic()
+            if self.checking or (self.headChecked is not None and
+                                 now - self.headChecked < interval):
+                return self.head
+            self.headChecked = now
+            self.checking = True
+            if self.head is None and self.store is not None:
+                # listings stored before a restart belong to this commit
+                self.head = self.store.head()
+            known = self.head
+        # other threads use the caches as they are while the requests run
+        try:
+            head = client.headCommit()
+            if head is not None and head == known:
+                return head
+            changes = None
+            if head is not None and known is not None:
+                commits = client.commitsSince(known)
+                if commits is not None:
+                    changes = [client.commitChanges(x) for x in commits]
+            if changes is None or None in changes:
+                if self.headInterval is not None:
+                    self.unverify()
+                else:
+                    # listings expire by their TTL, only trees rely on this
+                    self.unverifyTrees()
+            else:
+                for change in changes:
+                    paths = [y for x, y in change.items() if x != 'renamed']
+                    paths = sum(paths, []) + sum(map(list, change['renamed']), [])
+                    for path in paths:
+                        self.invalidate(path, recursive=True)
+            with self.headLock:
+                self.head = head
+            if self.store is not None:
+                self.store.setHead(head)
+            return head
+        finally:
+            with self.headLock:
+                self.checking = False
+
+    def clear(self):
+        self.dropListings()
+        self.uploads.clear()
+        self.contents.clear()
+
+
+_libraryCaches = {}
+_registryLock = threading.Lock()
+
+
+def libraryKey(manager):
+    """Key per server, user and library for state shared between managers.
+
+    The token is part of the key, so users of a shared process never see
+    each others listings.
+    """
+    try:
+        token = manager.authHeader['Authorization']
+    except:
+        token = ''
+    return (manager.seafileURL, token, manager.libraryName)
+
+
+def cachesFor(manager):
+    """Return the caches for the library of a manager, created on first use."""
+    key = libraryKey(manager)
+    with _registryLock:
+        if key not in _libraryCaches:
+            from .seameta import MetadataStore, metadataStoreEnabled
+            store = MetadataStore(key) if metadataStoreEnabled() else None
+            _libraryCaches[key] = LibraryCaches(store)
+        return _libraryCaches[key]
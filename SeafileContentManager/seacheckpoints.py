@@ -4,7 +4,6 @@
 from datetime import datetime
 import os
 import sys
-import requests
 import json
 import nbformat
 
@@ -12,7 +11,11 @@ from tornado import web
 
 from notebook.services.contents.checkpoints import Checkpoints, GenericCheckpointsMixin
 
+from . import seahttp
+from .seacache import normPath
+from .seaclient import SeafileClient
 from .seafilemixin import getConnection
+from .seatrace import traced
 
 class SeafileCheckpoints(GenericCheckpointsMixin, Checkpoints):
     """
@@ -26,7 +29,7 @@ class SeafileCheckpoints(GenericCheckpointsMixin, Checkpoints):
 
     """
     def __init__(self, *args, **kwargs):
-        retVals = getConnection()
+        retVals = kwargs.pop('connection', None) or getConnection()
 
         self.seafileURL = retVals[0]
         self.authHeader = retVals[1]
@@ -34,6 +37,9 @@ class SeafileCheckpoints(GenericCheckpointsMixin, Checkpoints):
         self.libraryName = retVals[3]
         self.seafileMainVs = retVals[4]
         self.useLibToken = retVals[5]
+        # shares the library caches of the contents manager
+        self.client = SeafileClient()
+        self.client.setConnection(retVals)
 
     def baseURL(self, apiVersion='/api2'):
         """Create baseurl for selected api."""
@@ -42,7 +48,7 @@ class SeafileCheckpoints(GenericCheckpointsMixin, Checkpoints):
     def makeRequest(self, apiPath, apiVersion='/api2'):
         """Generate GET requests form."""
         url = self.baseURL(apiVersion) + apiPath
-        res = requests.get(url, headers=self.authHeader)
+        res = seahttp.get(url, headers=self.authHeader)
         return res
 
     def getRevision(self, checkpoint_id, path):
@@ -50,7 +56,9 @@ class SeafileCheckpoints(GenericCheckpointsMixin, Checkpoints):
         reqResult = self.makeRequest('/file/revision/?p={0}&commit_id={1}'.format(path, checkpoint_id))
         if reqResult.status_code in [400, 404]:
             raise web.HTTPError(reqResult.status_code, u"Cannot find checkpoint %s for path %s" % (checkpoint_id, path))
-        fileData = requests.get(reqResult.json())
+        fileData = seahttp.get(
+            reqResult.json(), user=seahttp.userKey(self.authHeader)
+            )
         fileData.encoding = fileData.apparent_encoding
         return fileData
 
@@ -87,6 +95,7 @@ class SeafileCheckpoints(GenericCheckpointsMixin, Checkpoints):
     # Seafile Commit history as checkpoints
     # ####
 
+    @traced
     def get_file_checkpoint(self, checkpoint_id, path):
         """Return file checkpoint."""
         data = self.getRevision(checkpoint_id, path)
@@ -94,6 +103,7 @@ class SeafileCheckpoints(GenericCheckpointsMixin, Checkpoints):
         ret = {'type': 'file', 'content': text, 'format': {'text', 'base64'}}
         return ret
 
+    @traced
     def get_notebook_checkpoint(self, checkpoint_id, path):
         """Return notebook checkpoint."""
         data = self.getRevision(checkpoint_id, path)
@@ -101,11 +111,16 @@ class SeafileCheckpoints(GenericCheckpointsMixin, Checkpoints):
         ret = {'type': 'notebook', 'content': nb}
         return ret
 
+    @traced
     def list_checkpoints(self, path):
         """Return list of checkpoint models for a given file."""
         ret = []
         if not path.startswith('/'):
             path = '/' + path
+        caches = self.client.caches
+        cached = caches.history.get(normPath(path))
+        if cached is not None:
+            return list(cached)
         reqResult = self.makeRequest(
             '/file/history/?path={0}'.format(path),
             apiVersion='/api/v2.1'
@@ -123,4 +138,5 @@ class SeafileCheckpoints(GenericCheckpointsMixin, Checkpoints):
                     'last_modified': datetime.strptime(timestamp, '%Y-%m-%dT%H:%M:%S%z')
                 }
             )
-        return ret
+        caches.history.put(normPath(path), ret)
+        return list(ret)
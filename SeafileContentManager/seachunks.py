@@ -0,0 +1,130 @@
+#! python3
+# -*- coding: utf-8 -*-
+import base64
+import os
+import tempfile
+import threading
+import time
+
+from . import seahttp
+from .seacache import libraryKey, normPath, splitPath
+from .seafilemixin import ensureBase
+from .seamultipart import MultipartStream
+
+PIECE_SIZE = int(os.environ.get('SEAFILE_UPLOAD_PIECE_BYTES', 8 * 2**20))
+STALE_AFTER = 3600
+
+
+class ChunkedUpload(object):
+    """Collect the chunks of a JupyterLab upload and send them to Seafile.
+
+    Decoded chunks are appended to a spool file on disk. JupyterLab does
+    not announce the total size, which Seafile's resumable upload needs
+    for every request, so the upload to Seafile starts with the last
+    chunk. It is then sent in pieces of SEAFILE_UPLOAD_PIECE_BYTES with
+    Content-Range headers, streamed from the spool file, see uploadFile.
+    Memory use stays at one chunk regardless of the file size.
+    """
+
+    def __init__(self, path):
+        self.path = normPath(path)
+        spoolDir = ensureBase() + 'uploads'
+        os.makedirs(spoolDir, mode=0o700, exist_ok=True)
+        self.spool = tempfile.NamedTemporaryFile(
+            dir=spoolDir, prefix='chunked-', delete=False
+            )
+        self.size = 0
+        self.touched = time.monotonic()
+
+    def append(self, content, format):
+        if format == 'base64':
+            data = base64.b64decode(content)
+        else:
+            data = content.encode('utf-8')
+        self.appendBytes(data)
+
+    def appendBytes(self, data):
+        self.spool.write(data)
+        self.size += len(data)
+        self.touched = time.monotonic()
+
+    def commit(self, manager):
+        """Upload the spooled file, return the last response."""
+        self.spool.flush()
+        try:
+            with open(self.spool.name, 'rb') as file:
+                return uploadFile(manager, self.path, file, self.size)
+        finally:
+            self.discard()
+
+    def discard(self):
+        self.spool.close()
+        try:
+            os.remove(self.spool.name)
+        except FileNotFoundError:
+            pass
+
+
+def uploadFile(manager, path, file, size):
+    """Upload size bytes from a binary file object, return the last response.
+
+    Files up to SEAFILE_UPLOAD_PIECE_BYTES are sent in one request, larger
+    ones in pieces with Content-Range headers. Bodies are streamed from
+    the file, see MultipartStream.
+    """
+    parent, name = splitPath(normPath(path))
+    parent = parent.rstrip('/') + '/'
+    if size <= PIECE_SIZE:
+        return manager.fileUpload(name, parent, file)
+    uploadLink = manager.makeRequest('/upload-link/').json()
+    start = 0
+    while start < size:
+        length = min(PIECE_SIZE, size - start)
+        end = start + length - 1
+        body = MultipartStream(
+            {'parent_dir': parent, 'replace': 1}, 'file', name, file, length
+            )
+        res = seahttp.post(
+            uploadLink,
+            data=body,
+            headers={
+                'Content-Type': body.contentType,
+                'Content-Range': 'bytes {0}-{1}/{2}'.format(start, end, size),
+                'Content-Disposition': 'attachment; filename="{0}"'.format(name)
+                },
+            user=seahttp.userKey(manager.authHeader),
+            priority=manager.requestPriority
+            )
+        if res.status_code != 200:
+            raise IOError('Upload of {0} failed at byte {1}: {2}'.format(
+                path, start, res.status_code
+                ))
+        start = end + 1
+    manager.caches.invalidate(path)
+    return res
+
+
+_uploads = {}
+_registryLock = threading.Lock()
+
+
+def chunkedUploadFor(manager, path, first=False):
+    """Return the chunked upload of a path, a new one for the first chunk."""
+    key = (libraryKey(manager), normPath(path))
+    with _registryLock:
+        now = time.monotonic()
+        for staleKey in [x for x, y in _uploads.items()
+                         if now - y.touched > STALE_AFTER]:
+            _uploads.pop(staleKey).discard()
+        if first:
+            if key in _uploads:
+                _uploads.pop(key).discard()
+            _uploads[key] = ChunkedUpload(path)
+        return _uploads.get(key)
+
+
+def finishChunkedUpload(manager, path):
+    """Remove the chunked upload of a path from the registry."""
+    key = (libraryKey(manager), normPath(path))
+    with _registryLock:
+        return _uploads.pop(key, None)
@@ -0,0 +1,1136 @@
+#! python3
+# -*- coding: utf-8 -*-
+
+from datetime import datetime
+import base64
+import errno
+import hashlib
+import json
+import os
+import time
+from urllib.parse import quote
+
+from . import seahttp
+from .seacache import cachesFor, normPath, splitPath
+from .seachunks import chunkedUploadFor, finishChunkedUpload
+from .seadebounce import debouncerFor
+from .seadirent import SeafileDirEntry, iterJSONArray
+from .seaindex import indexFor, searchIndexEnabled
+from .seamultipart import MultipartStream
+from .seaprefetch import prefetchEnabled, prefetcherFor
+from .seatrace import traced
+from .seawriteback import writeBackEnabled, writeBackFor
+
+
+class SeafileAPIError(IOError):
+    """Error of a Seafile operation with an HTTP like status code."""
+
+    def __init__(self, status_code=500, log_message=''):
+        super(SeafileAPIError, self).__init__(log_message)
+        self.status_code = status_code
+        self.log_message = log_message
+
+
+class SeafileClient(object):
+    """Seafile Web API client without dependencies on the Jupyter server.
+
+    Implements listings, downloads, uploads and the Jupyter like models of
+    files and folders on top of the Seafile Web API. The contents manager
+    adds the Jupyter server parts, SeafileFS and its file objects use it
+    directly and import fast. Subclasses provide a log attribute.
+    """
+    # set by the server extension in seahandlers
+    downloadBaseURL = '/seafile/download'
+    # priority class of requests in the shared scheduler
+    requestPriority = seahttp.INTERACTIVE
+    # raised for failed operations, tornado's HTTPError in the server
+    errorClass = SeafileAPIError
+
+    def setConnection(self, retVals):
+        """Store the connection tuple as returned by getConnection."""
+        self.connection = retVals
+        self.seafileURL = retVals[0]
+        self.authHeader = retVals[1]
+        self.libraryID = retVals[2]
+        self.libraryName = retVals[3]
+        self.seafileMainVs = retVals[4]
+        self.useLibToken = retVals[5]
+
+    def baseURL(self, apiVersion='/api2'):
+        """Allow to use both API versions."""
+        if self.seafileMainVs < 7 or self.useLibToken:
+            return self.seafileURL + apiVersion + '/repos/{0}'.format(self.libraryID)
+        else:
+            return self.seafileURL + '/api/v2.1/via-repo-token'
+
+    def makeRequest(self, apiPath, apiVersion='/api2', stream=False):
+        """Create GET requests form."""
+        url = self.baseURL(apiVersion) + apiPath
+        res = seahttp.get(
+            url, headers=self.authHeader, stream=stream,
+            priority=self.requestPriority
+            )
+        res.encoding = 'utf-8'
+        return res
+
+    def postRequest(self, apiPath, apiVersion="/api2", action=False, params=False):
+        """Generate post requests.
+
+        General POST request form, allows parameters and special 'actions', e.g
+        delete, rename ..
+        """
+        url = self.baseURL(apiVersion) + apiPath
+        data = {}
+        if action:
+            data = {'operation': action}
+        if params:
+            for parSet in params:
+                data[parSet[0]] = parSet[1]
+        if data != {}:
+            res = seahttp.post(
+                url, headers=self.authHeader, data=data,
+                priority=self.requestPriority
+                )
+        else:
+            res = seahttp.post(
+                url, headers=self.authHeader, priority=self.requestPriority
+                )
+        res.encoding = res.apparent_encoding
+        return res
+
+    def operateOnFile(self, filePath, action, apiVersion="/api2", params=False):
+        """Wrap file operations."""
+        res = self.postRequest(
+            apiPath='/file/?p={0}'.format(filePath),
+            action=action,
+            params=params
+        )
+        return res
+
+    def operateOnDir(self, dirPath, action, apiVersion="/api2", params=False):
+        """Wrap dir operations."""
+        res = self.postRequest(
+            apiPath='/dir/?p={0}'.format(dirPath), action=action, params=params
+            )
+        return res
+
+    @property
+    def caches(self):
+        """Listing and detail caches shared for this library.
+
+        Validated by the library's head commit first if
+        SEAFILE_HEAD_CHECK_INTERVAL is set, see LibraryCaches.validate.
+        """
+        caches = cachesFor(self)
+        caches.validate(self)
+        return caches
+
+    def openDirStream(self, path):
+        """Return iterator of dirent records parsed while they arrive.
+
+        Returns None if the folder does not exist.
+        """
+        path = normPath(path)
+        res = self.makeRequest('/dir/?p={0}'.format(path), stream=True)
+        if res.status_code == 404:
+            return None
+        elif res.status_code == 440:
+            raise ValueError('Folder is encrypted: {0}'.format(path))
+        elif res.status_code == 520:
+            raise ValueError('Operation failed.')
+        elif res.status_code != 200:
+            return None
+        return (
+            SeafileDirEntry.fromDict(path, x) for x in
+            iterJSONArray(res.iter_content(2**16), key='dirent_list')
+            )
+
+    def fetchDirEntries(self, path):
+        """Request dirent records of a folder, None if it does not exist."""
+        stream = self.openDirStream(path)
+        if stream is None:
+            return None
+        return list(stream)
+
+    def scandir(self, path):
+        """Iterate over dirent records of a folder.
+
+        Served from the listing cache if possible, otherwise records are
+        yielded while the response is parsed and cached at the end.
+        """
+        path = normPath(path)
+        files = self.caches.listing(path)
+        if files is not None:
+            for entry in files:
+                yield entry
+            return
+        stream = self.openDirStream(path)
+        if stream is None:
+            raise FileNotFoundError(
+                errno.ENOENT, os.strerror(errno.ENOENT), path
+                )
+        files = []
+        for entry in stream:
+            files.append(entry)
+            yield entry
+        self.caches.putListing(path, files)
+
+    def listDirEntries(self, path):
+        """Return raw dirents of a folder, served from cache if possible."""
+        path = normPath(path)
+        files = self.caches.listing(path)
+        if files is None:
+            files = self.fetchDirEntries(path)
+            if files is not None:
+                self.caches.putListing(path, files)
+        return files
+
+    def statPath(self, path, type=None):
+        """Return dirent of path, None if it does not exist.
+
+        Answered from a cached parent listing if there is one. Otherwise
+        the request for the expected type ('file' or 'dir') is made first,
+        so a path of that type costs a single request. Unlike the file
+        history this does not walk the commit history on the server.
+        """
+        path = normPath(path)
+        if path == '/':
+            return {'type': 'dir', 'name': ''}
+        parent, name = splitPath(path)
+        siblings = self.caches.listing(parent)
+        if siblings is not None:
+            for entry in siblings:
+                if entry['name'] == name:
+                    return entry
+            return None
+        if self.caches.listing(path) is not None:
+            return {'type': 'dir', 'name': name}
+        if type == 'dir' and self.listDirEntries(path) is not None:
+            return {'type': 'dir', 'name': name}
+        detail = self.getFileDetail(path)
+        if detail is not None:
+            return detail
+        if type != 'dir' and self.listDirEntries(path) is not None:
+            return {'type': 'dir', 'name': name}
+        return None
+
+    def getFileDetail(self, path):
+        """Return raw file detail, None if there is no such file."""
+        path = normPath(path)
+        detail = self.caches.details.get(path)
+        if detail is not None:
+            return detail
+        res = self.makeRequest('/file/detail/?p={0}'.format(path))
+        if res.status_code != 200:
+            return None
+        detail = res.json()
+        detail.setdefault('type', 'file')
+        self.caches.details.put(path, detail)
+        return detail
+
+    @traced
+    def exists_many(self, paths):
+        """Check existence of many paths.
+
+        Paths are grouped by parent directory and each group is resolved
+        with one listing. Returns a dict mapping each path to True or False.
+        """
+        groups = {}
+        for path in paths:
+            groups.setdefault(splitPath(path)[0], []).append(path)
+        ret = {}
+        for parent, members in groups.items():
+            files = self.listDirEntries(parent)
+            names = set(x['name'] for x in files) if files is not None else set()
+            for path in members:
+                if normPath(path) == '/':
+                    ret[path] = True
+                else:
+                    ret[path] = splitPath(path)[1] in names
+        return ret
+
+    def walkTree(self, path='/'):
+        """Iterate over dirent records of all files and folders below path.
+
+        Uses one recursive listing request, records are yielded while the
+        response is parsed. Raises FileNotFoundError if path is missing.
+        """
+        path = normPath(path)
+        res = self.makeRequest(
+            '/dir/?p={0}&recursive=1'.format(path), stream=True
+            )
+        if res.status_code != 200:
+            raise FileNotFoundError(
+                errno.ENOENT, os.strerror(errno.ENOENT), path
+                )
+        for raw in iterJSONArray(res.iter_content(2**16), key='dirent_list'):
+            yield SeafileDirEntry.fromDict(raw.get('parent_dir', path), raw)
+
+    def repoRequest(self, apiPath):
+        """GET request on the library endpoints of the v2.1 API.
+
+        Returns None for libraries accessed with a library token, which
+        has no access to these endpoints.
+        """
+        if not self.libraryID:
+            return None
+        url = self.seafileURL + '/api/v2.1/repos/{0}'.format(self.libraryID)
+        res = seahttp.get(
+            url + apiPath, headers=self.authHeader,
+            priority=self.requestPriority
+            )
+        if res.status_code != 200:
+            return None
+        return res
+
+    def headCommit(self):
+        """Return ID of the library's head commit, None if unavailable."""
+        res = self.repoRequest('/')
+        if res is None:
+            return None
+        return res.json().get('head_commit_id')
+
+    def commitsSince(self, commitID, maxCommits=100):
+        """Return IDs of the commits after commitID, newest first.
+
+        Returns None if commitID is not among the last maxCommits commits.
+        """
+        commits = []
+        page = 1
+        while len(commits) < maxCommits:
+            res = self.repoRequest(
+                '/history/?page={0}&per_page=25'.format(page)
+                )
+            if res is None:
+                return None
+            data = res.json()
+            for commit in data.get('data', []):
+                if commit['commit_id'] == commitID:
+                    return commits
+                commits.append(commit['commit_id'])
+            if not data.get('more'):
+                return None
+            page += 1
+        return None
+
+    def commitChanges(self, commitID):
+        """Return the paths changed by a commit.
+
+        The result maps added_files, deleted_files, modified_files,
+        added_dirs and deleted_dirs to lists of normalized paths, and
+        renamed to a list of (old, new) path pairs. None if unavailable.
+        """
+        if not self.libraryID:
+            return None
+        res = seahttp.get(
+            self.seafileURL + '/api2/repo_history_changes/{0}/?commit_id={1}'.format(
+                self.libraryID, commitID
+                ),
+            headers=self.authHeader, priority=self.requestPriority
+            )
+        if res.status_code != 200:
+            return None
+        data = res.json()
+        changes = {}
+        for key in ('added_files', 'deleted_files', 'modified_files',
+                    'added_dirs', 'deleted_dirs'):
+            changes[key] = [normPath(x) for x in data.get(key, [])]
+        # renames and moves are flat lists of old and new paths
+        moved = data.get('renamed_files', []) + data.get('moved_files', []) + \
+            data.get('renamed_dirs', []) + data.get('moved_dirs', [])
+        changes['renamed'] = [
+            (normPath(moved[x]), normPath(moved[x + 1]))
+            for x in range(0, len(moved) - 1, 2)
+            ]
+        return changes
+
+    def convertDataModel(self, path, inModel):
+        return SeafileDirEntry.fromDict(normPath(path), inModel).toModel()
+
+    def getDirModel(self, path, content=True):  # , format=True):
+        """Return dir model with folder content as models without content."""
+        files = self.listDirEntries(path)
+        if files is None:
+            raise self.errorClass(404, u'No such directory: {0}'.format(path))
+        if prefetchEnabled():
+            prefetcherFor(self).schedule(path, files)
+        if self.seafileMainVs >= 7 and not self.useLibToken:
+            dirDetail = {}
+        else:
+            dirDetail = self.makeRequest(
+                '/dir/detail/?path={0}'.format(path),
+                apiVersion='/api/v2.1'
+                ).json()
+        if content:
+            dirFormat = 'json'
+            try:
+                fileList = []
+                for entry in files:
+                    fileList.append(entry.toModel())
+                if self.writeBack is not None:
+                    listed = set(x['name'] for x in fileList)
+                    for pendingPath in self.writeBack.pendingIn(path):
+                        if pendingPath.split('/')[-1] not in listed:
+                            res = self.getPendingFileModel(pendingPath, False)
+                            if res['name'].endswith('.ipynb'):
+                                res['type'] = 'notebook'
+                            fileList.append(res)
+            # Empty folder have no content, list nothing...
+            except:
+                fileList = None
+        else:
+            fileList = None
+            dirFormat = None
+        try:
+            dirname = dirDetail['name']
+        except:
+            # feature JupyterLab
+            # in JupyterLab validateContentsModel requires keys to be either string or object, see
+            # https://github.com/jupyterlab/jupyterlab/blob/1aff4190084fd5993d3f7e3ae10b467264df1cd0/packages/services/src/contents/validate.ts#L36
+            dirname = ''
+        try:
+            dirdate = dirDetail['mtime']
+        except:
+            dirdate = datetime.now()
+        try:
+            dirsize = dirDetail['size']
+        except:
+            # feature JupyterLab
+            dirsize = ''
+
+        retDir = {
+            'content': fileList, 'format': dirFormat, 'mimetype': None,
+            'type': 'directory', 'name': dirname, 'writable': True,
+            'last_modified': datetime.now(), 'path': path,
+            'created': dirdate,
+            'size': dirsize
+            }
+        return retDir
+
+    def downloadFile(self, dlLink, fileID=None):
+        """Download raw bytes from a fileserver link.
+
+        Downloads of the same file ID running concurrently, e.g. many users
+        opening the same notebook of a shared library, are fetched once.
+        Every caller has requested its own download link before, so the
+        permission check of the Seafile API is still done per user.
+        """
+        def fetch():
+            res = seahttp.get(
+                dlLink, user=seahttp.userKey(self.authHeader),
+                priority=self.requestPriority
+                )
+            return res.content
+        if not fileID:
+            return fetch()
+        data = seahttp.fetches.do(('file', self.seafileURL, fileID), fetch)
+        if self.caches.contents.fits(len(data)):
+            self.caches.contents.put(fileID, data)
+        return data
+
+    def decodeContent(self, filePath, fileType, data):
+        """Convert raw file bytes to model content, format and mimetype."""
+        retFile = {}
+        mimeType = ('text/plain', None, 'application/octet-stream')
+        try:
+            if fileType in ['txt', 'md']:
+                retFile['format'] = 'text'
+                retFile['mimetype'] = mimeType[0]
+                fileData = data.decode('utf-8')
+            elif fileType == 'ipynb':
+                import nbformat
+                retFile['format'] = 'json'
+                retFile['mimetype'] = mimeType[1]
+                fileData = nbformat.from_dict(
+                    json.loads(data.decode('utf-8'))
+                    )
+            else:
+                retFile['format'] = 'base64'
+                retFile['mimetype'] = mimeType[2]
+                fileData = base64.b64encode(data).decode('ascii')
+            retFile['content'] = fileData
+        except:
+            raise self.errorClass(
+                404,
+                'Can not get data content: {0}.\n\
+                Got response {1}.'.format(
+                    filePath, data[:200])
+                )
+        return retFile
+
+    def streamFile(self, filePath, chunkSize=2**20):
+        """Return iterator over the raw bytes of a file."""
+        dlLink = self.makeRequest('/file/?p={0}'.format(filePath))
+        if dlLink.status_code != 200 or "error_msg" in dlLink.json():
+            raise self.errorClass(404, u'No such file: {0}'.format(filePath))
+        res = seahttp.get(
+            dlLink.json(), stream=True, user=seahttp.userKey(self.authHeader),
+            priority=self.requestPriority
+            )
+        return res.iter_content(chunkSize)
+
+    def zipTask(self, parentDir, dirents):
+        """Start zipping dirents of parentDir on the server, return the token."""
+        if not self.libraryID:
+            raise self.errorClass(
+                501, u'Zip downloads need the library ID, not a library token.'
+                )
+        url = self.seafileURL + '/api/v2.1/repos/{0}/zip-task/'.format(
+            self.libraryID
+            )
+        params = {'parent_dir': parentDir, 'dirents': dirents}
+        res = seahttp.get(
+            url, headers=self.authHeader, params=params,
+            priority=self.requestPriority
+            )
+        if res.status_code == 405:
+            # newer servers create zip tasks with POST
+            res = seahttp.post(
+                url, headers=self.authHeader, data=params,
+                priority=self.requestPriority
+                )
+        if res.status_code != 200:
+            raise self.errorClass(
+                res.status_code,
+                u'Cannot create zip task for {0}: {1}'.format(parentDir, res.text)
+                )
+        return res.json()['zip_token']
+
+    def waitZipTask(self, token):
+        """Poll a zip task until the archive is ready.
+
+        Gives up after SEAFILE_ZIP_TIMEOUT seconds (default 3600).
+        """
+        timeout = float(os.environ.get('SEAFILE_ZIP_TIMEOUT', 3600))
+        deadline = time.monotonic() + timeout
+        delay = 0.2
+        while True:
+            res = seahttp.get(
+                self.seafileURL + '/api/v2.1/query-zip-progress/',
+                headers=self.authHeader, params={'token': token},
+                priority=self.requestPriority
+                )
+            if res.status_code != 200:
+                raise self.errorClass(
+                    res.status_code, u'Zip task failed: {0}'.format(res.text)
+                    )
+            progress = res.json()
+            if progress.get('failed'):
+                raise self.errorClass(500, u'Zip task failed: {0}'.format(
+                    progress.get('failed_reason', '')
+                    ))
+            if progress.get('zipped', 0) >= progress.get('total', 0):
+                return
+            if time.monotonic() > deadline:
+                raise self.errorClass(504, u'Zip task timed out.')
+            time.sleep(delay)
+            delay = min(delay * 1.5, 2)
+
+    def streamZip(self, path, chunkSize=2**20):
+        """Return iterator over a zip archive of a folder, built server side.
+
+        Entries in the archive start with the folder name, for the library
+        root they are the top level entries. The fileserver is expected at
+        SEAFILE_URL/seafhttp unless SEAFILE_FILESERVER_URL is set.
+        """
+        path = normPath(path)
+        if path == '/':
+            parentDir = '/'
+            dirents = [x.name for x in self.scandir(path)]
+        else:
+            parentDir, name = splitPath(path)
+            dirents = [name]
+        token = self.zipTask(parentDir, dirents)
+        self.waitZipTask(token)
+        fileServer = os.environ.get(
+            'SEAFILE_FILESERVER_URL', self.seafileURL + '/seafhttp'
+            )
+        res = seahttp.get(
+            fileServer + '/zip/' + token, stream=True,
+            user=seahttp.userKey(self.authHeader),
+            priority=self.requestPriority
+            )
+        if res.status_code != 200:
+            raise self.errorClass(
+                res.status_code, u'Cannot download zip of {0}'.format(path)
+                )
+        return res.iter_content(chunkSize)
+
+    def streamBase64(self, filePath, chunkSize=3 * 2**20):
+        """Base64 encode a file while it is downloaded.
+
+        Chunks are encoded as they arrive, so the raw bytes are never held
+        in memory as a whole. Chunk boundaries are aligned to multiples of
+        three bytes to encode without padding in between.
+        """
+        parts = []
+        rest = b''
+        for chunk in self.streamFile(filePath, chunkSize):
+            chunk = rest + chunk
+            cut = len(chunk) - len(chunk) % 3
+            parts.append(base64.b64encode(chunk[:cut]).decode('ascii'))
+            rest = chunk[cut:]
+        parts.append(base64.b64encode(rest).decode('ascii'))
+        return ''.join(parts)
+
+    def getFileContent(self, filePath, fileType, content, fileID=None, fileSize=None):
+        """Get content of file.
+
+        Binary files are base64 encoded while streaming. Files larger than
+        SEAFILE_MAX_INLINE_BASE64 bytes are not inlined, their model has
+        empty content and a download_url to stream them instead.
+        """
+        retFile = {}
+        retFile['format'] = None
+        mimeType = ('text/plain', None, 'application/octet-stream')
+        if content is False:
+            retFile['content'] = None
+            if fileType in ['txt', 'md']:
+                retFile['mimetype'] = mimeType[0]
+            elif fileType == 'ipynb':
+                retFile['mimetype'] = mimeType[1]
+            else:
+                retFile['mimetype'] = mimeType[2]
+        elif fileType not in ['txt', 'md', 'ipynb'] and not (
+                fileID and fileID in self.caches.contents):
+            retFile['format'] = 'base64'
+            retFile['mimetype'] = mimeType[2]
+            maxInline = int(
+                os.environ.get('SEAFILE_MAX_INLINE_BASE64', 64 * 2**20)
+                )
+            if fileSize is not None and fileSize > maxInline:
+                retFile['content'] = ''
+                retFile['download_url'] = '{0}/{1}'.format(
+                    self.downloadBaseURL, quote(filePath.lstrip('/'))
+                    )
+            else:
+                retFile['content'] = self.streamBase64(filePath)
+        else:
+            data = self.caches.contents.get(fileID) if fileID else None
+            if data is None:
+                dlLink = self.makeRequest('/file/?p={0}'.format(filePath))
+                if "error_msg" not in dlLink.json():
+                    data = self.downloadFile(dlLink.json(), fileID)
+            if data is not None:
+                retFile.update(self.decodeContent(filePath, fileType, data))
+        return retFile
+
+    def getPendingFileModel(self, filePath, content=True):
+        """Return model of a save still waiting for upload, else None."""
+        local = None
+        if self.writeBack is not None:
+            local = self.writeBack.read(filePath)
+        if local is None and self.debouncer is not None:
+            local = self.debouncer.read(filePath)
+        if local is None:
+            return None
+        data, mtime = local
+        if isinstance(data, str):
+            # debounced saves hold the content as given to save
+            data = data.encode('utf-8')
+        name = filePath.split('/')[-1]
+        retFile = {
+            'path': filePath.lstrip('/'), 'type': 'file', 'name': name,
+            'created': datetime.fromtimestamp(mtime),
+            'last_modified': datetime.fromtimestamp(mtime),
+            'writable': True, 'size': len(data)
+            }
+        fileType = name.split('.')[-1]
+        if content is False:
+            retFile.update(self.getFileContent(filePath, fileType, False))
+        else:
+            retFile.update(self.decodeContent(filePath, fileType, data))
+        return retFile
+
+    def getFileModel(self, filePath, content=True):
+        """Return file model."""
+        pending = self.getPendingFileModel(filePath, content)
+        if pending is not None:
+            return pending
+        if content is False:
+            # the dirent of a cached or stored listing is enough
+            file = self.statPath(filePath)
+            if file is not None and file['type'] != 'file':
+                file = None
+        else:
+            file = self.getFileDetail(filePath)
+        if file is None:
+            raise self.errorClass(404, u'No such file: {0}'.format(filePath))
+
+        retFile = {}
+
+        retFile['path'] = filePath.lstrip('/')
+
+        try:
+            fileType = file['name'].split('.')[-1]
+        except:
+            fileType = ''
+
+        retFile['type'] = 'file'
+        try:
+            retFile['name'] = file['name']
+        except:
+            retFile['name'] = ''
+        try:
+            timestamp = ''.join(file['upload_time'].rsplit(':', 1))
+            retFile['created'] = datetime.strptime(
+                timestamp, '%Y-%m-%dT%H:%M:%S%z'
+                )
+        except:
+            retFile['created'] = datetime.now()
+        try:
+            retFile['last_modified'] = datetime.fromtimestamp(file['mtime'])
+        except:
+            retFile['last_modified'] = datetime.now()
+        try:
+            if file['permission'] == 'rw':
+                retFile['writable'] = True
+            else:
+                retFile['writable'] = False
+        except:
+            retFile['writable'] = True
+
+        retFile.update(
+            self.getFileContent(
+                filePath, fileType, content, file.get('id'), file.get('size')
+                )
+            )
+
+        return retFile
+
+    @traced
+    def dir_exists(self, path):
+        """Check if dir exists, uses cached listings where possible."""
+        entry = self.statPath(path, 'dir')
+        return entry is not None and entry['type'] == 'dir'
+
+    @traced
+    def file_exists(self, path):
+        """Check if file exists, uses cached listings where possible."""
+        if self.writeBack is not None and self.writeBack.isPending(path):
+            return True
+        entry = self.statPath(path, 'file')
+        return entry is not None and entry['type'] == 'file'
+
+    @traced
+    def get(self, path, content=True, type=None, format=None):
+        """Get model of folder or file."""
+        self.log.debug(
+            'Current GET for type {0} on {1} \
+            with format {2} and content {3}'.format(
+                type, path, format, content)
+                )
+        if not type:
+            try:
+                fileTrue = path.split('/')[-1].split('.')[1]
+            except:
+                fileTrue = ''
+            if fileTrue:
+                try:
+                    ret = self.getFileModel(path, content)
+                except:
+                    ret = self.getDirModel(path, content)
+            else:
+                try:
+                    ret = self.getDirModel(path, content)
+                except:
+                    ret = self.getFileModel(path, content)
+        else:
+            if type == "directory":
+                ret = self.getDirModel(path, content)
+            elif type in ("notebook", "file"):
+                ret = self.getFileModel(path, content)
+        return ret
+
+    def fileUpload(self, filename, filepath, modelContent, replace=True):
+        """Wrap uploads.
+
+        Wrapper for upload requests, first generates an upload link, then
+        posts file details and model content. The content may also be a
+        file object or an iterator of bytes, see streamUpload.
+        """
+        return self.streamUpload(filename, filepath, modelContent, replace)[0]
+
+    def streamUpload(self, filename, filepath, source, replace=True,
+                     size=None, checksums=()):
+        """Upload a file with a streamed multipart body.
+
+        source is bytes, str, a memoryview, a binary file object or an
+        iterator of bytes, size its length if it cannot be determined
+        otherwise. The body is sent in blocks without building it in
+        memory, see MultipartStream. Returns the response and a dict of
+        the checksums named in checksums, computed while uploading.
+        """
+        upload_link = self.makeRequest('/upload-link/').json()
+        body = MultipartStream(
+            {
+                'filename': filename,
+                'parent_dir': filepath,
+                'replace': 1 if replace else 0
+                },
+            'file', filename, source, size,
+            checksums=tuple(set(checksums) | {'sha1'})
+            )
+        try:
+            res = seahttp.post(upload_link,
+                               data=body,
+                               headers={'Content-Type': body.contentType},
+                               user=seahttp.userKey(self.authHeader),
+                               priority=self.requestPriority
+                               )
+        finally:
+            body.close()
+        self.caches.invalidate(filepath + filename)
+        self.log.debug('{0}:{1}'.format(res.status_code, res.text))
+        fileID = res.text.strip().strip('"')
+        if res.status_code == 200 and len(fileID) == 40 and body.digests:
+            # same as contentHash of the uploaded content
+            self.caches.uploads.put(
+                normPath(filepath + filename), (body.digests['sha1'], fileID)
+                )
+        return res, body.digests
+
+    def uploadMany(self, files, replace=True):
+        """Upload many small files with few requests.
+
+        files maps paths to contents, bytes or str, or is a list of such
+        pairs. Files of the same folder are sent together in multipart
+        requests of at most SEAFILE_UPLOAD_BATCH_FILES files (default 64)
+        and SEAFILE_UPLOAD_BATCH_BYTES bytes (default 16 MiB), a larger
+        file on its own. Returns a dict mapping each path to its result, a
+        dict with the status code and the name, ID and size reported by
+        Seafile, or the error message.
+        """
+        maxFiles = int(os.environ.get('SEAFILE_UPLOAD_BATCH_FILES', 64))
+        maxBytes = int(os.environ.get('SEAFILE_UPLOAD_BATCH_BYTES', 16 * 2**20))
+        if hasattr(files, 'items'):
+            files = files.items()
+        groups = {}
+        for path, content in files:
+            if isinstance(content, str):
+                content = content.encode('utf-8')
+            groups.setdefault(splitPath(path)[0], []).append(
+                (normPath(path), content)
+                )
+        results = {}
+        for parent, members in groups.items():
+            batch = []
+            size = 0
+            for path, content in members:
+                if batch and (len(batch) >= maxFiles or
+                              size + len(content) > maxBytes):
+                    results.update(self.uploadBatch(parent, batch, replace))
+                    batch = []
+                    size = 0
+                batch.append((path, content))
+                size += len(content)
+            if batch:
+                results.update(self.uploadBatch(parent, batch, replace))
+        return results
+
+    def uploadBatch(self, parent, batch, replace=True):
+        """Upload (path, bytes) pairs of one folder in one request."""
+        uploadLink = self.makeRequest('/upload-link/').json()
+        separator = '&' if '?' in uploadLink else '?'
+        res = seahttp.post(
+            uploadLink + separator + 'ret-json=1',
+            data={
+                'parent_dir': parent.rstrip('/') + '/',
+                'replace': 1 if replace else 0
+                },
+            files=[('file', (splitPath(x)[1], y)) for x, y in batch],
+            user=seahttp.userKey(self.authHeader),
+            priority=self.requestPriority
+            )
+        for path, content in batch:
+            self.caches.invalidate(path)
+        if res.status_code != 200:
+            self.log.debug('{0}:{1}'.format(res.status_code, res.text))
+            return {
+                x: {'status': res.status_code, 'error': res.text}
+                for x, y in batch
+                }
+        try:
+            # one record per file, in the order of the parts
+            returned = res.json()
+        except ValueError:
+            returned = []
+        if len(returned) != len(batch):
+            returned = [{} for x in batch]
+        results = {}
+        for (path, content), info in zip(batch, returned):
+            result = {'status': res.status_code}
+            result.update(info)
+            results[path] = result
+            if info.get('id') and info.get('name', splitPath(path)[1]) == splitPath(path)[1]:
+                self.caches.uploads.put(
+                    path, (self.contentHash(content), info['id'])
+                    )
+            if self.searchIndex is not None:
+                self.searchIndex.indexSave(path, content)
+        return results
+
+    def contentHash(self, modelContent):
+        if isinstance(modelContent, str):
+            modelContent = modelContent.encode('utf-8')
+        return hashlib.sha1(modelContent).hexdigest()
+
+    def isUnchanged(self, path, modelContent):
+        """Check if content equals the last upload and the file is untouched."""
+        last = self.caches.uploads.get(normPath(path))
+        if last is None or last[0] != self.contentHash(modelContent):
+            return False
+        entry = self.statPath(path)
+        return entry is not None and entry.get('id') == last[1]
+
+    @property
+    def writeBack(self):
+        """Write-back queue if SEAFILE_WRITE_BACK is set, else None."""
+        if not writeBackEnabled():
+            return None
+        return writeBackFor(self)
+
+    @property
+    def debouncer(self):
+        """Save debouncer if SEAFILE_SAVE_DEBOUNCE is set, else None."""
+        window = float(os.environ.get('SEAFILE_SAVE_DEBOUNCE', 0))
+        if window <= 0 or self.writeBack is not None:
+            return None
+        return debouncerFor(self, window)
+
+    @property
+    def searchIndex(self):
+        """Local search index if SEAFILE_SEARCH_INDEX is set, else None."""
+        if not searchIndexEnabled():
+            return None
+        return indexFor(self)
+
+    def uploadContent(self, filename, filepath, modelContent, replace=True):
+        """Upload content of a save.
+
+        Skipped if the content equals the last upload of the path, held
+        back by the debouncer or handed over to the write-back queue if
+        configured.
+        """
+        path = filepath + filename
+        pending = self.getPendingFileModel(path, content=False) is not None
+        if not pending and self.isUnchanged(path, modelContent):
+            self.log.debug('Skipping upload of unchanged %s', path)
+            return None
+        if self.searchIndex is not None:
+            self.searchIndex.indexSave(path, modelContent)
+        if self.writeBack is not None:
+            return self.writeBack.save(path, modelContent, replace)
+        if self.debouncer is not None:
+            return self.debouncer.submit(
+                path, modelContent,
+                lambda data: self.fileUpload(filename, filepath, data, replace)
+                )
+        return self.fileUpload(filename, filepath, modelContent, replace)
+
+    @traced
+    def save(self, model, path=""):
+        """Save needs upload calls to Seafile API."""
+        path = path.strip("/")
+
+        if "type" not in model:
+            raise self.errorClass(400, u'No file type provided.')
+        if 'content' not in model and model['type'] != 'directory':
+            raise self.errorClass(400, u'No file content provided.')
+
+        self.log.debug("Saving %s", path)
+        # self.log.debug("Got model: {0}".format(model))
+        type_ = model['type']
+
+        chunk = model.get('chunk', None)
+        if chunk is not None and type_ == 'file':
+            return self.saveChunk(model, path, chunk)
+
+        filename = path.split('/')[-1]
+        # Seafile expects the parent folder with a leading slash
+        filepath = splitPath(path)[0].rstrip('/') + '/'
+
+        try:
+            self.caches.invalidate(path)
+            if model['type'] == "directory":
+                self.operateOnDir('/' + path, 'mkdir')
+                if self.searchIndex is not None:
+                    self.searchIndex.put(path, 'dir')
+            elif model['type'] == "notebook":
+                if not self.file_exists('/' + path):
+                    if model['content'] == '':
+                        import nbformat
+                        self.uploadContent(
+                            filename, filepath,
+                            json.dumps(nbformat.v4.new_notebook()),
+                            replace=False
+                            )
+                    else:
+                        self.uploadContent(
+                            filename, filepath, json.dumps(model['content'])
+                            )
+                else:
+                    self.uploadContent(
+                        filename, filepath, json.dumps(model['content'])
+                        )
+            elif model['type'] == 'file':
+                fileContent = model['content']
+                if model.get('format') == 'base64':
+                    # JupyterLab uploads
+                    fileContent = base64.b64decode(fileContent)
+                if not self.file_exists('/' + path):
+                    if model['content'] == '':
+                        self.operateOnFile(
+                            filePath='/' + path, action='create'
+                            )
+                    else:
+                        # JupyterLab feature
+                        self.uploadContent(filename, filepath, fileContent)
+                else:
+                    self.uploadContent(filename, filepath, fileContent)
+        except (self.errorClass, seahttp.ThrottledError):
+            raise
+        except Exception as e:
+            self.log.error(
+                u'Error while saving file: %s %s', path, e, exc_info=True
+                )
+            raise self.errorClass(
+                500, u'Unexpected error while saving file: %s %s' % (path, e)
+                )
+        validation_message = self.validateModel(model)
+        model = self.get(path, content=False, type=type_)
+        if validation_message:
+            model['message'] = validation_message
+        model['format'] = None
+        model['content'] = None
+        return model
+
+    def validateModel(self, model):
+        """Validate a saved model, return a message for the user or None."""
+        return None
+
+    def saveChunk(self, model, path, chunk):
+        """Save one chunk of a JupyterLab upload.
+
+        Chunks are numbered from 1, the last one is -1. The file is
+        uploaded to Seafile when the last chunk arrives.
+        """
+        upload = chunkedUploadFor(self, path, first=(chunk == 1))
+        if upload is None:
+            raise self.errorClass(
+                400, u'No upload in progress for {0}'.format(path)
+                )
+        try:
+            upload.append(model['content'], model.get('format'))
+            if chunk == -1:
+                finishChunkedUpload(self, path)
+                upload.commit(self)
+        except Exception as e:
+            finishChunkedUpload(self, path)
+            upload.discard()
+            if isinstance(e, seahttp.ThrottledError):
+                raise
+            self.log.error(
+                u'Error while uploading file: %s %s', path, e, exc_info=True
+                )
+            raise self.errorClass(
+                500, u'Unexpected error while uploading file: %s %s' % (path, e)
+                )
+        if chunk == -1:
+            model = self.get(path, content=False, type='file')
+        else:
+            model = {
+                'content': None, 'format': None, 'mimetype': None,
+                'type': 'file', 'name': path.split('/')[-1],
+                'writable': True, 'last_modified': datetime.now(),
+                'path': path, 'created': datetime.now(), 'size': upload.size
+                }
+        return model
+
+    def deleteObject(self, path, type_):
+        """Wrap delete operations, generates DELETE requests."""
+        if path in ("/", ""):
+            raise self.errorClass(400, u'Cannot delete root folder.')
+        if type_ == 'dir':
+            url = self.baseURL() + '/dir/?p={0}'.format(path)
+        elif type_ == 'file':
+            url = self.baseURL() + '/file/?p={0}'.format(path)
+        res = seahttp.delete(
+            url, headers=self.authHeader, priority=self.requestPriority
+            )
+        self.caches.invalidate(path, recursive=True)
+        if self.searchIndex is not None and res.status_code == 200:
+            self.searchIndex.remove(path)
+        return res
+
+    @traced
+    def delete_file(self, path):
+        """Delete file or folder."""
+        if self.writeBack is not None:
+            self.writeBack.wait(path)
+        try:
+            fileTrue = path.split('/')[-1].split('.')[1]
+        except:
+            fileTrue = ''
+        if fileTrue:
+            try:
+                self.deleteObject(path, type_='file')
+            except seahttp.ThrottledError:
+                raise
+            except:
+                raise self.errorClass(404, u"Cannot delete file at %s" % path)
+        else:
+            try:
+                self.deleteObject(path, type_='dir')
+            except seahttp.ThrottledError:
+                raise
+            except:
+                raise self.errorClass(404, u"Cannot delete folder at %s" % path)
+
+    @traced
+    def rename_file(self, old_path, new_path):
+        """Rename file or folder."""
+        if new_path == old_path:
+            return
+        if self.writeBack is not None:
+            self.writeBack.wait(old_path)
+        if self.file_exists(new_path):
+            raise self.errorClass(
+                409, 'File aready exists: {0}'.format(new_path)
+                )
+
+        new_filename = new_path.split('/')[-1]
+        old_filename = old_path.split('/')[-1]
+
+        new_filepath = '/'.join(new_path.split('/')[:-1])
+        old_filepath = '/'.join(old_path.split('/')[:-1])
+
+        if new_filename != old_filename:
+            res = self.operateOnFile(
+                filePath='/' + old_path,
+                action='rename',
+                params=[['newname', new_filename]]
+                )
+        elif new_filepath != old_filepath and new_filename == old_filename:
+            res = self.operateOnFile(
+                filePath='/' + old_path,
+                action='move',
+                params=[
+                    ['dst_dir', new_filepath], ['dst_repo', self.libraryID]
+                    ]
+                )
+        else:
+            pass
+
+        self.caches.invalidate(old_path, recursive=True)
+        self.caches.invalidate(new_path)
+        if res.status_code in [200, 301, 404]:
+            if self.searchIndex is not None:
+                self.searchIndex.rename(old_path, new_path)
+            return
+        self.log.error('Error saving file {0} in path {1}'.format(
+            new_filename, new_path
+            ))
+        raise self.errorClass(500, 'Operation failed, returned {0}'.format(
+            res.status_code
+            ))
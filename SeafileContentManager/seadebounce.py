@@ -0,0 +1,138 @@
+#! python3
+# -*- coding: utf-8 -*-
+import atexit
+import logging
+import threading
+import time
+
+from . import seahttp
+from .seacache import libraryKey, normPath
+
+log = logging.getLogger(__name__)
+
+
+class SaveDebouncer(object):
+    """Fold bursts of saves to one path into a single upload.
+
+    The first save of a path is uploaded right away. Saves arriving
+    within the window after an upload are held back, only the newest one
+    is uploaded when the window has passed. Held back content can be read
+    with read() until it is uploaded.
+
+    A failed deferred upload keeps its content held back and is retried
+    with exponential backoff, starting at retryDelay seconds and capped
+    at maxRetryDelay. Saves of the path raise IOError while it fails, so
+    the user learns that the content is not on the server yet, their
+    content is still held back and retried.
+    """
+
+    def __init__(self, window, retryDelay=1, maxRetryDelay=60):
+        self.window = window
+        self.retryDelay = retryDelay
+        self.maxRetryDelay = maxRetryDelay
+        self.lastRun = {}
+        self.held = {}
+        self.timers = {}
+        self.failures = {}
+        self.lock = threading.Lock()
+        atexit.register(self.flush)
+
+    def submit(self, path, data, upload):
+        """Upload now or hold back. Returns True if the upload was deferred."""
+        path = normPath(path)
+        now = time.monotonic()
+        with self.lock:
+            failure = self.failures.get(path)
+            if path in self.timers:
+                self.held[path] = (data, time.time(), upload)
+                deferred = True
+            else:
+                last = self.lastRun.get(path)
+                if last is None or now - last >= self.window:
+                    self.lastRun[path] = now
+                    deferred = False
+                else:
+                    self.held[path] = (data, time.time(), upload)
+                    self.schedule(path, self.window - (now - last))
+                    deferred = True
+        if failure is not None:
+            raise IOError(
+                'Upload of {0} failed, the save is kept and retried: {1}'.format(
+                    path, failure[1]
+                    )
+                )
+        if not deferred:
+            upload(data)
+        return deferred
+
+    def schedule(self, path, delay):
+        """Start the timer uploading a held back path, called with the lock."""
+        timer = threading.Timer(delay, self.fire, args=(path,))
+        timer.daemon = True
+        self.timers[path] = timer
+        timer.start()
+
+    def fire(self, path):
+        with self.lock:
+            self.timers.pop(path, None)
+            held = self.held.get(path)
+            self.lastRun[path] = time.monotonic()
+        if held is None:
+            return
+        try:
+            with seahttp.priority(seahttp.BACKGROUND):
+                res = held[2](held[0])
+            status = getattr(res, 'status_code', 200)
+            if status != 200:
+                raise IOError('Upload returned {0}'.format(status))
+        except Exception as e:
+            with self.lock:
+                count = self.failures.get(path, (0, None))[0] + 1
+                self.failures[path] = (count, e)
+                delay = min(
+                    self.retryDelay * 2 ** (count - 1), self.maxRetryDelay
+                    )
+                if path not in self.timers:
+                    self.schedule(path, delay)
+            log.error(
+                'Deferred upload of %s failed, retrying in %.0f s: %s',
+                path, delay, e
+                )
+            return
+        with self.lock:
+            self.failures.pop(path, None)
+            if self.held.get(path) is held:
+                # not replaced by a save during the upload
+                del self.held[path]
+
+    def read(self, path):
+        """Return (data, time) of a held back save, None if there is none."""
+        with self.lock:
+            held = self.held.get(normPath(path))
+        if held is None:
+            return None
+        return held[:2]
+
+    def flush(self, path=None):
+        """Upload held back saves now."""
+        with self.lock:
+            paths = [normPath(path)] if path else list(self.timers)
+            for key in paths:
+                timer = self.timers.get(key)
+                if timer is not None:
+                    timer.cancel()
+        for key in paths:
+            self.fire(key)
+
+
+_debouncers = {}
+_registryLock = threading.Lock()
+
+
+def debouncerFor(manager, window):
+    """Return the save debouncer of the manager's library."""
+    key = libraryKey(manager)
+    with _registryLock:
+        if key not in _debouncers:
+            _debouncers[key] = SaveDebouncer(window)
+        return _debouncers[key]
@@ -0,0 +1,171 @@
+#! python3
+# -*- coding: utf-8 -*-
+import codecs
+import json
+from datetime import datetime
+
+_decoder = json.JSONDecoder()
+_skip = ' \t\r\n,'
+
+
+def iterJSONArray(chunks, key=None):
+    """Yield the elements of a JSON array while it is downloaded.
+
+    chunks is an iterable of bytes, e.g. response.iter_content(). The
+    array is either the whole document or, if key is given, the value of
+    that key in the top level object, a plain array is accepted in that
+    case as well. Only the current element and the unparsed rest of the
+    last chunk are held in memory.
+    """
+    utf8 = codecs.getincrementaldecoder('utf-8')()
+    chunks = iter(chunks)
+    state = {'buf': '', 'eof': False}
+
+    def more():
+        try:
+            state['buf'] += utf8.decode(next(chunks))
+        except StopIteration:
+            state['buf'] += utf8.decode(b'', final=True)
+            state['eof'] = True
+
+    # find the opening bracket
+    marker = '"{0}"'.format(key) if key else None
+    while True:
+        buf = state['buf']
+        if marker is None:
+            stripped = buf.lstrip()
+            if stripped:
+                if stripped[0] != '[':
+                    return
+                state['buf'] = stripped[1:]
+                break
+        elif buf.lstrip().startswith('['):
+            # plain array, e.g. older API versions
+            state['buf'] = buf.lstrip()[1:]
+            break
+        else:
+            found = buf.find(marker)
+            if found >= 0:
+                start = buf.find('[', found + len(marker))
+                if start >= 0:
+                    state['buf'] = buf[start + 1:]
+                    break
+        if state['eof']:
+            return
+        more()
+
+    pos = 0
+    while True:
+        buf = state['buf']
+        while pos < len(buf) and buf[pos] in _skip:
+            pos += 1
+        if pos < len(buf) and buf[pos] == ']':
+            return
+        if pos < len(buf):
+            try:
+                element, pos = _decoder.raw_decode(buf, pos)
+            except ValueError:
+                if state['eof']:
+                    raise
+            else:
+                yield element
+                continue
+        elif state['eof']:
+            raise ValueError('Unexpected end of JSON array')
+        state['buf'] = buf[pos:]
+        pos = 0
+        more()
+
+
+class SeafileDirEntry(object):
+    """Compact record of one Seafile dirent.
+
+    Derived values like the modification datetime or the Jupyter type are
+    computed on access. Supports item access for the raw keys name, type,
+    size, mtime, permission and id, so it can stand in for the raw dict.
+    """
+
+    __slots__ = ('parent', 'name', 'type', 'size', 'mtime', 'permission', 'id')
+
+    def __init__(self, parent, name, type, size=0, mtime=0, permission='r', id=None):
+        self.parent = parent
+        self.name = name
+        self.type = type
+        self.size = size
+        self.mtime = mtime
+        self.permission = permission
+        self.id = id
+
+    @classmethod
+    def fromDict(cls, parent, raw):
+        return cls(
+            parent, raw['name'], raw['type'], raw.get('size', 0),
+            raw.get('mtime', 0), raw.get('permission', 'r'), raw.get('id')
+            )
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except (AttributeError, TypeError):
+            raise KeyError(key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def keys(self):
+        return self.__slots__[1:]
+
+    def __repr__(self):
+        return 'SeafileDirEntry({0!r}, {1!r})'.format(self.path, self.type)
+
+    @property
+    def path(self):
+        return (self.parent.rstrip('/') + '/' + self.name).lstrip('/')
+
+    @property
+    def last_modified(self):
+        return datetime.fromtimestamp(self.mtime)
+
+    @property
+    def writable(self):
+        return self.permission == 'rw'
+
+    @property
+    def modelType(self):
+        """Type as used by Jupyter: notebook, file or directory."""
+        if self.type == 'dir':
+            return 'directory'
+        try:
+            if self.name.split('.')[1] == 'ipynb':
+                return 'notebook'
+        except IndexError:
+            pass
+        return 'file'
+
+    def is_dir(self):
+        return self.type == 'dir'
+
+    def is_file(self):
+        return self.type == 'file'
+
+    def toAttrib(self):
+        """Dict as returned by SeafileFS.listdir_attrib."""
+        res = {
+            'last_modified': self.last_modified, 'name': self.name,
+            'path': self.path, 'writeable': self.writable,
+            'type': self.modelType
+            }
+        if self.type == 'file':
+            res['size'] = self.size
+        return res
+
+    def toModel(self):
+        """Jupyter model without content."""
+        res = self.toAttrib()
+        res['format'] = None
+        res['mimetype'] = None
+        res['content'] = None
+        return res
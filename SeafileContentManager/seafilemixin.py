@@ -2,19 +2,25 @@
 # -*- coding: utf-8 -*-
 
 import os
-import requests
+import threading
+
+from . import seahttp
 
 BASE = os.path.expanduser("~") + os.path.sep + '.seafileCM' + os.path.sep
 
-try:
-    os.makedirs(BASE, mode=0o740, exist_ok=True)
-except:
-    raise print('Can not create settings dir. ')
+
+def ensureBase():
+    """Create the settings dir on first use and return its path."""
+    try:
+        os.makedirs(BASE, mode=0o740, exist_ok=True)
+    except OSError as e:
+        raise OSError('Can not create settings dir {0}: {1}'.format(BASE, e))
+    return BASE
 
 
 def checkToken(url, token):
     authHeader = {"Authorization": "Token {0}".format(token)}
-    res = requests.get(url + '/api2/auth/ping/', headers=authHeader)
+    res = seahttp.get(url + '/api2/auth/ping/', headers=authHeader)
     message = 'Wrong token {0}, cannot access API at {1}.'.format(
         token, url + '/api2')
     assert res.text == '"pong"', message
@@ -36,7 +42,7 @@ def checkNotEmpty(url, token):
 
 def getLibraryID(url, token, lib='notebooks'):
     authHeader = {"Authorization": "Token {0}".format(token)}
-    resLib = requests.get(url + '/api2/repos/', headers=authHeader)
+    resLib = seahttp.get(url + '/api2/repos/', headers=authHeader)
     idList = [x['id'] for x in resLib.json() if x['name'] == lib]
     try:
         # check if idList has one element = library ID exists
@@ -46,7 +52,7 @@ def getLibraryID(url, token, lib='notebooks'):
     except:
         # if not, create new library with name libraryName
         data = {'name': lib, 'desc': 'new library'}
-        createLib = requests.post(
+        createLib = seahttp.post(
             url + '/api2/repos/',
             headers=authHeader, data=data
             )
@@ -59,33 +65,77 @@ def getLibraryID(url, token, lib='notebooks'):
 
 
 def getSeafileVS(url):
-    vs = requests.get(url + '/api2/server-info').json()['version']
+    vs = seahttp.get(url + '/api2/server-info').json()['version']
     mainVs = int(vs.split('.')[0])
     return mainVs
 
 
-def getConnection():
-    """Read credentials for Seafile endpoint.
+_resolved = {}
+_resolving = seahttp.SingleFlight()
+_resolvedLock = threading.Lock()
 
-    Routines to establish the connection to the Seafile Instance,
-    check credentials, and retrieve the library ID.
+
+def resolveOnce(key, func, *args):
+    """Resolve bootstrap values once per process.
+
+    Concurrent callers asking for the same key share one request, later
+    callers get the stored value.
+    """
+    with _resolvedLock:
+        if key in _resolved:
+            return _resolved[key]
+    value = _resolving.do(key, lambda: func(*args))
+    with _resolvedLock:
+        _resolved[key] = value
+    return value
+
+
+def connect(seafileURL, token, libraryName, useLibToken=False):
+    """Resolve server version and library ID for given credentials.
+
+    Returns the connection tuple used by all managers.
+    """
+    authHeader = {"Authorization": "Token {0}".format(token)}
+    seafileVs = resolveOnce(('version', seafileURL), getSeafileVS, seafileURL)
+    if seafileVs < 7 or useLibToken == 'True':
+        resolveOnce(('token', seafileURL, token), checkToken, seafileURL, token)
+        libraryID = resolveOnce(
+            ('library', seafileURL, token, libraryName),
+            getLibraryID, seafileURL, token, libraryName
+            )
+    else:
+        libraryID = ''
+    return (seafileURL, authHeader, libraryID, libraryName, seafileVs, useLibToken)
+
+
+def listLibraries(url, token):
+    """Return the libraries accessible with an account token.
+
+    Records as returned by the Seafile API, with id, name, mtime,
+    permission, size and encrypted among others.
+    """
+    authHeader = {"Authorization": "Token {0}".format(token)}
+    res = seahttp.get(url + '/api2/repos/', headers=authHeader)
+    if res.status_code != 200:
+        raise IOError('Cannot list libraries, error code {0}'.format(
+            res.status_code
+            ))
+    return res.json()
+
+
+def readCredentials():
+    """Read URL, token and library name for the Seafile endpoint.
+
+    Taken from the settings file, or from the environment if the file is
+    missing or SEAFILE_CREDENTIALS_RESET is set. The last value tells if
+    they should be written to the settings file.
     """
-    useLibToken = os.environ.get('SEAFILE_USE_LIBRARY_TOKEN', False)
     resetCreds = os.environ.get('SEAFILE_CREDENTIALS_RESET', False)
     if resetCreds == 'True':
         seafileURL = os.environ.get('SEAFILE_URL', '')
         token = os.environ.get('SEAFILE_ACCESS_TOKEN', '')
         libraryName = os.environ.get('SEAFILE_LIBRARY', 'notebooks')
-        authHeader = {"Authorization": "Token {0}".format(token)}
-        seafileVs = getSeafileVS(seafileURL)
-        if seafileVs < 7 or useLibToken == 'True':
-            checkToken(seafileURL, token)
-            libraryID = getLibraryID(seafileURL, token, libraryName)
-        else:
-            libraryID = ''
-        with open(BASE + 'settings', 'w') as file:
-            file.write('{0},{1},{2}'.format(seafileURL, token, libraryName))
-        return (seafileURL, authHeader, libraryID, libraryName, seafileVs, useLibToken)
+        return seafileURL, token, libraryName, True
 
     try:
         libraryName = ''
@@ -100,18 +150,29 @@ def getConnection():
         elif len(parts) == 2:
             seafileURL, token = parts
         checkNotEmpty(seafileURL, token)
+        return seafileURL, token, libraryName, False
     except:
         seafileURL = os.environ.get('SEAFILE_URL', '')
         token = os.environ.get('SEAFILE_ACCESS_TOKEN', '')
         libraryName = os.environ.get('SEAFILE_LIBRARY', '')
         checkNotEmpty(seafileURL, token)
-        with open(BASE + 'settings', 'w') as file:
-            file.write('{0},{1},{2}'.format(seafileURL, token, libraryName))
-    authHeader = {"Authorization": "Token {0}".format(token)}
-    seafileVs = getSeafileVS(seafileURL)
-    if seafileVs < 7 or useLibToken == 'True':
-        checkToken(seafileURL, token)
-        libraryID = getLibraryID(seafileURL, token, libraryName)
-    else:
-        libraryID = ''
-    return (seafileURL, authHeader, libraryID, libraryName, seafileVs, useLibToken)
+        return seafileURL, token, libraryName, True
+
+
+def writeCredentials(seafileURL, token, libraryName):
+    with open(ensureBase() + 'settings', 'w') as file:
+        file.write('{0},{1},{2}'.format(seafileURL, token, libraryName))
+
+
+def getConnection():
+    """Read credentials for Seafile endpoint.
+
+    Routines to establish the connection to the Seafile Instance,
+    check credentials, and retrieve the library ID.
+    """
+    useLibToken = os.environ.get('SEAFILE_USE_LIBRARY_TOKEN', False)
+    seafileURL, token, libraryName, store = readCredentials()
+    retVals = connect(seafileURL, token, libraryName, useLibToken)
+    if store:
+        writeCredentials(seafileURL, token, libraryName)
+    return retVals
@@ -0,0 +1,344 @@
+#! python3
+# -*- coding: utf-8 -*-
+"""fsspec filesystem for Seafile libraries.
+
+Registered for the protocol seafile, paths start with the library name:
+
+    pd.read_parquet('seafile://notebooks/data/table.parquet')
+
+Requires fsspec, install with pip install SeafileContentManager[fsspec].
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from fsspec.spec import AbstractBufferedFile, AbstractFileSystem
+from fsspec.utils import other_paths
+
+from . import seahttp
+from .seachunks import ChunkedUpload, uploadFile
+from .seafilemixin import connect, getConnection
+
+
+class SeafileFileSystem(AbstractFileSystem):
+    """fsspec interface on top of SeafileFS.
+
+    Reads fetch byte ranges from the fileserver, so fsspec's block and
+    readahead caches apply. Writes are spooled to disk and uploaded in
+    pieces on close. cat, get and put on many paths run concurrently.
+    """
+
+    protocol = 'seafile'
+    root_marker = ''
+
+    def __init__(self, maxWorkers=8, connection=None, **kwargs):
+        super().__init__(**kwargs)
+        self.maxWorkers = maxWorkers
+        self.connection = connection or getConnection()
+        self.clients = {}
+        self.lock = threading.Lock()
+
+    @classmethod
+    def _strip_protocol(cls, path):
+        path = super()._strip_protocol(path)
+        return path.lstrip('/')
+
+    def splitLibrary(self, path):
+        path = self._strip_protocol(path)
+        library, _, rest = path.partition('/')
+        return library, '/' + rest
+
+    def client(self, library):
+        """Return SeafileFS for a library, connected on first use."""
+        from .seaopen import SeafileFS
+        with self.lock:
+            if library not in self.clients:
+                seafileURL, authHeader = self.connection[:2]
+                if library == self.connection[3]:
+                    connection = self.connection
+                else:
+                    connection = connect(
+                        seafileURL, seahttp.userKey(authHeader), library,
+                        self.connection[5]
+                        )
+                self.clients[library] = SeafileFS(connection=connection)
+            return self.clients[library]
+
+    def entryInfo(self, library, parent, entry):
+        name = '/'.join(
+            x for x in (library, parent.strip('/'), entry['name']) if x
+            )
+        if entry['type'] == 'dir':
+            return {'name': name, 'size': 0, 'type': 'directory',
+                    'mtime': entry.get('mtime')}
+        return {'name': name, 'size': entry.get('size', 0), 'type': 'file',
+                'mtime': entry.get('mtime'), 'id': entry.get('id')}
+
+    def ls(self, path, detail=True, **kwargs):
+        library, rest = self.splitLibrary(path)
+        if not library:
+            authHeader = self.connection[1]
+            repos = seahttp.get(
+                self.connection[0] + '/api2/repos/', headers=authHeader,
+                priority=seahttp.KERNEL
+                ).json()
+            entries = [{'name': x['name'], 'size': 0, 'type': 'directory',
+                        'mtime': x.get('mtime')} for x in repos]
+        else:
+            files = self.client(library).listDirEntries(rest)
+            if files is None:
+                raise FileNotFoundError(path)
+            entries = [self.entryInfo(library, rest, x) for x in files]
+        if detail:
+            return entries
+        return [x['name'] for x in entries]
+
+    def info(self, path, **kwargs):
+        library, rest = self.splitLibrary(path)
+        if not library or rest == '/':
+            return {'name': library, 'size': 0, 'type': 'directory'}
+        entry = self.client(library).statPath(rest)
+        if entry is None:
+            raise FileNotFoundError(path)
+        parent = rest.rsplit('/', 1)[0]
+        entry = dict(entry, name=entry.get('name') or rest.split('/')[-1])
+        return self.entryInfo(library, parent, entry)
+
+    def downloadLink(self, path):
+        library, rest = self.splitLibrary(path)
+        client = self.client(library)
+        res = client.makeRequest('/file/?p={0}&reuse=1'.format(rest))
+        if res.status_code != 200 or 'error_msg' in res.json():
+            raise FileNotFoundError(path)
+        return res.json(), seahttp.userKey(client.authHeader)
+
+    def fetchRange(self, path, start=None, end=None, link=None):
+        """Fetch bytes start to end (exclusive) of a file."""
+        link, user = link or self.downloadLink(path)
+        headers = {}
+        if start is not None or end is not None:
+            headers['Range'] = 'bytes={0}-{1}'.format(
+                start or 0, '' if end is None else end - 1
+                )
+        res = seahttp.get(
+            link, headers=headers, user=user, priority=seahttp.KERNEL
+            )
+        if res.status_code not in (200, 206):
+            raise IOError('Reading {0} returned {1}'.format(
+                path, res.status_code
+                ))
+        if res.status_code == 200 and headers:
+            # fileserver ignored the range
+            return res.content[start or 0:end]
+        return res.content
+
+    def cat_file(self, path, start=None, end=None, **kwargs):
+        if (start is not None and start < 0) or (end is not None and end < 0):
+            size = self.size(path)
+            start = size + start if start is not None and start < 0 else start
+            end = size + end if end is not None and end < 0 else end
+        return self.fetchRange(path, start, end)
+
+    def _open(self, path, mode='rb', block_size=None, autocommit=True,
+              cache_options=None, **kwargs):
+        return SeafileBufferedFile(
+            self, path, mode, block_size or 'default', autocommit,
+            cache_options=cache_options, **kwargs
+            )
+
+    def mkdir(self, path, create_parents=True, **kwargs):
+        library, rest = self.splitLibrary(path)
+        client = self.client(library)
+        parts = rest.strip('/').split('/')
+        targets = ['/' + '/'.join(parts[:x]) for x in range(1, len(parts) + 1)]
+        if not create_parents:
+            targets = targets[-1:]
+        for target in targets:
+            if not client.dir_exists(target):
+                client.operateOnDir(target, 'mkdir')
+                client.caches.invalidate(target)
+
+    def makedirs(self, path, exist_ok=False):
+        if not exist_ok and self.exists(path):
+            raise FileExistsError(path)
+        self.mkdir(path, create_parents=True)
+
+    def rm_file(self, path):
+        library, rest = self.splitLibrary(path)
+        self.client(library).deleteObject(rest, type_='file')
+
+    def _rm(self, path):
+        library, rest = self.splitLibrary(path)
+        if self.isdir(path):
+            self.client(library).deleteObject(rest, type_='dir')
+        else:
+            self.client(library).deleteObject(rest, type_='file')
+
+    def rm(self, path, recursive=False, maxdepth=None):
+        if recursive and isinstance(path, str) and self.isdir(path):
+            # Seafile removes folders with their content in one request
+            self._rm(path)
+            return
+        super().rm(path, recursive=recursive, maxdepth=maxdepth)
+
+    def runConcurrently(self, func, argList):
+        with ThreadPoolExecutor(self.maxWorkers) as pool:
+            futures = [pool.submit(func, *args) for args in argList]
+            return [x.result() for x in futures]
+
+    def cat(self, path, recursive=False, on_error='raise', **kwargs):
+        paths = self.expand_path(path, recursive=recursive)
+        if (len(paths) == 1 and not isinstance(path, list) and
+                paths[0] == self._strip_protocol(path)):
+            return self.cat_file(paths[0], **kwargs)
+        paths = [x for x in paths if not self.isdir(x)]
+
+        def fetch(target):
+            try:
+                return self.cat_file(target, **kwargs)
+            except Exception as e:
+                if on_error == 'raise':
+                    raise
+                return e
+        results = self.runConcurrently(fetch, [(x,) for x in paths])
+        return {
+            x: y for x, y in zip(paths, results)
+            if not (on_error == 'omit' and isinstance(y, Exception))
+            }
+
+    def get(self, rpath, lpath, recursive=False, maxdepth=None, **kwargs):
+        rpaths = self.expand_path(rpath, recursive=recursive, maxdepth=maxdepth)
+        if isinstance(lpath, list):
+            lpaths = lpath
+        else:
+            lpaths = other_paths(rpaths, lpath, exists=os.path.isdir(lpath))
+        files = []
+        for remote, local in zip(rpaths, lpaths):
+            if self.isdir(remote):
+                os.makedirs(local, exist_ok=True)
+            else:
+                files.append((remote, local))
+        self.runConcurrently(self.get_file, files)
+
+    def get_file(self, rpath, lpath, **kwargs):
+        if self.isdir(rpath):
+            os.makedirs(lpath, exist_ok=True)
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(lpath)), exist_ok=True)
+        library, rest = self.splitLibrary(rpath)
+        with open(lpath, 'wb') as file:
+            for chunk in self.client(library).streamFile(rest):
+                file.write(chunk)
+
+    def put(self, lpath, rpath, recursive=False, maxdepth=None, **kwargs):
+        from fsspec.implementations.local import LocalFileSystem, make_path_posix
+        local = LocalFileSystem()
+        lpaths = local.expand_path(
+            make_path_posix(lpath) if isinstance(lpath, str) else lpath,
+            recursive=recursive, maxdepth=maxdepth
+            )
+        if isinstance(rpath, list):
+            rpaths = rpath
+        else:
+            rpaths = other_paths(
+                lpaths, self._strip_protocol(rpath),
+                exists=isinstance(lpath, str) and self.isdir(rpath)
+                )
+        files = []
+        parents = set()
+        for source, target in zip(lpaths, rpaths):
+            if os.path.isdir(source):
+                parents.add(target)
+            else:
+                parents.add(self._parent(target))
+                files.append((source, target))
+        for parent in sorted(parents):
+            if self.splitLibrary(parent)[1] != '/':
+                self.mkdir(parent)
+        # small files are sent in batches per folder, read one batch at a time
+        batchBytes = int(os.environ.get('SEAFILE_UPLOAD_BATCH_BYTES', 16 * 2**20))
+        groups = {}
+        large = []
+        for source, target in files:
+            size = os.path.getsize(source)
+            if size <= batchBytes // 4:
+                groups.setdefault(self._parent(target), []).append(
+                    (source, target, size)
+                    )
+            else:
+                large.append((source, target))
+        batches = []
+        for members in groups.values():
+            batch = []
+            total = 0
+            for source, target, size in members:
+                if batch and total + size > batchBytes:
+                    batches.append((batch,))
+                    batch = []
+                    total = 0
+                batch.append((source, target))
+                total += size
+            batches.append((batch,))
+        self.runConcurrently(self.putBatch, batches)
+        self.runConcurrently(self.put_file, large)
+
+    def putBatch(self, batch):
+        """Upload local files into one remote folder with few requests."""
+        library = self.splitLibrary(batch[0][1])[0]
+        contents = []
+        for source, target in batch:
+            with open(source, 'rb') as file:
+                contents.append((self.splitLibrary(target)[1], file.read()))
+        results = self.client(library).uploadMany(contents)
+        failed = [x for x, y in results.items() if y['status'] != 200]
+        if failed:
+            raise IOError('Upload failed for {0}'.format(', '.join(failed)))
+
+    def put_file(self, lpath, rpath, **kwargs):
+        if os.path.isdir(lpath):
+            self.mkdir(rpath)
+            return
+        library, rest = self.splitLibrary(rpath)
+        with open(lpath, 'rb') as file:
+            uploadFile(
+                self.client(library), rest, file, os.fstat(file.fileno()).st_size
+                )
+
+    def modified(self, path):
+        mtime = self.info(path).get('mtime')
+        if mtime is None:
+            raise NotImplementedError
+        return datetime.fromtimestamp(mtime)
+
+
+class SeafileBufferedFile(AbstractBufferedFile):
+    """Buffered file with ranged reads and spooled uploads."""
+
+    def __init__(self, fs, path, mode='rb', block_size='default',
+                 autocommit=True, cache_type='readahead', cache_options=None,
+                 **kwargs):
+        self.link = None
+        super().__init__(
+            fs, path, mode, block_size, autocommit, cache_type=cache_type,
+            cache_options=cache_options, **kwargs
+            )
+
+    def _fetch_range(self, start, end):
+        if self.link is None:
+            self.link = self.fs.downloadLink(self.path)
+        return self.fs.fetchRange(self.path, start, end, self.link)
+
+    def _initiate_upload(self):
+        self.upload = ChunkedUpload(self.fs.splitLibrary(self.path)[1])
+
+    def _upload_chunk(self, final=False):
+        self.upload.appendBytes(self.buffer.getvalue())
+        if final:
+            library = self.fs.splitLibrary(self.path)[0]
+            self.upload.commit(self.fs.client(library))
+        return True
+
+    def discard(self):
+        if getattr(self, 'upload', None) is not None:
+            self.upload.discard()
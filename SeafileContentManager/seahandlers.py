@@ -0,0 +1,129 @@
+#! python3
+# -*- coding: utf-8 -*-
+"""Notebook server extension with Seafile specific handlers.
+
+Enable with
+
+    jupyter serverextension enable SeafileContentManager.seahandlers
+"""
+import json
+
+from tornado import web
+from tornado.ioloop import IOLoop
+
+from notebook.base.handlers import IPythonHandler
+from notebook.utils import url_path_join
+
+from .seaindex import indexFor
+from .seamanager import SeafileContentManager
+from .seamulti import SeafileMultiContentManager
+
+
+async def sendChunks(handler, chunks, name, contentType):
+    """Send chunks from a blocking iterator as attachment."""
+    loop = IOLoop.current()
+    handler.set_header('Content-Type', contentType)
+    handler.set_header(
+        'Content-Disposition', 'attachment; filename="{0}"'.format(name)
+        )
+    while True:
+        chunk = await loop.run_in_executor(None, next, chunks, None)
+        if chunk is None:
+            break
+        handler.write(chunk)
+        await handler.flush()
+
+
+def searchIndexes(cm):
+    """Return (path prefix, search index) pairs of the libraries of cm."""
+    if isinstance(cm, SeafileMultiContentManager):
+        return [(x + '/', indexFor(y)) for x, y in cm.libraryManagers()]
+    return [('', indexFor(cm))]
+
+
+def searchAll(indexes, query, limit, content):
+    """Search the indexes in turn, results are grouped by library."""
+    hits = []
+    for prefix, index in indexes:
+        for hit in index.search(query, limit - len(hits), content):
+            hit['path'] = prefix + hit['path']
+            hits.append(hit)
+        if len(hits) >= limit:
+            break
+    return hits
+
+
+class SeafileDownloadHandler(IPythonHandler):
+    """Stream a file from the Seafile fileserver in chunks."""
+
+    @web.authenticated
+    async def get(self, path):
+        cm = self.contents_manager
+        loop = IOLoop.current()
+        chunks = await loop.run_in_executor(None, cm.streamFile, '/' + path)
+        await sendChunks(
+            self, chunks, path.split('/')[-1], 'application/octet-stream'
+            )
+
+
+class SeafileZipHandler(IPythonHandler):
+    """Download a folder as zip archive, built by the Seafile server."""
+
+    @web.authenticated
+    async def get(self, path):
+        cm = self.contents_manager
+        loop = IOLoop.current()
+        chunks = await loop.run_in_executor(None, cm.streamZip, '/' + path)
+        name = path.rstrip('/').split('/')[-1] or cm.libraryName
+        await sendChunks(self, chunks, name + '.zip', 'application/zip')
+
+
+class SeafileSearchHandler(IPythonHandler):
+    """Search the library in the local search index.
+
+    GET /seafile/search?q=terms&limit=50&content=1 returns a JSON list of
+    matching entries. While the index is built for the first time, the
+    answer is 202 with {"status": "building"}, the client should retry.
+    The index is read in an executor, not on the IOLoop. With
+    SeafileMultiContentManager, all mounted libraries are searched.
+    """
+
+    @web.authenticated
+    async def get(self):
+        query = self.get_argument('q', '')
+        limit = int(self.get_argument('limit', 50))
+        content = self.get_argument('content', '1') not in ('0', 'false')
+        loop = IOLoop.current()
+        indexes = await loop.run_in_executor(
+            None, searchIndexes, self.contents_manager
+            )
+        for prefix, index in indexes:
+            index.scheduleRefresh()
+        self.set_header('Content-Type', 'application/json')
+        built = await loop.run_in_executor(
+            None, lambda: all(x.built for y, x in indexes)
+            )
+        if not built:
+            self.set_status(202)
+            self.finish(json.dumps({'status': 'building'}))
+            return
+        hits = await loop.run_in_executor(
+            None, searchAll, indexes, query, limit, content
+            )
+        for hit in hits:
+            hit['last_modified'] = hit['last_modified'].isoformat()
+        self.finish(json.dumps(hits))
+
+
+def load_jupyter_server_extension(nb_server_app):
+    web_app = nb_server_app.web_app
+    base_url = web_app.settings['base_url']
+    SeafileContentManager.downloadBaseURL = url_path_join(
+        base_url, 'seafile/download'
+        )
+    web_app.add_handlers('.*$', [
+        (url_path_join(base_url, r'/seafile/download/(.*)'),
+         SeafileDownloadHandler),
+        (url_path_join(base_url, r'/seafile/zip/(.*)'), SeafileZipHandler),
+        (url_path_join(base_url, r'/seafile/search'), SeafileSearchHandler),
+        ])
@@ -0,0 +1,418 @@
+#! python3
+# -*- coding: utf-8 -*-
+import contextvars
+import os
+import random
+import threading
+import time
+import weakref
+from collections import deque
+from contextlib import ExitStack, contextmanager
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+
+from . import seatrace
+from .seatransport import createTransport
+
+MAX_PER_USER = int(os.environ.get('SEAFILE_MAX_REQUESTS_PER_USER', 8))
+MAX_PER_HOST = int(os.environ.get('SEAFILE_MAX_REQUESTS_PER_HOST', 16))
+MAX_RETRIES = int(os.environ.get('SEAFILE_MAX_RETRIES', 4))
+# longest Retry-After in seconds waited for before giving up
+MAX_RETRY_AFTER = float(os.environ.get('SEAFILE_MAX_RETRY_AFTER', 60))
+# requests slower than this factor times the lowest latency do not grow
+# the concurrency of a host
+LATENCY_FACTOR = float(os.environ.get('SEAFILE_LATENCY_FACTOR', 2))
+THROTTLED = (429, 503)
+
+# priority classes, lower values are served first
+INTERACTIVE = 0
+KERNEL = 1
+BACKGROUND = 2
+
+_priority = contextvars.ContextVar('seafilePriority', default=None)
+
+
+@contextmanager
+def priority(level):
+    """Run requests made in this context with the given priority class.
+
+    Overrides the priority passed by the caller, used by background
+    threads like prefetching and write-back.
+    """
+    token = _priority.set(level)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class Scheduler(object):
+    """Limit concurrent requests to a host, serving waiters by priority.
+
+    Free slots go to waiting requests by weighted round robin over the
+    priority classes, so interactive requests overtake queued background
+    work while background work still advances slowly.
+
+    The number of slots adapts to the server (AIMD): it is halved when
+    the server throttles a request sent after the last decrease, and grows
+    by one slot per window of successful requests, up to maxLimit, as long
+    as their latency stays within LATENCY_FACTOR of the lowest recently
+    observed latency. Retry-After of throttled responses pauses new
+    requests to the host.
+    """
+
+    def __init__(self, limit, weights=(8, 4, 1)):
+        self.maxLimit = limit
+        self.limit = float(limit)
+        self.weights = weights
+        self.credits = list(weights)
+        self.active = 0
+        self.queues = [deque() for x in weights]
+        self.lock = threading.Lock()
+        self.minLatency = None
+        self.lastDecrease = 0.0
+        self.pausedUntil = 0.0
+
+    @property
+    def slots(self):
+        return max(1, int(self.limit))
+
+    def acquire(self, level):
+        delay = self.pausedUntil - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        with self.lock:
+            if self.active < self.slots and not any(self.queues):
+                self.active += 1
+                return
+            event = threading.Event()
+            self.queues[level].append(event)
+        event.wait()
+
+    def release(self):
+        with self.lock:
+            waiter = None
+            if self.active <= self.slots:
+                waiter = self.nextWaiter()
+            if waiter is None:
+                self.active -= 1
+            else:
+                # hand the slot over
+                waiter.set()
+
+    def nextWaiter(self):
+        waiting = [x for x in range(len(self.queues)) if self.queues[x]]
+        if not waiting:
+            return None
+        for level in waiting:
+            if self.credits[level] > 0:
+                self.credits[level] -= 1
+                return self.queues[level].popleft()
+        self.credits = list(self.weights)
+        self.credits[waiting[0]] -= 1
+        return self.queues[waiting[0]].popleft()
+
+    def wakeWaiters(self):
+        while self.active < self.slots:
+            waiter = self.nextWaiter()
+            if waiter is None:
+                return
+            self.active += 1
+            waiter.set()
+
+    def throttled(self, started, retryAfter=None):
+        """Shrink the limit after a throttled request started at started."""
+        with self.lock:
+            now = time.monotonic()
+            if started >= self.lastDecrease:
+                self.limit = max(1.0, self.limit / 2)
+                self.lastDecrease = now
+            if retryAfter:
+                self.pausedUntil = max(self.pausedUntil, now + retryAfter)
+
+    def succeeded(self, latency):
+        """Grow the limit after a request answered within latency seconds."""
+        with self.lock:
+            if self.minLatency is None:
+                self.minLatency = latency
+            else:
+                # slowly forget old minima, the server load changes
+                self.minLatency = min(latency, self.minLatency * 1.01)
+            if self.limit >= self.maxLimit:
+                return
+            if latency <= LATENCY_FACTOR * self.minLatency:
+                self.limit = min(self.maxLimit, self.limit + 1 / self.limit)
+                self.wakeWaiters()
+
+    @contextmanager
+    def slot(self, level):
+        self.acquire(level)
+        try:
+            yield
+        finally:
+            self.release()
+
+
+_schedulers = {}
+
+_sessions = {}
+_limits = {}
+_limitValues = {}
+_lock = threading.Lock()
+
+
+def userKey(headers):
+    """Return the token of an auth header, used to key pools and limits."""
+    try:
+        return headers['Authorization'].split(' ', 1)[1]
+    except:
+        return 'anonymous'
+
+
+def getSession(key):
+    """Return the pooled transport of a user, created on first use.
+
+    The transport is chosen by SEAFILE_HTTP_TRANSPORT, see seatransport.
+    """
+    with _lock:
+        if key not in _sessions:
+            _sessions[key] = createTransport(MAX_PER_USER)
+            _limits[key] = threading.BoundedSemaphore(MAX_PER_USER)
+        return _sessions[key]
+
+
+def setUserLimit(key, maxRequests):
+    """Change the number of concurrent requests allowed for a user."""
+    getSession(key)
+    with _lock:
+        if _limitValues.get(key) != maxRequests:
+            _limitValues[key] = maxRequests
+            _limits[key] = threading.BoundedSemaphore(maxRequests)
+
+
+def getLimit(key):
+    """Return the semaphore bounding concurrent requests of a user."""
+    getSession(key)
+    return _limits[key]
+
+
+def dropUser(key):
+    """Close the pool of a user, e.g. after logout."""
+    with _lock:
+        session = _sessions.pop(key, None)
+        _limits.pop(key, None)
+        _limitValues.pop(key, None)
+    if session is not None:
+        session.close()
+
+
+def getScheduler(host):
+    with _lock:
+        if host not in _schedulers:
+            _schedulers[host] = Scheduler(MAX_PER_HOST)
+        return _schedulers[host]
+
+
+class ThrottledError(IOError):
+    """A request was still throttled by the server after all retries."""
+
+    def __init__(self, status_code, url):
+        self.status_code = status_code
+        self.log_message = 'Seafile server is busy ({0}): {1}'.format(
+            status_code, seatrace.redact(url)
+            )
+        super(ThrottledError, self).__init__(self.log_message)
+
+
+def retryAfter(res, attempt):
+    """Return seconds to wait before retrying a throttled response.
+
+    Uses the Retry-After header, given in seconds or as date, otherwise
+    exponential backoff with jitter. None if the wait is too long.
+    """
+    value = res.headers.get('Retry-After')
+    delay = None
+    if value:
+        try:
+            delay = float(value)
+        except ValueError:
+            try:
+                date = parsedate_to_datetime(value)
+                delay = date.timestamp() - time.time()
+            except (TypeError, ValueError):
+                delay = None
+    if delay is None:
+        delay = min(MAX_RETRY_AFTER, 0.5 * 2 ** attempt) * random.uniform(0.5, 1)
+    delay = max(0.0, delay)
+    return delay if delay <= MAX_RETRY_AFTER else None
+
+
+class StreamedResponse(object):
+    """Response of a streamed request, holding its slot until it is read.
+
+    The body of a streamed response is transferred while it is consumed,
+    so the host slot and the user limit are released only when the body
+    was read, the response is closed or garbage collected.
+    """
+
+    def __init__(self, response, release):
+        self.response = response
+        self.release = weakref.finalize(self, release)
+
+    def __getattr__(self, name):
+        return getattr(self.response, name)
+
+    def iter_content(self, *args, **kwargs):
+        try:
+            for chunk in self.response.iter_content(*args, **kwargs):
+                yield chunk
+        finally:
+            self.release()
+
+    @property
+    def content(self):
+        try:
+            return self.response.content
+        finally:
+            self.release()
+
+    @property
+    def text(self):
+        try:
+            return self.response.text
+        finally:
+            self.release()
+
+    def json(self, **kwargs):
+        try:
+            return self.response.json(**kwargs)
+        finally:
+            self.release()
+
+    def close(self):
+        try:
+            self.response.close()
+        finally:
+            self.release()
+
+
+def replayable(kwargs):
+    """Return True if the request body can be sent a second time."""
+    data = kwargs.get('data')
+    if data is not None and not isinstance(data, (bytes, str, dict, list, tuple)):
+        # streamed bodies, see seamultipart.MultipartStream
+        return getattr(data, 'rewindable', False)
+    files = kwargs.get('files') or {}
+    # a dict of field names to files, or a list of (field name, file) pairs
+    values = files.values() if hasattr(files, 'values') else [x[1] for x in files]
+    for value in values:
+        content = value[1] if isinstance(value, tuple) else value
+        if not isinstance(content, (bytes, str)):
+            return False
+    return True
+
+
+def request(method, url, headers=None, user=None, priority=INTERACTIVE, **kwargs):
+    """Send request over the pooled session of the user.
+
+    The user is derived from the Authorization header unless given,
+    fileserver links carry no header and should pass the user explicitly.
+    Requests wait for a slot of the host scheduler in their priority
+    class, then for the concurrency limit of the user. Each request is
+    recorded as span of the current operation, see seatrace.
+
+    With stream=True the slot and the limit are held until the body is
+    consumed or the response is closed, see StreamedResponse. Avoid
+    requests while iterating a streamed body, they may wait for the slot
+    held by it.
+
+    Throttled requests (429, 503) shrink the concurrency of the host and
+    are retried up to SEAFILE_MAX_RETRIES times, honoring Retry-After.
+    Raises ThrottledError if the server still throttles or the body
+    cannot be sent again.
+    """
+    key = user or userKey(headers)
+    level = _priority.get()
+    if level is None:
+        level = priority
+    scheduler = getScheduler(urlparse(url).netloc)
+    attempt = 0
+    while True:
+        with seatrace.span(method, 'http', url=seatrace.redact(url)) as current:
+            with ExitStack() as held:
+                held.enter_context(scheduler.slot(level))
+                held.enter_context(getLimit(key))
+                started = time.monotonic()
+                if current is not None:
+                    current.attributes['queued_ms'] = round(
+                        (time.perf_counter() - current.start) * 1000, 1
+                        )
+                res = getSession(key).request(
+                    method, url, headers=headers, **kwargs
+                    )
+                if kwargs.get('stream') and res.status_code not in THROTTLED:
+                    # released by the response once its body is read
+                    res = StreamedResponse(res, held.pop_all().close)
+            if current is not None:
+                current.attributes['status'] = res.status_code
+        if res.status_code not in THROTTLED:
+            scheduler.succeeded(time.monotonic() - started)
+            return res
+        delay = retryAfter(res, attempt)
+        scheduler.throttled(started, delay)
+        res.close()
+        if attempt >= MAX_RETRIES or delay is None or not replayable(kwargs):
+            raise ThrottledError(res.status_code, url)
+        attempt += 1
+        time.sleep(delay)
+        if hasattr(kwargs.get('data'), 'rewind'):
+            kwargs['data'].rewind()
+
+
+def get(url, **kwargs):
+    return request('GET', url, **kwargs)
+
+
+def post(url, **kwargs):
+    return request('POST', url, **kwargs)
+
+
+def delete(url, **kwargs):
+    return request('DELETE', url, **kwargs)
+
+
+class SingleFlight(object):
+    """Deduplicate concurrent calls with the same key.
+
+    The first caller runs the function, callers arriving while it runs
+    wait and receive the same result (or exception).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, func):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = {'event': threading.Event()}
+        if not leader:
+            call['event'].wait()
+            if 'error' in call:
+                raise call['error']
+            return call['result']
+        try:
+            call['result'] = func()
+            return call['result']
+        except Exception as e:
+            call['error'] = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call['event'].set()
+
+
+fetches = SingleFlight()
@@ -0,0 +1,483 @@
+#! python3
+# -*- coding: utf-8 -*-
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+from . import seahttp
+from .seacache import libraryKey, normPath, splitPath
+from .seafilemixin import ensureBase
+
+log = logging.getLogger(__name__)
+
+TEXT_TYPES = ('ipynb', 'md', 'txt', 'py', 'rst', 'tex', 'json', 'csv')
+
+
+def searchIndexEnabled():
+    return os.environ.get('SEAFILE_SEARCH_INDEX', False) == 'True'
+
+
+def extractText(name, data):
+    """Return the searchable text of a file, notebooks by cell sources."""
+    if isinstance(data, bytes):
+        data = data.decode('utf-8', errors='replace')
+    if name.endswith('.ipynb'):
+        try:
+            notebook = json.loads(data)
+        except ValueError:
+            return ''
+        sources = []
+        for cell in notebook.get('cells', []):
+            source = cell.get('source', '')
+            if isinstance(source, list):
+                source = ''.join(source)
+            sources.append(source)
+        return '\n'.join(sources)
+    return data
+
+
+def ftsQuery(query):
+    """Quote the terms of a user query as FTS5 prefix queries."""
+    return ' '.join(
+        '"{0}"*'.format(x.replace('"', '""')) for x in query.split()
+        )
+
+
+class SearchIndex(object):
+    """Local SQLite index over names, paths and text content of a library.
+
+    Text files and notebook cell sources up to SEAFILE_SEARCH_CONTENT_BYTES
+    are indexed with FTS5, where SQLite lacks FTS5 only names and paths
+    are searched with LIKE. Queries never touch the Seafile API.
+
+    Names and paths are indexed from one recursive listing on first use,
+    see ensureBuilt, built tells if that happened. Text content of new and
+    changed files is downloaded afterwards by a background thread with
+    BACKGROUND priority, the files waiting for it are kept in the pending
+    table. Saves, deletes and renames of the manager update the index
+    directly. Changes made elsewhere are picked up at most every
+    SEAFILE_SEARCH_REFRESH seconds by replaying the library commits since
+    the last indexed head commit, falling back to a new listing if they
+    are not available.
+    """
+
+    def __init__(self, manager, path=None):
+        self.manager = manager
+        if path is None:
+            indexDir = ensureBase() + 'index'
+            os.makedirs(indexDir, mode=0o700, exist_ok=True)
+            key = hashlib.sha1(
+                '|'.join(libraryKey(manager)).encode()
+                ).hexdigest()
+            path = os.path.join(indexDir, key + '.sqlite')
+        self.path = path
+        self.maxContent = int(
+            os.environ.get('SEAFILE_SEARCH_CONTENT_BYTES', 2**20)
+            )
+        self.interval = float(os.environ.get('SEAFILE_SEARCH_REFRESH', 60))
+        self.rankLimit = int(os.environ.get('SEAFILE_SEARCH_RANK_LIMIT', 5000))
+        self.lastRefresh = None
+        self.refreshing = False
+        self.fetching = False
+        self.lock = threading.RLock()
+        # held while refreshing, so the index is not built twice at once
+        self.refreshLock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.fts = self.createTables()
+
+    def createTables(self):
+        """Create tables if missing, return True if FTS5 is available."""
+        with self.lock, self.db:
+            self.db.execute(
+                'CREATE TABLE IF NOT EXISTS files (rowid INTEGER PRIMARY KEY, '
+                'path TEXT UNIQUE, type TEXT, id TEXT, size INTEGER, '
+                'mtime INTEGER)'
+                )
+            self.db.execute(
+                'CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)'
+                )
+            self.db.execute(
+                'CREATE TABLE IF NOT EXISTS pending (path TEXT PRIMARY KEY, id TEXT)'
+                )
+            try:
+                self.db.execute(
+                    'CREATE VIRTUAL TABLE IF NOT EXISTS entries '
+                    'USING fts5(path, name, body)'
+                    )
+                return True
+            except sqlite3.OperationalError:
+                self.db.execute(
+                    'CREATE TABLE IF NOT EXISTS entries '
+                    '(rowid INTEGER PRIMARY KEY, path TEXT, name TEXT, body TEXT)'
+                    )
+                return False
+
+    def getMeta(self, key):
+        with self.lock:
+            row = self.db.execute(
+                'SELECT value FROM meta WHERE key = ?', (key,)
+                ).fetchone()
+        return row[0] if row else None
+
+    def setMeta(self, key, value):
+        with self.lock, self.db:
+            self.db.execute(
+                'INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)',
+                (key, value)
+                )
+
+    def storedID(self, path):
+        with self.lock:
+            row = self.db.execute(
+                'SELECT id FROM files WHERE path = ?', (path,)
+                ).fetchone()
+        return row[0] if row else None
+
+    def put(self, path, type_, fileID=None, size=0, mtime=0, body=None):
+        """Add or replace the entry of path, keep old text if body is None."""
+        path = normPath(path)
+        name = splitPath(path)[1]
+        with self.lock, self.db:
+            if body is not None:
+                self.db.execute('DELETE FROM pending WHERE path = ?', (path,))
+            row = self.db.execute(
+                'SELECT rowid FROM files WHERE path = ?', (path,)
+                ).fetchone()
+            if row is not None:
+                if body is None:
+                    old = self.db.execute(
+                        'SELECT body FROM entries WHERE rowid = ?', row
+                        ).fetchone()
+                    body = old[0] if old else ''
+                self.db.execute('DELETE FROM entries WHERE rowid = ?', row)
+                self.db.execute('DELETE FROM files WHERE rowid = ?', row)
+            cursor = self.db.execute(
+                'INSERT INTO files (path, type, id, size, mtime) '
+                'VALUES (?, ?, ?, ?, ?)',
+                (path, type_, fileID, size, mtime)
+                )
+            self.db.execute(
+                'INSERT INTO entries (rowid, path, name, body) VALUES (?, ?, ?, ?)',
+                (cursor.lastrowid, path, name, body or '')
+                )
+
+    def remove(self, path, recursive=True):
+        """Remove path and, for folders, everything below it."""
+        path = normPath(path)
+        with self.lock, self.db:
+            if recursive:
+                rows = self.db.execute(
+                    'SELECT rowid FROM files WHERE path = ? OR '
+                    'substr(path, 1, ?) = ?',
+                    (path, len(path) + 1, path.rstrip('/') + '/')
+                    ).fetchall()
+            else:
+                rows = self.db.execute(
+                    'SELECT rowid FROM files WHERE path = ?', (path,)
+                    ).fetchall()
+            self.db.executemany(
+                'DELETE FROM pending WHERE path = '
+                '(SELECT path FROM files WHERE rowid = ?)', rows
+                )
+            self.db.executemany('DELETE FROM entries WHERE rowid = ?', rows)
+            self.db.executemany('DELETE FROM files WHERE rowid = ?', rows)
+
+    def rename(self, old, new):
+        """Move entries below old to new, keeping their text."""
+        old, new = normPath(old), normPath(new)
+        with self.lock:
+            rows = self.db.execute(
+                'SELECT f.path, f.type, f.id, f.size, f.mtime, e.body '
+                'FROM files f JOIN entries e ON e.rowid = f.rowid '
+                'WHERE f.path = ? OR substr(f.path, 1, ?) = ?',
+                (old, len(old) + 1, old.rstrip('/') + '/')
+                ).fetchall()
+            pending = self.db.execute(
+                'SELECT path, id FROM pending WHERE path = ? OR '
+                'substr(path, 1, ?) = ?',
+                (old, len(old) + 1, old.rstrip('/') + '/')
+                ).fetchall()
+            self.remove(old)
+            for path, type_, fileID, size, mtime, body in rows:
+                self.put(new + path[len(old):], type_, fileID, size, mtime, body)
+            with self.db:
+                self.db.executemany(
+                    'INSERT OR REPLACE INTO pending (path, id) VALUES (?, ?)',
+                    [(new + x[len(old):], y) for x, y in pending]
+                    )
+
+    def indexSave(self, path, content):
+        """Update the entry of a file saved through the manager."""
+        name = splitPath(path)[1]
+        body = None
+        if name.split('.')[-1] in TEXT_TYPES and len(content) <= self.maxContent:
+            body = extractText(name, content)
+        self.put(path, 'file', None, len(content), int(time.time()), body)
+
+    def indexEntry(self, entry):
+        """Index a dirent record, queue its text content if it changed."""
+        path = normPath(entry.path)
+        if entry['id'] and entry['id'] == self.storedID(path):
+            return
+        if entry['type'] == 'dir':
+            self.put(path, 'dir', entry['id'], 0, entry['mtime'], '')
+            return
+        if entry['name'].split('.')[-1] not in TEXT_TYPES or \
+                (entry['size'] or 0) > self.maxContent:
+            self.put(path, 'file', entry['id'], entry['size'], entry['mtime'], '')
+            return
+        # the old text is kept until the new one is downloaded
+        self.put(path, 'file', entry['id'], entry['size'], entry['mtime'])
+        with self.lock, self.db:
+            self.db.execute(
+                'INSERT OR REPLACE INTO pending (path, id) VALUES (?, ?)',
+                (path, entry['id'])
+                )
+
+    def fetchContentLater(self):
+        """Download pending text content in a background thread."""
+        with self.lock:
+            if self.fetching:
+                return
+            self.fetching = True
+        worker = threading.Thread(
+            target=self.runFetch, name='seafile-index-content', daemon=True
+            )
+        worker.start()
+
+    def runFetch(self):
+        try:
+            with seahttp.priority(seahttp.BACKGROUND):
+                self.fetchContent()
+        except Exception as e:
+            log.warning('Indexing content failed: %s', e)
+        finally:
+            with self.lock:
+                self.fetching = False
+
+    def fetchContent(self):
+        """Download and index the text of all pending files."""
+        failed = set()
+        while True:
+            with self.lock:
+                rows = self.db.execute(
+                    'SELECT path, id FROM pending'
+                    ).fetchall()
+            rows = [x for x in rows if x not in failed]
+            if not rows:
+                return
+            for path, fileID in rows:
+                try:
+                    data = b''.join(self.manager.streamFile(path))
+                except Exception as e:
+                    log.debug('Cannot index content of %s: %s', path, e)
+                    failed.add((path, fileID))
+                    continue
+                body = extractText(splitPath(path)[1], data)
+                with self.lock, self.db:
+                    # skip files changed, moved or removed meanwhile
+                    done = self.db.execute(
+                        'DELETE FROM pending WHERE path = ? AND id IS ?',
+                        (path, fileID)
+                        ).rowcount
+                    row = self.db.execute(
+                        'SELECT rowid FROM files WHERE path = ?', (path,)
+                        ).fetchone()
+                    if done and row is not None:
+                        self.db.execute(
+                            'UPDATE entries SET body = ? WHERE rowid = ?',
+                            (body, row[0])
+                            )
+
+    def rebuild(self):
+        """Index the whole library from one recursive listing."""
+        seen = set()
+        # read the listing first, a streamed body holds its request slot
+        for entry in list(self.manager.walkTree('/')):
+            seen.add(normPath(entry.path))
+            self.indexEntry(entry)
+        with self.lock:
+            stale = [x for (x,) in self.db.execute('SELECT path FROM files')
+                     if x not in seen]
+        for path in stale:
+            self.remove(path, recursive=False)
+
+    def reindexPath(self, path):
+        """Index path and, for folders, everything below it."""
+        self.remove(path)
+        entry = self.manager.statPath(path)
+        if entry is None:
+            return
+        if entry['type'] == 'dir':
+            self.put(path, 'dir', None, 0, entry.get('mtime', 0), '')
+            for child in list(self.manager.walkTree(path)):
+                self.indexEntry(child)
+        else:
+            parent, name = splitPath(path)
+            for child in self.manager.listDirEntries(parent) or []:
+                if child['name'] == name:
+                    self.indexEntry(child)
+
+    def applyChanges(self, changes):
+        for path in changes['deleted_files'] + changes['deleted_dirs']:
+            self.remove(path)
+        for old, new in changes['renamed']:
+            self.rename(old, new)
+        for path in changes['added_dirs'] + changes['added_files'] + \
+                changes['modified_files']:
+            self.manager.caches.invalidate(path)
+            self.reindexPath(path)
+
+    def refresh(self):
+        """Bring the index up to date with the library's head commit.
+
+        Names and paths are indexed when this returns, text content is
+        downloaded in the background, see fetchContentLater.
+        """
+        try:
+            self.refreshEntries()
+        finally:
+            self.fetchContentLater()
+
+    def refreshEntries(self):
+        stored = self.getMeta('head')
+        head = self.manager.headCommit()
+        if head is not None and head == stored:
+            return
+        commits = None
+        if head is not None and stored is not None:
+            commits = self.manager.commitsSince(stored)
+        if commits is None:
+            self.rebuild()
+        else:
+            for commitID in reversed(commits):
+                changes = self.manager.commitChanges(commitID)
+                if changes is None:
+                    self.rebuild()
+                    break
+                self.applyChanges(changes)
+        if head is not None:
+            self.setMeta('head', head)
+        self.setMeta('built', '1')
+
+    @property
+    def built(self):
+        """True once the index was built, it may be outdated though."""
+        return self.getMeta('built') is not None or \
+            self.getMeta('head') is not None
+
+    def ensureBuilt(self):
+        """Index names and paths in this thread if never done before.
+
+        Returns without waiting for the text content, which is indexed in
+        the background.
+        """
+        if self.built:
+            return
+        with self.refreshLock:
+            if not self.built:
+                self.refresh()
+
+    def scheduleRefresh(self):
+        """Refresh in a background thread if the interval has passed."""
+        with self.lock:
+            now = time.monotonic()
+            if self.refreshing or (self.lastRefresh is not None and
+                                   now - self.lastRefresh < self.interval):
+                return
+            self.refreshing = True
+            self.lastRefresh = now
+        worker = threading.Thread(
+            target=self.runRefresh, name='seafile-index', daemon=True
+            )
+        worker.start()
+
+    def runRefresh(self):
+        try:
+            with self.refreshLock, seahttp.priority(seahttp.BACKGROUND):
+                self.refresh()
+        except Exception as e:
+            log.warning('Refreshing search index failed: %s', e)
+        finally:
+            with self.lock:
+                self.refreshing = False
+
+    def search(self, query, limit=50, content=True):
+        """Return entries matching all terms of query, best matches first.
+
+        Terms match prefixes of words in names, paths and, with content
+        True, the indexed text. Results are dicts with path, name, type,
+        size, last_modified and, with FTS5, a snippet of the match.
+        Ranking costs time per match, so queries with more than
+        SEAFILE_SEARCH_RANK_LIMIT matches return unranked matches.
+        """
+        if not query.strip():
+            return []
+        if self.fts:
+            match = ftsQuery(query)
+            if not content:
+                match = '{path name} : (' + match + ')'
+            with self.lock:
+                matches = len(self.db.execute(
+                    'SELECT rowid FROM entries WHERE entries MATCH ? LIMIT ?',
+                    (match, self.rankLimit + 1)
+                    ).fetchall())
+            order = 'ORDER BY bm25(entries, 2.0, 5.0, 1.0) ' \
+                if matches <= self.rankLimit else ''
+            sql = (
+                'SELECT f.path, e.name, f.type, f.size, f.mtime, '
+                "snippet(entries, -1, '[', ']', '...', 8) "
+                'FROM entries e JOIN files f ON f.rowid = e.rowid '
+                'WHERE entries MATCH ? ' + order + 'LIMIT ?'
+                )
+            params = (match, limit)
+        else:
+            terms = query.split()
+            columns = "(e.path || ' ' || e.name{0})".format(
+                " || ' ' || e.body" if content else ''
+                )
+            sql = (
+                'SELECT f.path, e.name, f.type, f.size, f.mtime, NULL '
+                'FROM entries e JOIN files f ON f.rowid = e.rowid WHERE ' +
+                ' AND '.join(columns + ' LIKE ?' for x in terms) + ' LIMIT ?'
+                )
+            params = tuple('%' + x + '%' for x in terms) + (limit,)
+        with self.lock:
+            rows = self.db.execute(sql, params).fetchall()
+        res = []
+        for path, name, type_, size, mtime, snippet in rows:
+            hit = {
+                'path': path.lstrip('/'), 'name': name,
+                'type': 'directory' if type_ == 'dir' else (
+                    'notebook' if name.endswith('.ipynb') else 'file'),
+                'last_modified': datetime.fromtimestamp(mtime or 0)
+                }
+            if type_ == 'file':
+                hit['size'] = size
+            if snippet is not None:
+                hit['snippet'] = snippet
+            res.append(hit)
+        return res
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+
+_indexes = {}
+_registryLock = threading.Lock()
+
+
+def indexFor(manager):
+    """Return the search index of the manager's library."""
+    key = libraryKey(manager)
+    with _registryLock:
+        if key not in _indexes:
+            _indexes[key] = SearchIndex(manager)
+        return _indexes[key]
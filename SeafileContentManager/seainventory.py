@@ -0,0 +1,179 @@
+#! python3
+# -*- coding: utf-8 -*-
+import errno
+import os
+from array import array
+
+from .seacache import normPath
+from .seadirent import iterJSONArray
+
+
+class Inventory(object):
+    """Sizes, mtimes and types of all entries below a folder, as columns.
+
+    entries is a NumPy structured array with the fields name (object),
+    dir (int32 index into dirs), ext (int32 index into extensions, the
+    lower case file extension without dot), isdir (bool), size and mtime
+    (int64, seconds) and id (S40). Folder paths and extensions are stored
+    once each, so the table stays compact for millions of entries.
+    """
+
+    def __init__(self, root, entries, dirs, extensions):
+        self.root = root
+        self.entries = entries
+        self.dirs = dirs
+        self.extensions = extensions
+
+    def __len__(self):
+        return len(self.entries)
+
+    def paths(self):
+        """Return an object array with the full path of every entry."""
+        import numpy
+        prefixes = numpy.array(
+            [x.rstrip('/') + '/' for x in self.dirs], dtype=object
+            )
+        return prefixes[self.entries['dir']] + self.entries['name']
+
+    def aggregate(self, keys, labels):
+        import numpy
+        files = ~self.entries['isdir']
+        counts = numpy.bincount(keys, weights=files, minlength=len(labels))
+        sizes = numpy.bincount(
+            keys, weights=numpy.where(files, self.entries['size'], 0),
+            minlength=len(labels)
+            )
+        result = numpy.empty(
+            len(labels),
+            dtype=[('key', object), ('files', 'i8'), ('size', 'i8')]
+            )
+        result['key'] = labels
+        result['files'] = counts
+        result['size'] = sizes
+        used = result[result['files'] > 0]
+        return used[numpy.argsort(-used['size'], kind='stable')]
+
+    def sizeByDirectory(self, depth=None):
+        """Return total size and number of files per folder, largest first.
+
+        With depth None, files count for the folder they are in. With a
+        depth, they count for their ancestor depth levels below the root
+        of the inventory, files in the levels above for that folder.
+        Returns a structured array with the fields key, files and size.
+        """
+        import numpy
+        if depth is None:
+            return self.aggregate(self.entries['dir'], self.dirs)
+        rootDepth = 0 if self.root == '/' else self.root.count('/')
+        ancestors = {}
+        mapping = numpy.empty(len(self.dirs), dtype='i4')
+        for number, folder in enumerate(self.dirs):
+            parts = folder.split('/')[1:] if folder != '/' else []
+            ancestor = '/' + '/'.join(parts[:rootDepth + depth])
+            mapping[number] = ancestors.setdefault(ancestor, len(ancestors))
+        labels = numpy.empty(len(ancestors), dtype=object)
+        for ancestor, number in ancestors.items():
+            labels[number] = ancestor
+        return self.aggregate(mapping[self.entries['dir']], labels)
+
+    def sizeByExtension(self):
+        """Return total size and number of files per extension, largest first.
+
+        Returns a structured array with the fields key, files and size.
+        """
+        return self.aggregate(self.entries['ext'], self.extensions)
+
+    def toArrow(self):
+        """Return the entries as pyarrow Table, with dictionary encoding."""
+        import pyarrow
+        entries = self.entries
+        return pyarrow.table({
+            'dir': pyarrow.DictionaryArray.from_arrays(
+                pyarrow.array(entries['dir']), pyarrow.array(list(self.dirs))
+                ),
+            'name': pyarrow.array(entries['name'], type=pyarrow.string()),
+            'ext': pyarrow.DictionaryArray.from_arrays(
+                pyarrow.array(entries['ext']),
+                pyarrow.array(list(self.extensions))
+                ),
+            'isdir': pyarrow.array(entries['isdir']),
+            'size': pyarrow.array(entries['size']),
+            'mtime': pyarrow.array(entries['mtime']).cast(pyarrow.timestamp('s')),
+            'id': pyarrow.array(entries['id']).cast(pyarrow.string()),
+            })
+
+
+def buildInventory(root, records):
+    """Build an Inventory from raw dirent dicts of a listing.
+
+    iterJSONArray parses each record into a dict, its values are appended
+    to typed columns right away and the dict is dropped, so memory grows
+    with the columns only. Records of recursive listings name their folder
+    in parent_dir, others belong to root.
+    """
+    import numpy
+    dirIndex = {}
+    extIndex = {}
+    names = []
+    ids = []
+    dirs = array('i')
+    exts = array('i')
+    isdir = bytearray()
+    sizes = array('q')
+    mtimes = array('q')
+    for raw in records:
+        parent = raw.get('parent_dir', root)
+        folder = dirIndex.get(parent)
+        if folder is None:
+            folder = dirIndex[parent] = len(dirIndex)
+        name = raw['name']
+        names.append(name)
+        dirs.append(folder)
+        if raw['type'] == 'dir':
+            isdir.append(1)
+            ext = ''
+        else:
+            isdir.append(0)
+            ext = name.rpartition('.')[2].lower() if '.' in name[1:] else ''
+        extNumber = extIndex.get(ext)
+        if extNumber is None:
+            extNumber = extIndex[ext] = len(extIndex)
+        exts.append(extNumber)
+        sizes.append(raw.get('size') or 0)
+        mtimes.append(raw.get('mtime') or 0)
+        ids.append(raw.get('id') or '')
+    entries = numpy.empty(len(names), dtype=[
+        ('name', object), ('dir', 'i4'), ('ext', 'i4'), ('isdir', '?'),
+        ('size', 'i8'), ('mtime', 'i8'), ('id', 'S40')
+        ])
+    entries['name'] = names
+    entries['dir'] = numpy.frombuffer(dirs, dtype='i4') if dirs else 0
+    entries['ext'] = numpy.frombuffer(exts, dtype='i4') if exts else 0
+    entries['isdir'] = numpy.frombuffer(bytes(isdir), dtype='?') if isdir else False
+    entries['size'] = numpy.frombuffer(sizes, dtype='i8') if sizes else 0
+    entries['mtime'] = numpy.frombuffer(mtimes, dtype='i8') if mtimes else 0
+    entries['id'] = ids
+    folders = numpy.empty(len(dirIndex), dtype=object)
+    for parent, number in dirIndex.items():
+        folders[number] = normPath(parent)
+    extensions = numpy.empty(len(extIndex), dtype=object)
+    for ext, number in extIndex.items():
+        extensions[number] = ext
+    return Inventory(root, entries, folders, extensions)
+
+
+def inventoryOf(client, path='/', recursive=True):
+    """Return the Inventory of a folder from one listing request.
+
+    The listing is parsed while it downloads, see iterJSONArray.
+    """
+    path = normPath(path)
+    apiPath = '/dir/?p={0}'.format(path)
+    if recursive:
+        apiPath += '&recursive=1'
+    res = client.makeRequest(apiPath, stream=True)
+    if res.status_code != 200:
+        raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), path)
+    return buildInventory(
+        path, iterJSONArray(res.iter_content(2**16), key='dirent_list')
+        )
@@ -0,0 +1,143 @@
+#! python3
+# -*- coding: utf-8 -*-
+import hashlib
+import os
+import sqlite3
+import threading
+
+from .seacache import normPath, splitPath
+from .seadirent import SeafileDirEntry
+from .seafilemixin import ensureBase
+
+
+def metadataStoreEnabled():
+    return os.environ.get('SEAFILE_METADATA_STORE', False) == 'True'
+
+
+class MetadataStore(object):
+    """Persistent folder listings of a library in SQLite.
+
+    Backs the in-memory listing cache, so a restarted server serves
+    folder views, file models without content and existence checks
+    right away. The listings belong to the head commit stored with them.
+    On the first check after a start, LibraryCaches.validate compares it
+    to the current head commit and invalidates the paths changed in
+    between, found from the commit diffs. Without a head commit, the
+    listings are revalidated by folder IDs, see LibraryCaches.revalidate.
+    """
+
+    def __init__(self, key, path=None):
+        if path is None:
+            storeDir = ensureBase() + 'meta'
+            os.makedirs(storeDir, mode=0o700, exist_ok=True)
+            path = os.path.join(
+                storeDir,
+                hashlib.sha1('|'.join(key).encode()).hexdigest() + '.sqlite'
+                )
+        self.path = path
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        with self.lock, self.db:
+            self.db.execute(
+                'CREATE TABLE IF NOT EXISTS listings (path TEXT PRIMARY KEY)'
+                )
+            self.db.execute(
+                'CREATE TABLE IF NOT EXISTS entries (parent TEXT, name TEXT, '
+                'type TEXT, size INTEGER, mtime INTEGER, permission TEXT, '
+                'id TEXT, PRIMARY KEY (parent, name))'
+                )
+            self.db.execute(
+                'CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)'
+                )
+
+    def head(self):
+        """Return the head commit the listings belong to, None if unknown."""
+        with self.lock:
+            row = self.db.execute(
+                "SELECT value FROM meta WHERE key = 'head'"
+                ).fetchone()
+        return row[0] if row else None
+
+    def setHead(self, head):
+        with self.lock, self.db:
+            if head is None:
+                self.db.execute("DELETE FROM meta WHERE key = 'head'")
+            else:
+                self.db.execute(
+                    "INSERT OR REPLACE INTO meta (key, value) VALUES ('head', ?)",
+                    (head,)
+                    )
+
+    def listing(self, path):
+        """Return dirent records of a folder, None if it is not stored."""
+        path = normPath(path)
+        with self.lock:
+            if self.db.execute(
+                    'SELECT 1 FROM listings WHERE path = ?', (path,)
+                    ).fetchone() is None:
+                return None
+            rows = self.db.execute(
+                'SELECT name, type, size, mtime, permission, id FROM entries '
+                'WHERE parent = ? ORDER BY rowid', (path,)
+                ).fetchall()
+        return [SeafileDirEntry(path, *x) for x in rows]
+
+    def putListings(self, listings):
+        """Store listings given as a dict of folder path to dirent records."""
+        with self.lock, self.db:
+            for path, files in listings.items():
+                path = normPath(path)
+                self.db.execute('DELETE FROM entries WHERE parent = ?', (path,))
+                self.db.executemany(
+                    'INSERT OR REPLACE INTO entries (parent, name, type, size, '
+                    'mtime, permission, id) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                    [(path, x['name'], x['type'], x.get('size', 0),
+                      x.get('mtime', 0), x.get('permission', 'r'), x.get('id'))
+                     for x in files]
+                    )
+                self.db.execute(
+                    'INSERT OR REPLACE INTO listings (path) VALUES (?)', (path,)
+                    )
+
+    def putListing(self, path, files):
+        self.putListings({path: files})
+
+    def invalidate(self, path, recursive=False):
+        """Forget the listing of path and its parent, like LibraryCaches."""
+        path = normPath(path)
+        folders = [splitPath(path)[0], path]
+        with self.lock, self.db:
+            for folder in folders:
+                self.db.execute('DELETE FROM listings WHERE path = ?', (folder,))
+                self.db.execute('DELETE FROM entries WHERE parent = ?', (folder,))
+            if recursive:
+                prefix = path.rstrip('/') + '/'
+                self.db.execute(
+                    'DELETE FROM listings WHERE substr(path, 1, ?) = ?',
+                    (len(prefix), prefix)
+                    )
+                self.db.execute(
+                    'DELETE FROM entries WHERE substr(parent, 1, ?) = ?',
+                    (len(prefix), prefix)
+                    )
+
+    def invalidateTree(self, path):
+        """Forget the listings of path and all folders below."""
+        path = normPath(path)
+        prefix = path.rstrip('/') + '/'
+        with self.lock, self.db:
+            self.db.execute(
+                'DELETE FROM listings WHERE path = ? OR substr(path, 1, ?) = ?',
+                (path, len(prefix), prefix)
+                )
+            self.db.execute(
+                'DELETE FROM entries WHERE parent = ? OR '
+                'substr(parent, 1, ?) = ?', (path, len(prefix), prefix)
+                )
+
+    def clear(self):
+        with self.lock, self.db:
+            self.db.execute('DELETE FROM listings')
+            self.db.execute('DELETE FROM entries')
+            self.db.execute("DELETE FROM meta WHERE key = 'head'")
@@ -0,0 +1,435 @@
+#! python3
+# -*- coding: utf-8 -*-
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from urllib.parse import quote
+
+from tornado import web
+
+from notebook.services.contents.checkpoints import Checkpoints, GenericCheckpointsMixin
+from notebook.services.contents.manager import ContentsManager
+from traitlets import default
+
+from . import seahttp
+from .seacheckpoints import SeafileCheckpoints
+from .seafilemixin import getSeafileVS, listLibraries, readCredentials, resolveOnce
+from .seamanager import SeafileContentManager
+from .seaprefetch import prefetchEnabled
+from .seatrace import traced
+
+
+def splitLibraryPath(path):
+    """Split 'library/rest/of/path' into the library name and the rest."""
+    library, _, rest = path.strip('/').partition('/')
+    return library, rest
+
+
+def mountModel(model, library):
+    """Prefix the paths of a library model and its content with the library."""
+    model['path'] = (library + '/' + model['path'].strip('/')).rstrip('/')
+    prefix = SeafileContentManager.downloadBaseURL + '/'
+    if (model.get('download_url') or '').startswith(prefix):
+        model['download_url'] = prefix + quote(library) + '/' + \
+            model['download_url'][len(prefix):]
+    if model['type'] == 'directory' and isinstance(model.get('content'), list):
+        for child in model['content']:
+            mountModel(child, library)
+    return model
+
+
+class LibraryMounts(object):
+    """Connections of all libraries of an account, by library name.
+
+    The library list is fetched with one request and kept for
+    SEAFILE_CACHE_TTL seconds. Each library gets a connection tuple, as
+    returned by getConnection, built from that list, so opening a library
+    needs no further requests. Only the libraries named in
+    SEAFILE_LIBRARIES (comma separated) are mounted if it is set.
+    Encrypted libraries cannot be used through the API and are left out.
+    A name shared by several libraries is made unique with the start of
+    the library ID.
+    """
+
+    def __init__(self, seafileURL, token, names=None):
+        self.seafileURL = seafileURL
+        self.token = token
+        self.names = names
+        self.ttl = float(os.environ.get('SEAFILE_CACHE_TTL', 10))
+        self.records = None
+        self.fetched = None
+        self.lock = threading.Lock()
+
+    def libraries(self, refresh=False):
+        """Return an ordered dict of mounted library names to records."""
+        with self.lock:
+            now = time.monotonic()
+            if (refresh or self.records is None
+                    or now - self.fetched > self.ttl):
+                self.records = self.fetchRecords()
+                self.fetched = now
+            return self.records
+
+    def fetchRecords(self):
+        records = {}
+        for record in listLibraries(self.seafileURL, self.token):
+            if record.get('encrypted'):
+                continue
+            if self.names is not None and record['name'] not in self.names:
+                continue
+            name = record['name'].replace('/', '_')
+            if name in records:
+                if records[name]['id'] == record['id']:
+                    # shared with the user in several ways
+                    continue
+                name = '{0} ({1})'.format(name, record['id'][:6])
+            records[name] = record
+        return records
+
+    def connection(self, name):
+        """Return the connection tuple of a mounted library, None if unknown."""
+        record = self.libraries().get(name)
+        if record is None:
+            record = self.libraries(refresh=True).get(name)
+            if record is None:
+                return None
+        version = resolveOnce(
+            ('version', self.seafileURL), getSeafileVS, self.seafileURL
+            )
+        return (
+            self.seafileURL, {"Authorization": "Token {0}".format(self.token)},
+            record['id'], name, version, 'True'
+            )
+
+
+_mounts = {}
+_mountsLock = threading.Lock()
+
+
+def mountsFor(seafileURL, token):
+    """Return the library mounts of an account, shared by all managers."""
+    names = os.environ.get('SEAFILE_LIBRARIES', '')
+    names = [x.strip() for x in names.split(',') if x.strip()] or None
+    key = (seafileURL, token, tuple(names or ()))
+    with _mountsLock:
+        if key not in _mounts:
+            _mounts[key] = LibraryMounts(seafileURL, token, names)
+        return _mounts[key]
+
+
+class LibraryRouter(object):
+    """Route paths to per library delegates, created once per library."""
+
+    def setupMounts(self, server=None):
+        """Mount the libraries of an account.
+
+        server is a (Seafile URL, account token) pair, by default read
+        like the credentials of SeafileContentManager.
+        """
+        if server is None:
+            seafileURL, token = readCredentials()[:2]
+        else:
+            seafileURL, token = server
+        self.mounts = mountsFor(seafileURL, token)
+        self.delegates = {}
+        self.delegatesLock = threading.Lock()
+
+    def createDelegate(self, connection):
+        raise NotImplementedError
+
+    def delegate(self, library):
+        """Return the delegate of a library, raise 404 if it is unknown."""
+        connection = self.mounts.connection(library)
+        if connection is None:
+            raise web.HTTPError(404, u'No such library: {0}'.format(library))
+        with self.delegatesLock:
+            current = self.delegates.get(library)
+            if current is None or current.libraryID != connection[2]:
+                current = self.delegates[library] = self.createDelegate(
+                    connection
+                    )
+            return current
+
+
+class SeafileMultiContentManager(LibraryRouter, ContentsManager):
+    """Contents manager serving all libraries of a Seafile account.
+
+    The root folder lists the libraries as folders, paths below are
+    routed by their first element to a SeafileContentManager for that
+    library, with its own connection state and caches. Folders created
+    in the root become new libraries, renaming them renames the library.
+    Libraries are not deleted from here. Needs an account token, set
+    like for SeafileContentManager or passed as server=(url, token),
+    SEAFILE_LIBRARY is not used.
+    """
+
+    @default('checkpoints_class')
+    def _checkpoints_class_default(self):
+        return SeafileMultiCheckpoints
+
+    def __init__(self, *args, **kwargs):
+        server = kwargs.pop('server', None)
+        super(SeafileMultiContentManager, self).__init__(*args, **kwargs)
+        self.setupMounts(server)
+        self.warmer = None
+
+    @property
+    def seafileURL(self):
+        return self.mounts.seafileURL
+
+    def libraryManagers(self):
+        """Return (library name, manager) pairs of all mounted libraries."""
+        return [(x, self.delegate(x)) for x in self.mounts.libraries()]
+
+    def createDelegate(self, connection):
+        manager = SeafileContentManager(connection=connection)
+        manager.log = self.log
+        manager.allow_hidden = self.allow_hidden
+        return manager
+
+    def rootModel(self, content=True):
+        """Return the root folder model listing the libraries."""
+        libraries = self.mounts.libraries()
+        children = None
+        if content:
+            children = [
+                self.libraryModel(x, y) for x, y in libraries.items()
+                ]
+            if prefetchEnabled():
+                self.warmLibraries(list(libraries))
+        return {
+            'content': children, 'format': 'json' if content else None,
+            'mimetype': None, 'type': 'directory', 'name': '',
+            'writable': False, 'last_modified': datetime.now(), 'path': '',
+            'created': datetime.now(), 'size': ''
+            }
+
+    def libraryModel(self, name, record):
+        try:
+            modified = datetime.fromtimestamp(record['mtime'])
+        except (KeyError, TypeError, ValueError):
+            modified = datetime.now()
+        return {
+            'content': None, 'format': None, 'mimetype': None,
+            'type': 'directory', 'name': name,
+            'writable': record.get('permission', 'rw') == 'rw',
+            'last_modified': modified, 'path': name, 'created': modified,
+            'size': record.get('size', '')
+            }
+
+    def warmLibraries(self, names):
+        """List the libraries' top folders concurrently in the background."""
+        def warm(name):
+            with seahttp.priority(seahttp.BACKGROUND):
+                try:
+                    self.delegate(name).listDirEntries('/')
+                except Exception as e:
+                    self.log.debug('Cannot list library %s: %s', name, e)
+        if self.warmer is None:
+            self.warmer = ThreadPoolExecutor(
+                int(os.environ.get('SEAFILE_PREFETCH_WORKERS', 4))
+                )
+        for name in names:
+            self.warmer.submit(warm, name)
+
+    @traced
+    def get(self, path, content=True, type=None, format=None):
+        library, rest = splitLibraryPath(path)
+        if not library:
+            if type not in (None, 'directory'):
+                raise web.HTTPError(400, u'The root is a directory')
+            return self.rootModel(content)
+        model = self.delegate(library).get(rest, content, type, format)
+        if not rest:
+            model['name'] = library
+        return mountModel(model, library)
+
+    @traced
+    def save(self, model, path=''):
+        library, rest = splitLibraryPath(path)
+        if not library:
+            raise web.HTTPError(400, u'Cannot save the root directory')
+        if not rest:
+            if model.get('type') != 'directory':
+                raise web.HTTPError(
+                    400, u'Files can only be saved inside a library'
+                    )
+            if self.mounts.connection(library) is None:
+                self.createLibrary(library)
+            return self.get(library, content=False)
+        return mountModel(self.delegate(library).save(model, rest), library)
+
+    def createLibrary(self, name):
+        authHeader = {"Authorization": "Token {0}".format(self.mounts.token)}
+        res = seahttp.post(
+            self.mounts.seafileURL + '/api2/repos/', headers=authHeader,
+            data={'name': name, 'desc': 'new library'}
+            )
+        if res.status_code != 200:
+            raise web.HTTPError(
+                res.status_code, u'Cannot create library {0}'.format(name)
+                )
+        self.mounts.libraries(refresh=True)
+
+    @traced
+    def delete_file(self, path):
+        library, rest = splitLibraryPath(path)
+        if not rest:
+            raise web.HTTPError(400, u'Libraries cannot be deleted here')
+        self.delegate(library).delete_file(rest)
+
+    @traced
+    def rename_file(self, old_path, new_path):
+        oldLibrary, oldRest = splitLibraryPath(old_path)
+        newLibrary, newRest = splitLibraryPath(new_path)
+        if not oldLibrary or not newLibrary:
+            raise web.HTTPError(400, u'Cannot rename the root directory')
+        if not oldRest and not newRest:
+            return self.renameLibrary(oldLibrary, newLibrary)
+        if not oldRest or not newRest:
+            raise web.HTTPError(
+                400, u'Libraries cannot be moved into other libraries'
+                )
+        if oldLibrary == newLibrary:
+            return self.delegate(oldLibrary).rename_file(oldRest, newRest)
+        return self.moveBetween(oldLibrary, oldRest, newLibrary, newRest)
+
+    def renameLibrary(self, old, new):
+        if self.mounts.connection(new) is not None:
+            raise web.HTTPError(409, u'Library exists: {0}'.format(new))
+        source = self.delegate(old)
+        res = seahttp.post(
+            source.seafileURL + '/api2/repos/{0}/?op=rename'.format(
+                source.libraryID
+                ),
+            headers=source.authHeader, data={'repo_name': new}
+            )
+        if res.status_code != 200:
+            raise web.HTTPError(
+                res.status_code, u'Cannot rename library {0}'.format(old)
+                )
+        self.mounts.libraries(refresh=True)
+
+    def moveBetween(self, oldLibrary, oldRest, newLibrary, newRest):
+        """Move a file or folder to another library, keeping its name."""
+        source = self.delegate(oldLibrary)
+        target = self.delegate(newLibrary)
+        oldName = oldRest.rstrip('/').split('/')[-1]
+        newParent, _, newName = newRest.rstrip('/').rpartition('/')
+        if oldName != newName:
+            raise web.HTTPError(
+                400, u'Files keep their name when moved between libraries'
+                )
+        if target.statPath(newRest) is not None:
+            raise web.HTTPError(409, u'File exists: {0}'.format(newRest))
+        entry = source.statPath(oldRest)
+        if entry is None:
+            raise web.HTTPError(404, u'No such file: {0}'.format(oldRest))
+        operate = source.operateOnDir if entry['type'] == 'dir' \
+            else source.operateOnFile
+        res = operate(
+            '/' + oldRest, 'move',
+            params=[['dst_dir', '/' + newParent], ['dst_repo', target.libraryID]]
+            )
+        source.caches.invalidate(oldRest, recursive=True)
+        target.caches.invalidate(newRest, recursive=True)
+        if res.status_code not in (200, 301):
+            raise web.HTTPError(500, u'Operation failed, returned {0}'.format(
+                res.status_code
+                ))
+
+    def streamFile(self, filePath, chunkSize=2**20):
+        """Return iterator over the raw bytes of a file, see SeafileClient."""
+        library, rest = splitLibraryPath(filePath)
+        if not rest:
+            raise web.HTTPError(400, u'No such file: {0}'.format(filePath))
+        return self.delegate(library).streamFile('/' + rest, chunkSize)
+
+    def streamZip(self, path, chunkSize=2**20):
+        """Return iterator over a zip archive of a folder or a library."""
+        library, rest = splitLibraryPath(path)
+        if not library:
+            raise web.HTTPError(400, u'Download libraries one by one')
+        return self.delegate(library).streamZip('/' + rest, chunkSize)
+
+    @traced
+    def file_exists(self, path=''):
+        library, rest = splitLibraryPath(path)
+        if not rest:
+            return False
+        try:
+            return self.delegate(library).file_exists(rest)
+        except web.HTTPError as e:
+            if e.status_code != 404:
+                raise
+            return False
+
+    @traced
+    def dir_exists(self, path):
+        library, rest = splitLibraryPath(path)
+        if not library:
+            return True
+        if not rest:
+            return self.mounts.connection(library) is not None
+        try:
+            return self.delegate(library).dir_exists(rest)
+        except web.HTTPError as e:
+            if e.status_code != 404:
+                raise
+            return False
+
+    def is_hidden(self, path):
+        """Check for hidden files or folders, never the root or a library."""
+        if self.allow_hidden:
+            return False
+        name = path.strip('/').split('/')[-1]
+        return '/' in path.strip('/') and name.startswith('.')
+
+    def info_string(self):
+        return "Serving notebooks from all Seafile libraries at {0}".format(
+            self.mounts.seafileURL
+            )
+
+
+class SeafileMultiCheckpoints(LibraryRouter, GenericCheckpointsMixin, Checkpoints):
+    """Checkpoints from the commit history of the library of a path."""
+
+    def __init__(self, *args, **kwargs):
+        server = kwargs.pop('server', None)
+        super(SeafileMultiCheckpoints, self).__init__(*args, **kwargs)
+        self.setupMounts(server)
+
+    def createDelegate(self, connection):
+        checkpoints = SeafileCheckpoints(connection=connection)
+        checkpoints.log = self.log
+        return checkpoints
+
+    def create_file_checkpoint(self, content, format, path):
+        library, rest = splitLibraryPath(path)
+        return self.delegate(library).create_file_checkpoint(content, format, rest)
+
+    def create_notebook_checkpoint(self, nb, path):
+        library, rest = splitLibraryPath(path)
+        return self.delegate(library).create_notebook_checkpoint(nb, rest)
+
+    def delete_checkpoint(self, checkpoint_id, path):
+        pass
+
+    def rename_checkpoint(self, checkpoint_id, old_path, new_path):
+        pass
+
+    def get_file_checkpoint(self, checkpoint_id, path):
+        library, rest = splitLibraryPath(path)
+        return self.delegate(library).get_file_checkpoint(checkpoint_id, rest)
+
+    def get_notebook_checkpoint(self, checkpoint_id, path):
+        library, rest = splitLibraryPath(path)
+        return self.delegate(library).get_notebook_checkpoint(checkpoint_id, rest)
+
+    def list_checkpoints(self, path):
+        library, rest = splitLibraryPath(path)
+        if not rest:
+            return []
+        return self.delegate(library).list_checkpoints(rest)
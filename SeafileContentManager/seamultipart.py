@@ -0,0 +1,150 @@
+#! python3
+# -*- coding: utf-8 -*-
+import hashlib
+import io
+import os
+import tempfile
+import uuid
+
+from .seafilemixin import ensureBase
+
+BLOCK_SIZE = 2**20
+
+
+class MultipartStream(object):
+    """A multipart/form-data body with one file, streamed in blocks.
+
+    The file content may be bytes, str, a memoryview, a binary file
+    object or an iterator of bytes. Bytes and memoryviews are sent as
+    slices without copies, file objects are read one block at a time.
+    Iterators are spooled to a temporary file first if size is not
+    given, since Seafile needs the Content-Length of uploads. Memory use
+    stays at one block regardless of the file size.
+
+    The checksums named in checksums, e.g. 'sha1', are computed while
+    the body is sent and available in digests afterwards. Bodies from
+    bytes or seekable files can be sent again after rewind().
+    """
+
+    def __init__(self, fields, name, filename, source, size=None,
+                 checksums=()):
+        self.boundary = uuid.uuid4().hex
+        self.contentType = 'multipart/form-data; boundary=' + self.boundary
+        self.checksums = checksums
+        self.digests = {}
+        self.spool = None
+        head = b''
+        for key, value in fields.items():
+            head += self.partHeader(key) + str(value).encode('utf-8') + b'\r\n'
+        head += self.partHeader(name, filename)
+        self.head = head
+        self.tail = '--{0}--\r\n'.format(self.boundary).encode()
+        if isinstance(source, str):
+            source = source.encode('utf-8')
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            self.source = memoryview(source).cast('B')
+            self.size = len(self.source)
+            self.start = None
+        elif hasattr(source, 'read'):
+            self.source = source
+            self.size = size
+            self.start = None
+            if self.seekable(source):
+                self.start = source.tell()
+                if self.size is None:
+                    self.size = source.seek(0, io.SEEK_END) - self.start
+                    source.seek(self.start)
+            elif self.size is None:
+                self.spoolSource(iter(lambda: source.read(BLOCK_SIZE), b''))
+        else:
+            self.source = iter(source)
+            self.size = size
+            self.start = None
+            if self.size is None:
+                self.spoolSource(self.source)
+
+    def partHeader(self, name, filename=None):
+        disposition = 'form-data; name="{0}"'.format(name)
+        if filename is not None:
+            disposition += '; filename="{0}"'.format(filename.replace('"', '%22'))
+        header = '--{0}\r\nContent-Disposition: {1}\r\n'.format(
+            self.boundary, disposition
+            )
+        if filename is not None:
+            header += 'Content-Type: application/octet-stream\r\n'
+        return (header + '\r\n').encode('utf-8')
+
+    @staticmethod
+    def seekable(source):
+        try:
+            return source.seekable()
+        except (AttributeError, OSError, ValueError):
+            return False
+
+    def spoolSource(self, blocks):
+        """Copy an iterator of unknown length into a temporary file."""
+        spoolDir = ensureBase() + 'uploads'
+        os.makedirs(spoolDir, mode=0o700, exist_ok=True)
+        self.spool = tempfile.TemporaryFile(dir=spoolDir, prefix='stream-')
+        size = 0
+        for block in blocks:
+            self.spool.write(block)
+            size += len(block)
+        self.spool.seek(0)
+        self.source = self.spool
+        self.size = size
+        self.start = 0
+
+    @property
+    def rewindable(self):
+        return isinstance(self.source, memoryview) or self.start is not None
+
+    def rewind(self):
+        """Prepare sending the body again, e.g. after a throttled request."""
+        if not self.rewindable:
+            raise IOError('Upload body cannot be sent again')
+        if self.start is not None:
+            self.source.seek(self.start)
+
+    def __len__(self):
+        return len(self.head) + self.size + 2 + len(self.tail)
+
+    def blocks(self):
+        if isinstance(self.source, memoryview):
+            for pos in range(0, len(self.source), BLOCK_SIZE):
+                yield self.source[pos:pos + BLOCK_SIZE]
+        elif hasattr(self.source, 'read'):
+            remaining = self.size
+            while remaining is None or remaining > 0:
+                block = self.source.read(
+                    BLOCK_SIZE if remaining is None else min(BLOCK_SIZE, remaining)
+                    )
+                if not block:
+                    break
+                if remaining is not None:
+                    remaining -= len(block)
+                yield block
+        else:
+            for block in self.source:
+                yield block
+
+    def __iter__(self):
+        hashes = [(x, hashlib.new(x)) for x in self.checksums]
+        yield self.head
+        sent = 0
+        for block in self.blocks():
+            for name, hash in hashes:
+                hash.update(block)
+            sent += len(block)
+            yield block
+        if sent != self.size:
+            raise IOError('Upload source gave {0} bytes instead of {1}'.format(
+                sent, self.size
+                ))
+        yield b'\r\n'
+        yield self.tail
+        self.digests = {x: y.hexdigest() for x, y in hashes}
+
+    def close(self):
+        if self.spool is not None:
+            self.spool.close()
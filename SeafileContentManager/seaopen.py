@@ -1,67 +1,76 @@
 #! python3
 # -*- coding: utf-8 -*-
 import errno
+import logging
 import os
 import io
+import shutil
+import tempfile
+import zipfile
 from datetime import datetime
 
-from .seamanager import SeafileContentManager
+from . import seahttp
+from .seablobs import blobCacheEnabled, getBlobCache
+from .seacache import normPath, splitPath
+from .seaclient import SeafileClient
+from .seachunks import uploadFile
+from .seaindex import indexFor
+from .seainventory import inventoryOf
+from .seasync import sync
+from .seatree import findTree, globTree
+from .seatrace import traced
 from .seafilemixin import getConnection
 
+# content of opened files is kept in memory up to this size
+SPOOL_BYTES = 4 * 2**20
 
-class SeafileFS(SeafileContentManager):
+
+def extractZip(fileobj, target, strip=True):
+    """Extract a zip archive into target, optionally without the top folder.
+
+    Entries with absolute paths or '..' elements are skipped.
+    """
+    with zipfile.ZipFile(fileobj) as archive:
+        for info in archive.infolist():
+            parts = info.filename.replace('\\', '/').split('/')
+            if strip:
+                parts = parts[1:]
+            parts = [x for x in parts if x not in ('', '.')]
+            if not parts or '..' in parts:
+                continue
+            dest = os.path.join(target, *parts)
+            if info.is_dir():
+                os.makedirs(dest, exist_ok=True)
+                continue
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            with archive.open(info) as src, open(dest, 'wb') as dst:
+                shutil.copyfileobj(src, dst, 2**20)
+
+
+class SeafileFS(SeafileClient):
     """An os-like filesystem manager for Seafile.
 
-    Maps queries like listdir to calls to the Seafile API.
+    Maps queries like listdir to calls to the Seafile API. Does not import
+    the Jupyter server packages, so it is cheap to use from kernels.
     """
 
-    def __init__(self):
-        retVals = getConnection()
+    requestPriority = seahttp.KERNEL
+    log = logging.getLogger(__name__)
 
-        self.seafileURL = retVals[0]
-        self.authHeader = retVals[1]
-        self.libraryID = retVals[2]
-        self.libraryName = retVals[3]
-        self.seafileMainVs = retVals[4]
-        self.useLibToken = retVals[5]
+    def __init__(self, connection=None):
+        self.setConnection(connection or getConnection())
 
+    @traced
     def listdir_attrib(self, path=None):
         """List dir content with attributes."""
-        files = self.makeRequest('/dir/?p={0}'.format(path)).json()
-        fileList = []
-        for fileDict in files:
-            res = {}
-            res['last_modified'] = datetime.fromtimestamp(
-                fileDict['mtime']
-                )
-            res['name'] = fileDict['name']
-            filepath = path + '/' + fileDict['name']
-            res['path'] = filepath.lstrip('/')
-            if fileDict['permission'] == 'rw':
-                res['writeable'] = True
-            else:
-                res['writeable'] = False
-            if fileDict['type'] == 'file':
-                res['size'] = fileDict['size']
-                try:
-                    fileType = res['name'].split('.')[1]
-                    if fileType == 'ipynb':
-                        res['type'] = 'notebook'
-                    else:
-                        res['type'] = 'file'
-                except:
-                    res['type'] = 'file'
-            elif fileDict['type'] == 'dir':
-                res['type'] = 'directory'
-            fileList.append(res)
-        return fileList
+        return [x.toAttrib() for x in self.scandir(path)]
 
+    @traced
     def listdir(self, path=None):
         """List dir content."""
-        files = self.makeRequest('/dir/?p={0}'.format(path)).json()
-        fileNames = [x['name'] for x in files]
-        return fileNames
+        return [x.name for x in self.scandir(path)]
 
+    @traced
     def mkdir(self, path=None):
         model = {
             'content': None,
@@ -77,20 +86,160 @@ class SeafileFS(SeafileContentManager):
             }
         self.save(model, path)
 
+    @traced
+    def search(self, query, limit=50, content=True):
+        """Search names, paths and text content of the library.
+
+        Answered from the local search index without API requests. The
+        index is built on first use, which blocks until the library was
+        listed. Text content is indexed in the background afterwards, so
+        it is found a little later. See seaindex.SearchIndex.
+        """
+        index = indexFor(self)
+        index.ensureBuilt()
+        index.scheduleRefresh()
+        return index.search(query, limit, content)
+
+    @traced
+    def glob(self, pattern):
+        """Return paths matching a glob pattern, ** matches any subfolders.
+
+        Evaluated locally on a cached tree snapshot, see seatree.treeFor.
+        """
+        return globTree(self, pattern)
+
+    @traced
+    def find(self, path='/', name=None, type=None, maxdepth=None):
+        """Return paths of everything below path.
+
+        name filters by a glob pattern on the last path element, type by
+        'file' or 'dir'. Evaluated locally like glob.
+        """
+        return findTree(self, path, name, type, maxdepth)
+
+    @traced
+    def inventory(self, path='/', recursive=True):
+        """Return sizes, mtimes and types of everything below path as columns.
+
+        Built from one listing request, parsed into columns while it
+        downloads, see seainventory.Inventory for the columns and the
+        aggregations by folder and extension. Needs NumPy, toArrow() also
+        pyarrow.
+        """
+        return inventoryOf(self, path, recursive)
+
+    @traced
+    def sync(self, local, remote='/', download=False, delete=False,
+             exclude=(), checksum=False, dryRun=False, workers=4, report=None):
+        """Mirror a local folder into a library folder, or back with download.
+
+        Transfers only files changed since the last sync, in parallel. See
+        seasync.sync for the options. Returns a SyncResult.
+        """
+        return sync(
+            self, local, remote, download=download, delete=delete,
+            exclude=exclude, checksum=checksum, dryRun=dryRun,
+            workers=workers, report=report
+            )
+
+    @traced
+    def upload_many(self, files, replace=True):
+        """Upload many small files in few requests.
+
+        files maps paths to bytes or str contents. Returns a dict mapping
+        each path to its result, see SeafileClient.uploadMany.
+        """
+        return self.uploadMany(files, replace)
+
+    @traced
+    def upload(self, path, source, size=None, checksums=('sha1',)):
+        """Upload a file streamed from its source.
+
+        source is bytes, str, a memoryview, a binary file object or an
+        iterator of bytes, size its length if it cannot be determined
+        otherwise. The content is sent in blocks and never held in memory
+        as a whole. Returns a dict with the status code, the file ID and
+        the checksums named in checksums, computed while uploading.
+        """
+        parent, name = splitPath(normPath(path))
+        res, digests = self.streamUpload(
+            name, parent.rstrip('/') + '/', source, size=size,
+            checksums=checksums
+            )
+        result = {'status': res.status_code}
+        if res.status_code == 200:
+            result['id'] = res.text.strip().strip('"')
+            result.update((x, digests[x]) for x in checksums if x in digests)
+        else:
+            result['error'] = res.text
+        return result
+
+    @traced
+    def download_dir(self, remote, local, extract=True):
+        """Download a folder as one zip archive built on the server.
+
+        With extract True, the content of the folder is extracted into the
+        local folder, otherwise the archive is written to the local path.
+        Libraries opened with a library token cannot create zip tasks and
+        are downloaded file by file instead. Returns local.
+        """
+        remote = normPath(remote)
+        if not self.libraryID:
+            self.downloadFiles(remote, local, extract)
+            return local
+        chunks = self.streamZip(remote)
+        if extract:
+            os.makedirs(local, exist_ok=True)
+            with tempfile.TemporaryFile(dir=local) as spool:
+                for chunk in chunks:
+                    spool.write(chunk)
+                spool.seek(0)
+                extractZip(spool, local, strip=(remote != '/'))
+        else:
+            part = local + '.part'
+            with open(part, 'wb') as file:
+                for chunk in chunks:
+                    file.write(chunk)
+            os.replace(part, local)
+        return local
+
+    def downloadFiles(self, remote, local, extract=True):
+        """Download a folder file by file, the fallback of download_dir."""
+        prefix = remote.split('/')[-1] + '/' if remote != '/' else ''
+        entries = list(self.walkTree(remote))
+        if extract:
+            os.makedirs(local, exist_ok=True)
+            for entry in entries:
+                rel = normPath(entry.path)[len(remote):].lstrip('/')
+                dest = os.path.join(local, *rel.split('/'))
+                if entry.is_dir():
+                    os.makedirs(dest, exist_ok=True)
+                    continue
+                os.makedirs(os.path.dirname(dest), exist_ok=True)
+                with open(dest, 'wb') as file:
+                    for chunk in self.streamFile(normPath(entry.path)):
+                        file.write(chunk)
+            return
+        with zipfile.ZipFile(local, 'w', zipfile.ZIP_DEFLATED) as archive:
+            for entry in entries:
+                rel = normPath(entry.path)[len(remote):].lstrip('/')
+                if entry.is_dir():
+                    archive.writestr(prefix + rel + '/', b'')
+                    continue
+                with archive.open(prefix + rel, 'w') as file:
+                    for chunk in self.streamFile(normPath(entry.path)):
+                        file.write(chunk)
+
+    @traced
     def isfile(self, path=None):
         """Return file True or False."""
         try:
-            ret = self.makeRequest(
-                '/file/detail/?p={0}'.format(path)
-            )
-            if ret.status_code == 404:
-                return False
-            if ret.status_code == 200:
-                return True
+            return self.file_exists(path)
         except:
             pass
         return False
 
+    @traced
     def open(self, path, mode='r'):
         """
         Open file as byte or str object.
@@ -108,12 +257,28 @@ class SeafileFS(SeafileContentManager):
             w+: truncate
             x+: read starts at beginning
 
-            adding a 'b' opens and writes binary data, however
-            internaly the data is always saved as text
+            adding a 'b' reads and writes bytes, otherwise the
+            content is decoded and encoded as UTF-8
+
+        With SEAFILE_BLOB_CACHE=True, files opened with 'rb' are served
+        memory mapped from a local cache keyed by the Seafile file ID.
+        Saves not uploaded yet are read from the write-back queue or the
+        debouncer instead.
         """
+        pending = self.getPendingFileModel(path, content=False) is not None
+        if mode in ['b', 'rb'] and blobCacheEnabled() and not pending:
+            entry = self.statPath(path)
+            if entry is None or entry['type'] != 'file':
+                raise FileNotFoundError(
+                    errno.ENOENT, os.strerror(errno.ENOENT), path
+                )
+            if entry.get('id'):
+                return getBlobCache().open(
+                    entry['id'], lambda: self.streamFile(path)
+                    )
         if mode in ['r', 'r+', 'b', 'rb', 'r+b']:
             if self.file_exists(path):
-                return SeafileFileModel(path, mode)
+                return SeafileFileModel(path, mode, self.connection)
             raise FileNotFoundError(
                 errno.ENOENT, os.strerror(errno.ENOENT), path
             )
@@ -122,9 +287,9 @@ class SeafileFS(SeafileContentManager):
                 raise FileExistsError(
                     errno.EEXIST, os.strerror(errno.EEXIST), path
                 )
-            return SeafileFileModel(path, mode)
+            return SeafileFileModel(path, mode, self.connection)
         if mode in ['a', 'a+', 'a+b', 'w', 'w+', 'w+b']:
-            return SeafileFileModel(path, mode)
+            return SeafileFileModel(path, mode, self.connection)
         if mode == 'b+':
             raise ValueError(
                 "Must have exactly one of create/read/write/append\
@@ -133,17 +298,21 @@ class SeafileFS(SeafileContentManager):
         raise ValueError("invalid mode: '{0}'".format(mode))
 
 
-class SeafileFileModel(SeafileContentManager):
-    """Return file like model for Seafile API."""
+class SeafileFileModel(SeafileClient):
+    """Return file like model for Seafile API.
 
-    def __init__(self, path, mode):
-        retVals = getConnection()
+    The content is held as raw bytes in a spool file, in memory up to
+    SPOOL_BYTES and on disk beyond, decoded as UTF-8 in text modes, so
+    binary files read and append like local files. Each write uploads the
+    file, streamed from the spool, see seachunks.uploadFile. Used as a
+    context manager, writes are uploaded once when the block is left.
+    """
 
-        self.seafileURL = retVals[0]
-        self.authHeader = retVals[1]
-        self.libraryID = retVals[2]
-        self.libraryName = retVals[3]
-        self.seafileMainVs = retVals[4]
+    requestPriority = seahttp.KERNEL
+    log = logging.getLogger(__name__)
+
+    def __init__(self, path, mode, connection=None):
+        self.setConnection(connection or getConnection())
 
         self.rawModel = {
             'content': '',
@@ -160,70 +329,155 @@ class SeafileFileModel(SeafileContentManager):
 
         self.filePath = path
         self.fileMode = mode
+        self.spool = tempfile.SpooledTemporaryFile(SPOOL_BYTES)
+        self.deferred = False
+        self.dirty = False
         if self.fileMode in ['r', 'r+', 'rb', 'r+b', 'b']:
-            self.fileModel = self.getFileModel(path)
+            self.fileModel = self.getFileModel(path, content=False)
+            self.spool.write(self.fetchContent())
         elif self.fileMode in ['x', 'x+', 'x+b']:
             self.fileModel = self.rawModel
             self.save(self.fileModel, self.filePath)
         elif self.fileMode in ['a', 'a+', 'a+b', 'w', 'w+', 'w+b']:
             if self.file_exists(path):
-                self.fileModel = self.getFileModel(path)
+                self.fileModel = self.getFileModel(path, content=False)
                 if self.fileMode in ['w', 'w+', 'w+b']:
-                    contentDict = {
-                        'content': ''
-                    }
-                    self.fileModel.update(contentDict)
-                    self.save(self.fileModel, self.filePath)
+                    self.storeContent()
+                else:
+                    self.spool.write(self.fetchContent())
             else:
                 self.fileModel = self.rawModel
 
-    def read(self):
-        """Read file from Seafile API."""
+    @property
+    def binary(self):
+        return 'b' in self.fileMode
+
+    @property
+    def closed(self):
+        return self.spool.closed
+
+    def getvalue(self):
+        """Return the content as bytes."""
+        self.spool.seek(0)
+        return self.spool.read()
+
+    def fetchContent(self):
+        """Return the raw bytes of the file, of a pending save if any."""
+        path = normPath(self.filePath)
+        for queue in (self.writeBack, self.debouncer):
+            local = queue.read(path) if queue is not None else None
+            if local is not None:
+                data = local[0]
+                return data.encode('utf-8') if isinstance(data, str) else data
+        entry = self.statPath(path)
+        fileID = entry.get('id') if entry else None
+        data = self.caches.contents.get(fileID) if fileID else None
+        if data is None:
+            dlLink = self.makeRequest('/file/?p={0}'.format(path))
+            if dlLink.status_code != 200 or 'error_msg' in dlLink.json():
+                raise FileNotFoundError(
+                    errno.ENOENT, os.strerror(errno.ENOENT), path
+                    )
+            data = self.downloadFile(dlLink.json(), fileID)
+        return data
+
+    def storeContent(self):
+        """Upload the content, streamed from the spool.
+
+        Saves held back by the debouncer or the write-back queue are kept
+        as bytes by them, so the content is handed over as a whole there.
+        """
+        path = normPath(self.filePath)
+        filename = path.split('/')[-1]
+        filepath = '/'.join(path.split('/')[:-1]) + '/'
+        self.caches.invalidate(path)
+        self.dirty = False
+        if self.writeBack is not None or self.debouncer is not None:
+            self.uploadContent(filename, filepath, self.getvalue())
+            return
+        size = self.spool.seek(0, os.SEEK_END)
+        self.spool.seek(0)
+        res = uploadFile(self, path, self.spool, size)
+        if res.status_code != 200:
+            raise IOError('Upload of {0} failed: {1}'.format(
+                path, res.status_code
+                ))
+        if self.searchIndex is not None:
+            self.searchIndex.indexSave(
+                path, self.getvalue() if size <= SPOOL_BYTES else b''
+                )
+
+    def toBytes(self, content):
+        if isinstance(content, str):
+            return content.encode('utf-8')
+        return bytes(content)
+
+    def checkReadable(self):
         if self.fileMode in ('a', 'w', 'x'):
             raise io.UnsupportedOperation(
                 errno.EOPNOTSUPP,
                 os.strerror(errno.EOPNOTSUPP) +
                 " in '{0}' mode".format(self.fileMode)
             )
-        if self.fileMode in ('r', 'r+', 'a+', 'w+', 'x+'):
-            return self.fileModel['content']
-        if self.fileMode in ('b', 'rb', 'r+b', 'a+b', 'w+b', 'x+b'):
-            return self.fileModel['content'].encode()
+
+    def read(self):
+        """Read file from Seafile API."""
+        self.checkReadable()
+        if self.binary:
+            return self.getvalue()
+        return self.getvalue().decode('utf-8')
 
     def readlines(self):
         """Read all lines on file."""
-        if self.fileMode in ('a', 'w', 'x'):
-            raise io.UnsupportedOperation(
-                errno.EOPNOTSUPP,
-                os.strerror(errno.EOPNOTSUPP) +
-                " in '{0}' mode".format(self.fileMode)
-            )
-        lines = self.fileModel['content'].splitlines(True)
-        if self.fileMode in ('b', 'rb', 'r+b', 'a+b', 'w+b', 'x+b'):
-            return [x.encode() for x in lines]
-        return lines
+        self.checkReadable()
+        if self.binary:
+            return self.getvalue().splitlines(True)
+        return self.getvalue().decode('utf-8').splitlines(True)
 
     def write(self, content):
-        """Write file to Seafile backend."""
+        """Write file to Seafile backend.
+
+        Like local files, writes append to what was written since the file
+        was opened, in r+ modes they replace the first lines.
+        """
         if self.fileMode in ('r', 'rb', 'b'):
             raise io.UnsupportedOperation(
                 errno.EOPNOTSUPP,
                 os.strerror(errno.EOPNOTSUPP) +
                 " in '{0}' mode".format(self.fileMode)
             )
-        if self.fileMode in ('a', 'a+', 'a+b'):
-            newcontent = self.fileModel['content'] + content
-            self.fileModel.update({'content': newcontent})
-            self.save(self.fileModel, self.filePath)
-            return len(content)
+        data = self.toBytes(content)
         if self.fileMode in ('r+', 'r+b'):
-            old = self.fileModel['content'].splitlines()
-            new = content.splitlines()
+            old = self.getvalue().splitlines()
+            new = data.splitlines()
             old[0:len(new)] = new
-            self.fileModel.update({'content': '\n'.join(old)})
-            self.save(self.fileModel, self.filePath)
-            return len(content)
-        if self.fileMode in ('x', 'x+', 'x+b', 'w', 'w+', 'w+b'):
-            self.fileModel.update({'content': content})
-            self.save(self.fileModel, self.filePath)
-            return len(content)
+            self.spool.seek(0)
+            self.spool.truncate()
+            self.spool.write(b'\n'.join(old))
+        else:
+            self.spool.seek(0, os.SEEK_END)
+            self.spool.write(data)
+        self.dirty = True
+        if not self.deferred:
+            self.storeContent()
+        return len(content)
+
+    def flush(self):
+        """Upload writes held back in a with block."""
+        if self.dirty:
+            self.storeContent()
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            self.flush()
+        finally:
+            self.spool.close()
+
+    def __enter__(self):
+        self.deferred = True
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
@@ -0,0 +1,45 @@
+#! python3
+# -*- coding: utf-8 -*-
+
+from . import seahttp
+from .seafilemixin import connect
+
+
+class SeafilePool(object):
+    """Serve many Seafile users from one process.
+
+    Meant for a hub side service or a shared proxy. Each token gets its
+    own pooled session with a bounded number of concurrent requests, while
+    server version and library IDs are resolved once and shared. Downloads
+    of the same file ID in shared libraries are fetched once for all users
+    who requested it at the same time, after each passed its own
+    permission check.
+    """
+
+    def __init__(self, seafileURL, maxPerUser=None):
+        self.seafileURL = seafileURL.rstrip('/')
+        self.maxPerUser = maxPerUser
+
+    def connect(self, token, libraryName='notebooks', useLibToken=False):
+        """Return connection tuple for a user, sharing bootstrap state."""
+        if self.maxPerUser:
+            seahttp.setUserLimit(token, self.maxPerUser)
+        return connect(self.seafileURL, token, libraryName, useLibToken)
+
+    def fs(self, token, libraryName='notebooks', useLibToken=False):
+        """Return a SeafileFS for the user."""
+        from .seaopen import SeafileFS
+        return SeafileFS(
+            connection=self.connect(token, libraryName, useLibToken)
+            )
+
+    def contentsManager(self, token, libraryName='notebooks', useLibToken=False, **kwargs):
+        """Return a SeafileContentManager for the user."""
+        from .seamanager import SeafileContentManager
+        return SeafileContentManager(
+            connection=self.connect(token, libraryName, useLibToken), **kwargs
+            )
+
+    def release(self, token):
+        """Close pooled connections of a user."""
+        seahttp.dropUser(token)
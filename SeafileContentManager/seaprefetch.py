@@ -0,0 +1,114 @@
+#! python3
+# -*- coding: utf-8 -*-
+import logging
+import os
+import queue
+import threading
+
+from . import seahttp
+from .seacache import libraryKey, normPath
+
+log = logging.getLogger(__name__)
+
+
+def prefetchEnabled():
+    return os.environ.get('SEAFILE_PREFETCH', False) == 'True'
+
+
+class Prefetcher(object):
+    """Warm caches for entries a user is likely to open next.
+
+    After a folder was listed, the details of the most recently modified
+    files and the listings of the most recently modified subfolders are
+    queued. Files below SEAFILE_PREFETCH_CONTENT_BYTES are also
+    downloaded into the content cache. The queue is bounded, tasks which
+    do not fit are dropped, and tasks for entries already cached are
+    skipped, so prefetching never grows the caches beyond their budgets.
+    Requests run in the background priority class.
+    """
+
+    def __init__(self, manager, workers=2):
+        self.manager = manager
+        self.maxFiles = int(os.environ.get('SEAFILE_PREFETCH_FILES', 5))
+        self.maxDirs = int(os.environ.get('SEAFILE_PREFETCH_DIRS', 5))
+        self.maxContent = int(
+            os.environ.get('SEAFILE_PREFETCH_CONTENT_BYTES', 0)
+            )
+        self.tasks = queue.Queue(
+            int(os.environ.get('SEAFILE_PREFETCH_QUEUE', 64))
+            )
+        self.queued = set()
+        self.lock = threading.Lock()
+        for number in range(workers):
+            worker = threading.Thread(
+                target=self.run, name='seafile-prefetch-{0}'.format(number),
+                daemon=True
+                )
+            worker.start()
+
+    def schedule(self, path, files):
+        """Queue prefetch tasks for the entries of a listed folder."""
+        path = normPath(path)
+        recent = sorted(files, key=lambda x: x.get('mtime', 0), reverse=True)
+        fileTasks = [x for x in recent if x['type'] == 'file'][:self.maxFiles]
+        dirTasks = [x for x in recent if x['type'] == 'dir'][:self.maxDirs]
+        for entry in fileTasks:
+            self.put(('file', path.rstrip('/') + '/' + entry['name'], entry))
+        for entry in dirTasks:
+            self.put(('dir', path.rstrip('/') + '/' + entry['name'], entry))
+
+    def put(self, task):
+        key = task[:2]
+        with self.lock:
+            if key in self.queued:
+                return
+            try:
+                self.tasks.put_nowait(task)
+            except queue.Full:
+                return
+            self.queued.add(key)
+
+    def run(self):
+        with seahttp.priority(seahttp.BACKGROUND):
+            self.serve()
+
+    def serve(self):
+        while True:
+            task = self.tasks.get()
+            with self.lock:
+                self.queued.discard(task[:2])
+            try:
+                self.warm(*task)
+            except Exception as e:
+                log.debug('Prefetch of %s failed: %s', task[1], e)
+
+    def warm(self, kind, path, entry):
+        manager = self.manager
+        caches = manager.caches
+        if kind == 'dir':
+            if caches.listing(path) is None:
+                manager.listDirEntries(path)
+            return
+        if path not in caches.details:
+            manager.getFileDetail(path)
+        size = entry.get('size') or 0
+        fileID = entry.get('id')
+        if (not fileID or size > self.maxContent or
+                not caches.contents.fits(size) or fileID in caches.contents):
+            return
+        dlLink = manager.makeRequest('/file/?p={0}'.format(path))
+        if dlLink.status_code == 200:
+            manager.downloadFile(dlLink.json(), fileID)
+
+
+_prefetchers = {}
+_registryLock = threading.Lock()
+
+
+def prefetcherFor(manager):
+    """Return the prefetcher of the manager's library."""
+    key = libraryKey(manager)
+    with _registryLock:
+        if key not in _prefetchers:
+            _prefetchers[key] = Prefetcher(manager)
+        return _prefetchers[key]
@@ -0,0 +1,534 @@
+#! python3
+# -*- coding: utf-8 -*-
+import errno
+import fnmatch
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from .seacache import libraryKey, normPath
+from .seachunks import PIECE_SIZE, uploadFile
+from .seafilemixin import ensureBase
+from .seatree import treeFor
+
+
+class SyncState(object):
+    """Size, mtime, checksum and file ID of every path at the last sync.
+
+    Kept in a JSON file per local folder, library and remote folder below
+    the settings dir. A file whose size and mtime match its record, while
+    the remote file ID does too, is unchanged on both sides and is not read
+    at all. Records are changed by the worker threads, so access goes
+    through the methods, which hold a lock.
+    """
+
+    def __init__(self, local, client, remote):
+        key = json.dumps(
+            list(libraryKey(client)) + [remote, os.path.abspath(local)]
+            )
+        folder = ensureBase() + 'sync'
+        os.makedirs(folder, mode=0o700, exist_ok=True)
+        self.path = os.path.join(
+            folder, hashlib.sha1(key.encode('utf-8')).hexdigest() + '.json'
+            )
+        self.lock = threading.Lock()
+        try:
+            with open(self.path, 'r') as file:
+                self.records = json.load(file)
+        except (OSError, ValueError):
+            self.records = {}
+
+    def get(self, path):
+        with self.lock:
+            return self.records.get(path)
+
+    def put(self, path, size, mtime, fileID, sha1=None):
+        with self.lock:
+            self.records[path] = {
+                'size': size, 'mtime': mtime, 'id': fileID, 'sha1': sha1
+                }
+
+    def pop(self, path):
+        with self.lock:
+            self.records.pop(path, None)
+
+    def popTree(self, path):
+        """Forget path and everything below it."""
+        with self.lock:
+            for record in [x for x in self.records
+                           if x == path or x.startswith(path + '/')]:
+                del self.records[record]
+
+    def save(self):
+        """Write the records, replacing the file atomically."""
+        handle, name = tempfile.mkstemp(dir=os.path.dirname(self.path))
+        with os.fdopen(handle, 'w') as file, self.lock:
+            json.dump(self.records, file)
+        os.replace(name, self.path)
+
+
+class SyncResult(object):
+    """Paths transferred, deleted, unchanged and failed by a sync.
+
+    Worker threads update it holding lock.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.transferred = []
+        self.deleted = []
+        self.created = []
+        self.unchanged = 0
+        self.failed = {}
+        self.bytes = 0
+
+    def __repr__(self):
+        return (
+            'SyncResult(transferred={0}, deleted={1}, unchanged={2}, '
+            'failed={3}, bytes={4})'.format(
+                len(self.transferred), len(self.deleted), self.unchanged,
+                len(self.failed), self.bytes
+                )
+            )
+
+
+def isExcluded(path, patterns):
+    """Check a relative path against exclude patterns.
+
+    A pattern matches the whole relative path or the last element, like
+    '*.pyc', '.git' or 'build/*'.
+    """
+    name = path.rpartition('/')[2]
+    return any(
+        fnmatch.fnmatchcase(path, x) or fnmatch.fnmatchcase(name, x)
+        for x in patterns
+        )
+
+
+def scanLocal(local, exclude=()):
+    """Return files and folders below a local folder.
+
+    files maps relative paths with / separators to (size, mtime_ns),
+    folders is a set of relative paths. Excluded folders are not entered.
+    """
+    files = {}
+    folders = set()
+    for top, dirnames, filenames in os.walk(local):
+        rel = os.path.relpath(top, local).replace(os.sep, '/')
+        prefix = '' if rel == '.' else rel + '/'
+        dirnames[:] = [
+            x for x in dirnames if not isExcluded(prefix + x, exclude)
+            ]
+        folders.update(prefix + x for x in dirnames)
+        for name in filenames:
+            path = prefix + name
+            if isExcluded(path, exclude):
+                continue
+            try:
+                stat = os.stat(os.path.join(top, name))
+            except OSError:
+                continue
+            files[path] = (stat.st_size, stat.st_mtime_ns)
+    return files, folders
+
+
+def scanRemote(client, remote, exclude=()):
+    """Return files and folders below a remote folder, like scanLocal.
+
+    files maps relative paths to dirent entries. Uses the tree snapshot
+    of the library caches, one recursive listing if there is none yet.
+    Returns None if the remote folder does not exist.
+    """
+    files = {}
+    folders = set()
+    snapshot = treeFor(client, remote)
+    if snapshot is None:
+        return None
+    start = len(remote.rstrip('/')) + 1
+    excluded = []
+    for path, entry in snapshot.walk(remote):
+        rel = path[start:]
+        if any(rel.startswith(x) for x in excluded):
+            continue
+        if isExcluded(rel, exclude):
+            if entry.type == 'dir':
+                excluded.append(rel + '/')
+            continue
+        if entry.type == 'dir':
+            folders.add(rel)
+        else:
+            files[rel] = entry
+    return files, folders
+
+
+def fileSha1(filename):
+    digest = hashlib.sha1()
+    with open(filename, 'rb') as file:
+        for block in iter(lambda: file.read(2**20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def topmost(paths):
+    """Return the paths which are not below another of the paths."""
+    result = []
+    for path in sorted(paths):
+        if not result or not path.startswith(result[-1] + '/'):
+            result.append(path)
+    return result
+
+
+class Sync(object):
+    """Mirror a local folder into a library folder or back.
+
+    Local and remote trees are compared by size and mtime against the
+    records of the last sync, see SyncState, and optionally by checksum.
+    Only differing files are transferred, by workers threads. Small files
+    are uploaded in batches per folder, see SeafileClient.uploadMany.
+    """
+
+    def __init__(self, client, local, remote, download=False, delete=False,
+                 exclude=(), checksum=False, dryRun=False, workers=4,
+                 report=None):
+        self.client = client
+        self.local = local
+        self.remote = normPath(remote)
+        self.download = download
+        self.delete = delete
+        self.exclude = tuple(exclude)
+        self.checksum = checksum
+        self.dryRun = dryRun
+        self.workers = workers
+        self.report = report or (lambda action, path: None)
+        self.state = SyncState(local, client, self.remote)
+        self.result = SyncResult()
+
+    def localPath(self, path):
+        return os.path.join(self.local, *path.split('/'))
+
+    def remotePath(self, path):
+        return normPath(self.remote.rstrip('/') + '/' + path)
+
+    def run(self):
+        """Compare both trees and transfer the differences, return SyncResult."""
+        if not self.download and not os.path.isdir(self.local):
+            # an empty listing would delete the whole remote folder
+            raise FileNotFoundError(
+                errno.ENOENT, os.strerror(errno.ENOENT), self.local
+                )
+        localFiles, localFolders = scanLocal(self.local, self.exclude)
+        remote = scanRemote(self.client, self.remote, self.exclude)
+        remoteMissing = remote is None
+        if remoteMissing and self.download:
+            raise FileNotFoundError(
+                errno.ENOENT, os.strerror(errno.ENOENT), self.remote
+                )
+        remoteFiles, remoteFolders = remote or ({}, set())
+        if self.download:
+            plan = self.planDownload(localFiles, remoteFiles)
+        else:
+            plan = self.planUpload(localFiles, remoteFiles)
+        result = self.result
+        result.unchanged = (
+            len(localFiles if not self.download else remoteFiles) - len(plan)
+            )
+        try:
+            if self.download:
+                self.createLocal(remoteFolders - localFolders)
+                self.transfer(self.downloadFile, plan, remoteFiles)
+                if self.delete:
+                    self.deleteLocal(
+                        set(localFiles) - set(remoteFiles),
+                        localFolders - remoteFolders
+                        )
+            else:
+                self.createRemote(
+                    localFolders - remoteFolders,
+                    remoteMissing and bool(plan or localFolders)
+                    )
+                self.uploadPlan(plan, localFiles)
+                if self.delete:
+                    self.deleteRemote(
+                        set(remoteFiles) - set(localFiles),
+                        remoteFolders - localFolders
+                        )
+        finally:
+            if not self.dryRun:
+                self.state.save()
+        return result
+
+    def isUnchanged(self, path, size, mtime, fileID):
+        """Check a file against its record of the last sync.
+
+        With checksum True, files whose mtime changed while their size did
+        not are hashed and compared with the recorded checksum.
+        """
+        record = self.state.get(path)
+        if record is None or record['id'] != fileID or record['size'] != size:
+            return False
+        if record['mtime'] == mtime:
+            return True
+        if self.checksum and record['sha1'] is not None:
+            if fileSha1(self.localPath(path)) == record['sha1']:
+                if not self.dryRun:
+                    self.state.put(path, size, mtime, fileID, record['sha1'])
+                return True
+        return False
+
+    def isCopy(self, path, size, mtime, entry):
+        """Check a file without record against the other side's copy.
+
+        Only with checksum True, both copies are hashed, the remote one
+        while it is downloaded. Sizes and mtimes alone do not tell if
+        the content is the same.
+        """
+        if not self.checksum or self.state.get(path) is not None or \
+                entry.size != size:
+            return False
+        sha1 = fileSha1(self.localPath(path))
+        digest = hashlib.sha1()
+        for block in self.client.streamFile(self.remotePath(path)):
+            digest.update(block)
+        if digest.hexdigest() != sha1:
+            return False
+        if not self.dryRun:
+            self.state.put(path, size, mtime, entry.id, sha1)
+        return True
+
+    def planUpload(self, localFiles, remoteFiles):
+        plan = []
+        for path, (size, mtime) in sorted(localFiles.items()):
+            entry = remoteFiles.get(path)
+            if entry is not None:
+                if self.isUnchanged(path, size, mtime, entry.id):
+                    continue
+                if self.isCopy(path, size, mtime, entry):
+                    continue
+            plan.append(path)
+        return plan
+
+    def planDownload(self, localFiles, remoteFiles):
+        plan = []
+        for path, entry in sorted(remoteFiles.items()):
+            if path in localFiles:
+                size, mtime = localFiles[path]
+                if self.isUnchanged(path, size, mtime, entry.id):
+                    continue
+                if self.isCopy(path, size, mtime, entry):
+                    continue
+            plan.append(path)
+        return plan
+
+    def transfer(self, function, paths, *args):
+        """Run function(path, *args) for all paths with the worker threads."""
+        if self.dryRun:
+            for path in paths:
+                self.report('download' if self.download else 'upload', path)
+                self.result.transferred.append(path)
+            return
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            futures = [(x, pool.submit(function, x, *args)) for x in paths]
+            for path, future in futures:
+                try:
+                    future.result()
+                except Exception as e:
+                    self.fail(path, e)
+
+    def fail(self, path, error):
+        with self.result.lock:
+            self.result.failed[path] = error
+        self.report('failed', '{0}: {1}'.format(path, error))
+
+    def done(self, path, size):
+        with self.result.lock:
+            self.result.transferred.append(path)
+            self.result.bytes += size
+        self.report('download' if self.download else 'upload', path)
+
+    def createRemote(self, folders, rootMissing):
+        """Create missing remote folders, parents first."""
+        targets = [self.remotePath(x) for x in sorted(folders)]
+        if rootMissing:
+            targets = self.missingParents(self.remote) + [self.remote] + targets
+        for path in targets:
+            self.report('mkdir', path)
+            self.result.created.append(path)
+            if not self.dryRun:
+                self.client.operateOnDir(path, 'mkdir')
+                self.client.caches.invalidate(path)
+
+    def missingParents(self, path):
+        parts = path.strip('/').split('/')[:-1]
+        parents = ['/' + '/'.join(parts[:x]) for x in range(1, len(parts) + 1)]
+        return [x for x in parents if not self.client.dir_exists(x)]
+
+    def uploadPlan(self, plan, localFiles):
+        """Upload the planned files, small ones in batches per folder."""
+        batchBytes = int(os.environ.get('SEAFILE_UPLOAD_BATCH_BYTES', 16 * 2**20))
+        groups = {}
+        large = []
+        for path in plan:
+            size = localFiles[path][0]
+            if size <= batchBytes // 4:
+                groups.setdefault(path.rpartition('/')[0], []).append(path)
+            else:
+                large.append(path)
+        if self.dryRun:
+            self.transfer(None, plan)
+            return
+        batches = []
+        for members in groups.values():
+            batch = []
+            total = 0
+            for path in members:
+                size = localFiles[path][0]
+                if batch and total + size > batchBytes:
+                    batches.append(batch)
+                    batch = []
+                    total = 0
+                batch.append(path)
+                total += size
+            batches.append(batch)
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            futures = [
+                (x, pool.submit(self.uploadBatch, x, localFiles)) for x in batches
+                ] + [
+                ([x], pool.submit(self.uploadSingle, x, localFiles[x]))
+                for x in large
+                ]
+            for paths, future in futures:
+                try:
+                    future.result()
+                except Exception as e:
+                    for path in paths:
+                        self.fail(path, e)
+
+    def uploadBatch(self, batch, localFiles):
+        contents = []
+        for path in batch:
+            with open(self.localPath(path), 'rb') as file:
+                contents.append((self.remotePath(path), file.read()))
+        results = self.client.uploadMany(contents)
+        for (target, content), path in zip(contents, batch):
+            result = results.get(target, {})
+            if result.get('status') != 200 or not result.get('id'):
+                self.fail(path, IOError(result.get('error', 'upload failed')))
+                continue
+            size, mtime = localFiles[path]
+            self.state.put(
+                path, size, mtime, result['id'],
+                hashlib.sha1(content).hexdigest()
+                )
+            self.done(path, size)
+
+    def uploadSingle(self, path, stat):
+        size, mtime = stat
+        target = self.remotePath(path)
+        sha1 = None
+        with open(self.localPath(path), 'rb') as file:
+            if size <= PIECE_SIZE:
+                parent, name = target.rsplit('/', 1)
+                res, digests = self.client.streamUpload(
+                    name, parent + '/', file, size=size
+                    )
+                sha1 = digests.get('sha1')
+            else:
+                res = uploadFile(self.client, target, file, size)
+        if res.status_code != 200:
+            raise IOError('Upload failed: {0}'.format(res.status_code))
+        fileID = res.text.strip().strip('"')
+        if len(fileID) != 40:
+            entry = self.client.statPath(target)
+            fileID = entry.get('id') if entry is not None else None
+        if sha1 is None and self.checksum:
+            sha1 = fileSha1(self.localPath(path))
+        self.state.put(path, size, mtime, fileID, sha1)
+        self.done(path, size)
+
+    def deleteRemote(self, files, folders):
+        targets = topmost(files | folders)
+        for path in targets:
+            self.report('delete', self.remotePath(path))
+            self.result.deleted.append(path)
+        if self.dryRun:
+            return
+
+        def deleteOne(path):
+            self.client.deleteObject(
+                self.remotePath(path), 'dir' if path in folders else 'file'
+                )
+            self.state.popTree(path)
+
+        self.transfer(deleteOne, targets)
+
+    def createLocal(self, folders):
+        for folder in sorted(folders):
+            self.report('mkdir', self.localPath(folder))
+            self.result.created.append(folder)
+            if not self.dryRun:
+                os.makedirs(self.localPath(folder), exist_ok=True)
+
+    def downloadFile(self, path, remoteFiles):
+        """Download into a temporary file next to the target, then rename.
+
+        The file gets the remote mtime, so a later sync in either
+        direction sees it as unchanged.
+        """
+        entry = remoteFiles[path]
+        target = self.localPath(path)
+        os.makedirs(os.path.dirname(target) or '.', exist_ok=True)
+        handle, name = tempfile.mkstemp(
+            dir=os.path.dirname(target) or '.', prefix='.sync-'
+            )
+        digest = hashlib.sha1()
+        try:
+            with os.fdopen(handle, 'wb') as file:
+                for block in self.client.streamFile(self.remotePath(path)):
+                    digest.update(block)
+                    file.write(block)
+            os.utime(name, (entry.mtime, entry.mtime))
+            os.replace(name, target)
+        except BaseException:
+            os.remove(name)
+            raise
+        stat = os.stat(target)
+        self.state.put(
+            path, stat.st_size, stat.st_mtime_ns, entry.id, digest.hexdigest()
+            )
+        self.done(path, stat.st_size)
+
+    def deleteLocal(self, files, folders):
+        for path in topmost(files | folders):
+            self.report('delete', self.localPath(path))
+            self.result.deleted.append(path)
+            if self.dryRun:
+                continue
+            try:
+                if path in folders:
+                    shutil.rmtree(self.localPath(path))
+                else:
+                    os.remove(self.localPath(path))
+            except OSError as e:
+                self.fail(path, e)
+                continue
+            self.state.popTree(path)
+
+
+def sync(client, local, remote='/', download=False, delete=False, exclude=(),
+         checksum=False, dryRun=False, workers=4, report=None):
+    """Mirror a local folder into a library folder, or back with download.
+
+    Only files that differ are transferred. With delete, files missing in
+    the source are removed from the target, excluded paths are never
+    touched. report(action, path) is called for every mkdir, upload,
+    download, delete and failure. Returns a SyncResult.
+    """
+    return Sync(
+        client, local, remote, download=download, delete=delete,
+        exclude=exclude, checksum=checksum, dryRun=dryRun, workers=workers,
+        report=report
+        ).run()
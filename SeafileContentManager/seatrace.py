@@ -0,0 +1,193 @@
+#! python3
+# -*- coding: utf-8 -*-
+import contextvars
+import functools
+import inspect
+import logging
+import os
+import re
+import time
+from contextlib import contextmanager
+
+log = logging.getLogger(__name__)
+
+_current = contextvars.ContextVar('seafileSpan', default=None)
+_tracer = None
+
+# path element after these fileserver routes is an access token
+_fileserverToken = re.compile(r'(/seafhttp/[^/]+/)[^/?]+')
+
+
+def roundTripBudget():
+    """Return SEAFILE_TRACE_BUDGET as int, None if not set."""
+    budget = os.environ.get('SEAFILE_TRACE_BUDGET')
+    return int(budget) if budget else None
+
+
+def otelEnabled():
+    return os.environ.get('SEAFILE_TRACE_OTEL', False) == 'True'
+
+
+def otelTracer():
+    """Return the OpenTelemetry tracer, None if the package is missing."""
+    global _tracer
+    if _tracer is None:
+        try:
+            from opentelemetry import trace as otel
+        except ImportError:
+            _tracer = False
+        else:
+            _tracer = otel.get_tracer('SeafileContentManager')
+    return _tracer or None
+
+
+def redact(url):
+    """Return url without the access tokens of fileserver links."""
+    return _fileserverToken.sub(r'\1***', url)
+
+
+class Span(object):
+    """A timed operation with attributes and nested spans.
+
+    kind is 'trace' for the root opened by trace(), 'operation' for
+    methods of the contents manager, checkpoints and SeafileFS, and
+    'http' for single requests.
+    """
+
+    def __init__(self, name, kind, parent=None, attributes=None):
+        self.name = name
+        self.kind = kind
+        self.parent = parent
+        self.attributes = attributes or {}
+        self.children = []
+        self.start = time.perf_counter()
+        self.duration = None
+        if parent is not None:
+            parent.children.append(self)
+
+    def walk(self):
+        """Yield this span and all nested spans, depth first."""
+        yield self
+        for child in self.children:
+            yield from child.walk()
+
+    def requests(self):
+        """Return the nested http spans in the order they were started."""
+        return [x for x in self.walk() if x.kind == 'http']
+
+    @property
+    def roundTrips(self):
+        return len(self.requests())
+
+    def format(self, indent=0):
+        """Return the span tree as indented text, one span per line."""
+        duration = self.duration
+        if duration is None:
+            duration = time.perf_counter() - self.start
+        attributes = ' '.join(
+            '{0}={1}'.format(x, y) for x, y in self.attributes.items()
+            )
+        line = '{0}{1} {2:.1f} ms'.format('  ' * indent, self.name, duration * 1000)
+        if self.kind != 'http':
+            line += ' ({0} requests)'.format(self.roundTrips)
+        if attributes:
+            line += ' ' + attributes
+        return '\n'.join(
+            [line] + [x.format(indent + 1) for x in self.children]
+            )
+
+    def __repr__(self):
+        return '<Span {0} {1}>'.format(self.name, self.attributes)
+
+
+def tracing():
+    """Return True if spans are recorded in the current context."""
+    return (
+        _current.get() is not None or roundTripBudget() is not None
+        or otelEnabled()
+        )
+
+
+@contextmanager
+def span(name, kind='operation', **attributes):
+    """Record a span nested in the current one, yields None if not tracing.
+
+    Spans are kept in a context variable, so they follow the calling
+    thread but not the background threads of prefetching and write-back.
+    With SEAFILE_TRACE_OTEL=True, each span is also exported as an
+    OpenTelemetry span.
+    """
+    if kind != 'trace' and not tracing():
+        yield None
+        return
+    parent = _current.get()
+    current = Span(name, kind, parent, attributes)
+    tracer = otelTracer() if otelEnabled() else None
+    token = _current.set(current)
+    try:
+        if tracer is None:
+            yield current
+        else:
+            with tracer.start_as_current_span(name) as otelSpan:
+                try:
+                    yield current
+                finally:
+                    for key, value in current.attributes.items():
+                        if value is not None:
+                            otelSpan.set_attribute('seafile.' + key, value)
+    finally:
+        current.duration = time.perf_counter() - current.start
+        _current.reset(token)
+        if kind == 'operation' and (parent is None or parent.kind != 'operation'):
+            checkBudget(current)
+
+
+def checkBudget(current):
+    """Log an outermost operation that made more requests than budgeted."""
+    budget = roundTripBudget()
+    if budget is not None and current.roundTrips > budget:
+        log.warning(
+            'Seafile operation exceeded the budget of %s requests:\n%s',
+            budget, current.format()
+            )
+
+
+@contextmanager
+def trace(name='trace'):
+    """Record all operations and requests made in this context.
+
+    Yields the root span, which holds the spans of the operations and
+    their requests when the context is left:
+
+        with trace() as root:
+            fs.open('/notes.txt').read()
+        print(root.format())
+    """
+    with span(name, 'trace') as root:
+        yield root
+
+
+def traced(func):
+    """Record calls of a method as operation spans named Class.method.
+
+    The path argument of the call, if any, is kept as attribute.
+    """
+    signature = inspect.signature(func)
+    pathArg = next(
+        (x for x in ('path', 'old_path', 'remote', 'pattern')
+         if x in signature.parameters),
+        None
+        )
+
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        if not tracing():
+            return func(self, *args, **kwargs)
+        name = '{0}.{1}'.format(type(self).__name__, func.__name__)
+        attributes = {}
+        if pathArg is not None:
+            bound = signature.bind_partial(self, *args, **kwargs)
+            attributes['path'] = bound.arguments.get(pathArg)
+        with span(name, 'operation', **attributes):
+            return func(self, *args, **kwargs)
+    return wrapper
@@ -0,0 +1,173 @@
+#! python3
+# -*- coding: utf-8 -*-
+import json
+import os
+
+
+class RequestsTransport(object):
+    """HTTP/1.1 transport on a pooled requests session.
+
+    Every request in flight takes a connection of the pool of up to
+    maxConnections connections.
+    """
+
+    def __init__(self, maxConnections):
+        import requests
+        from requests.adapters import HTTPAdapter
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=maxConnections)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def request(self, method, url, **kwargs):
+        return self.session.request(method, url, **kwargs)
+
+    def close(self):
+        self.session.close()
+
+
+class HttpxResponse(object):
+    """An httpx response with the parts of the requests API used here."""
+
+    def __init__(self, response):
+        self.response = response
+        self.encoding = None
+
+    @property
+    def status_code(self):
+        return self.response.status_code
+
+    @property
+    def headers(self):
+        return self.response.headers
+
+    @property
+    def url(self):
+        return str(self.response.url)
+
+    @property
+    def reason(self):
+        return self.response.reason_phrase
+
+    @property
+    def ok(self):
+        return self.status_code < 400
+
+    @property
+    def content(self):
+        return self.response.read()
+
+    @property
+    def apparent_encoding(self):
+        return self.response.encoding or 'utf-8'
+
+    @property
+    def text(self):
+        return self.content.decode(
+            self.encoding or self.apparent_encoding, errors='replace'
+            )
+
+    def json(self):
+        return json.loads(self.text)
+
+    def iter_content(self, chunkSize=1):
+        return self.response.iter_bytes(chunkSize)
+
+    def raise_for_status(self):
+        """Raise requests.HTTPError for error responses, like requests."""
+        if not self.ok:
+            from requests import HTTPError
+            raise HTTPError('{0} {1} for url: {2}'.format(
+                self.status_code, self.reason, self.url
+                ), response=self)
+
+    def close(self):
+        self.response.close()
+
+
+class HttpxTransport(object):
+    """HTTP/2 transport, needs httpx with the http2 extra.
+
+    Concurrent requests to a host are multiplexed over one connection if
+    the server supports HTTP/2, otherwise up to maxConnections HTTP/1.1
+    connections are used. Takes the keyword arguments of requests, except
+    proxies, verify, cert and hooks, which httpx only sets per client.
+    """
+
+    def __init__(self, maxConnections):
+        import httpx
+        self.client = httpx.Client(
+            http2=True, follow_redirects=True, timeout=None,
+            limits=httpx.Limits(
+                max_connections=maxConnections,
+                max_keepalive_connections=maxConnections
+                )
+            )
+
+    # keyword arguments of requests that are set on the client in httpx
+    unsupported = ('proxies', 'verify', 'cert', 'hooks')
+
+    def request(self, method, url, headers=None, data=None, files=None,
+                params=None, stream=False, json=None, cookies=None,
+                timeout=None, allow_redirects=True, auth=None, **kwargs):
+        if kwargs:
+            names = ', '.join(sorted(kwargs))
+            if set(kwargs) - set(self.unsupported):
+                raise TypeError('Unknown request arguments ' + names)
+            raise TypeError(
+                'The httpx transport does not support ' + names +
+                ' per request'
+                )
+        headers = dict(headers or {})
+        kwargs = {'headers': headers, 'params': params, 'cookies': cookies}
+        if timeout is not None:
+            kwargs['timeout'] = timeout
+        if files is not None or isinstance(data, dict):
+            kwargs['data'] = data
+            kwargs['files'] = files
+        elif isinstance(data, (bytes, str)):
+            kwargs['content'] = data
+        elif data is not None:
+            # streamed bodies like MultipartStream, which know their length
+            if hasattr(data, '__len__'):
+                headers.setdefault('Content-Length', str(len(data)))
+            kwargs['content'] = (bytes(x) for x in data)
+        elif json is not None:
+            kwargs['json'] = json
+        request = self.client.build_request(method, url, **kwargs)
+        sendArgs = {'stream': stream, 'follow_redirects': allow_redirects}
+        if auth is not None:
+            sendArgs['auth'] = auth
+        return HttpxResponse(self.client.send(request, **sendArgs))
+
+    def close(self):
+        self.client.close()
+
+
+_factories = {
+    'requests': RequestsTransport,
+    'httpx': HttpxTransport,
+    }
+
+
+def registerTransport(name, factory):
+    """Make a transport selectable by SEAFILE_HTTP_TRANSPORT.
+
+    factory is called with the maximum number of connections and returns
+    an object with request(method, url, **kwargs), taking the keyword
+    arguments of requests and returning a requests like response, and
+    close().
+    """
+    _factories[name] = factory
+
+
+def createTransport(maxConnections):
+    """Create the transport named in SEAFILE_HTTP_TRANSPORT, requests by default."""
+    name = os.environ.get('SEAFILE_HTTP_TRANSPORT', 'requests')
+    try:
+        factory = _factories[name]
+    except KeyError:
+        raise ValueError('Unknown SEAFILE_HTTP_TRANSPORT {0}, use one of {1}'.format(
+            name, ', '.join(sorted(_factories))
+            ))
+    return factory(maxConnections)
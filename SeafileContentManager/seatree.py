@@ -0,0 +1,180 @@
+#! python3
+# -*- coding: utf-8 -*-
+import fnmatch
+import os
+import re
+
+from .seacache import normPath
+
+
+def globToRegex(pattern):
+    """Translate a glob pattern on normalized paths to a regular expression.
+
+    * and ? do not match slashes, a path element ** matches any number of
+    folders including none.
+    """
+    parts = normPath(pattern).split('/')[1:]
+    regex = ''
+    for number, part in enumerate(parts):
+        last = number == len(parts) - 1
+        if part == '**':
+            regex += '(?:/[^/]+)*' if last else '(?:/[^/]+)*?'
+            continue
+        regex += '/'
+        pos = 0
+        while pos < len(part):
+            char = part[pos]
+            if char == '*':
+                regex += '[^/]*'
+            elif char == '?':
+                regex += '[^/]'
+            elif char == '[':
+                end = part.find(']', pos + 2)
+                if end < 0:
+                    regex += re.escape(char)
+                else:
+                    inner = part[pos + 1:end]
+                    if inner.startswith('!'):
+                        inner = '^' + inner[1:]
+                    regex += '[' + inner.replace('\\', '\\\\') + ']'
+                    pos = end
+            else:
+                regex += re.escape(char)
+            pos += 1
+    return re.compile('(?s:' + (regex or '/') + r')\Z')
+
+
+def literalPrefix(pattern):
+    """Return the folder of pattern before its first wildcard."""
+    parts = normPath(pattern).split('/')[1:]
+    literal = []
+    for part in parts[:-1]:
+        if any(x in part for x in '*?['):
+            break
+        literal.append(part)
+    return normPath('/'.join(literal))
+
+
+class TreeSnapshot(object):
+    """All folders and files below root, from one recursive listing.
+
+    epoch is the tree epoch of the library caches the snapshot was last
+    known to be current in.
+    """
+
+    def __init__(self, root, entries, epoch=0):
+        self.root = normPath(root)
+        self.epoch = epoch
+        self.children = {self.root: []}
+        for entry in entries:
+            parent = normPath(entry.parent)
+            self.children.setdefault(parent, []).append(entry)
+            if entry.type == 'dir':
+                self.children.setdefault(normPath(entry.path), [])
+
+    def __len__(self):
+        return sum(len(x) for x in self.children.values())
+
+    def walk(self, path, maxdepth=None):
+        """Yield (path, entry) of everything below path, depth first."""
+        path = normPath(path)
+        stack = [(path, 1)]
+        while stack:
+            folder, depth = stack.pop()
+            for entry in self.children.get(folder, []):
+                child = normPath(entry.path)
+                yield child, entry
+                if entry.type == 'dir' and (maxdepth is None or depth < maxdepth):
+                    stack.append((child, depth + 1))
+
+    def isdir(self, path):
+        return normPath(path) in self.children
+
+    def matches(self, files):
+        """Check if files, a new listing of root, leave the tree unchanged.
+
+        Folder IDs are hashes over everything below a folder, so the tree
+        is unchanged if the IDs of all entries of its root are.
+        """
+        def ids(entries):
+            return sorted((x['name'], x['type'], x.get('id')) for x in entries)
+        return ids(files) == ids(self.children[self.root])
+
+
+def treeFor(client, path):
+    """Return a tree snapshot containing path, None if path is no folder.
+
+    Snapshots are kept in the library caches and reused for all folders
+    below their root. They are validated by the library's head commit,
+    checked at most every SEAFILE_HEAD_CHECK_INTERVAL seconds or, if that
+    is not set, every SEAFILE_TREE_CHECK_INTERVAL seconds. Where the head
+    commit or its changes are not available, a snapshot is checked after
+    each check with one listing of its root, see TreeSnapshot.matches.
+    """
+    path = normPath(path)
+    caches = client.caches
+    interval = caches.headInterval
+    if interval is None:
+        interval = float(os.environ.get('SEAFILE_TREE_CHECK_INTERVAL', 2))
+    caches.validate(client, interval)
+    epoch = caches.treeEpoch
+    for root in caches.trees.keys():
+        if path == root or root == '/' or path.startswith(root + '/'):
+            snapshot = caches.trees.get(root)
+            if snapshot is None:
+                continue
+            if snapshot.epoch != epoch:
+                files = client.fetchDirEntries(root)
+                if files is None or not snapshot.matches(files):
+                    caches.trees.pop(root)
+                    continue
+                snapshot.epoch = epoch
+            return snapshot if snapshot.isdir(path) else None
+    try:
+        snapshot = TreeSnapshot(path, client.walkTree(path), epoch)
+    except FileNotFoundError:
+        return None
+    caches.trees.put(path, snapshot)
+    caches.putTree(path, snapshot.children)
+    return snapshot
+
+
+def globTree(client, pattern):
+    """Return sorted paths below the pattern's folder matching pattern."""
+    if not any(x in pattern for x in '*?['):
+        entry = client.statPath(pattern)
+        return [pattern] if entry is not None else []
+    regex = globToRegex(pattern)
+    root = literalPrefix(pattern)
+    snapshot = treeFor(client, root)
+    if snapshot is None:
+        return []
+    maxdepth = None
+    if '**' not in pattern:
+        maxdepth = normPath(pattern).count('/') - (
+            root.count('/') if root != '/' else 0
+            )
+    hits = sorted(
+        x for x, y in snapshot.walk(root, maxdepth) if regex.match(x)
+        )
+    if not pattern.startswith('/'):
+        hits = [x.lstrip('/') for x in hits]
+    return hits
+
+
+def findTree(client, path='/', name=None, type=None, maxdepth=None):
+    """Return sorted paths below path, like the find command line tool."""
+    snapshot = treeFor(client, path)
+    if snapshot is None:
+        return []
+    hits = []
+    for child, entry in snapshot.walk(path, maxdepth):
+        if type is not None and entry.type != type:
+            continue
+        if name is not None and not fnmatch.fnmatchcase(entry.name, name):
+            continue
+        hits.append(child)
+    hits.sort()
+    if not path.startswith('/'):
+        hits = [x.lstrip('/') for x in hits]
+    return hits
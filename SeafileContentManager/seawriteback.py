@@ -0,0 +1,296 @@
+#! python3
+# -*- coding: utf-8 -*-
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+from . import seahttp
+from .seacache import libraryKey, normPath, splitPath
+from .seafilemixin import ensureBase
+
+log = logging.getLogger(__name__)
+
+
+def writeBackEnabled():
+    return os.environ.get('SEAFILE_WRITE_BACK', False) == 'True'
+
+
+def retryable(error):
+    """Return whether a failed upload may succeed when retried."""
+    status = getattr(error, 'status_code', None)
+    if status is None:
+        # connection errors and the like
+        return True
+    return status >= 500 or status in (408, 429)
+
+
+class WriteBack(object):
+    """Local mirror and journal for saves, uploaded in the background.
+
+    A save writes the content to a file in the mirror folder and appends a
+    record to the journal, both synced to disk, and returns. A background
+    thread uploads pending paths one at a time, in the order they were
+    first saved. Saves to a path that is still pending replace the
+    pending content, so bursts of saves result in one upload. Before
+    uploading, the file ID on the server is compared to the one the save
+    was based on. If somebody else changed the file in between, the
+    content is uploaded next to it as a conflict copy.
+
+    Failed uploads are queued again behind the other pending paths, with
+    exponential backoff. Statuses that will not change on a retry, like a
+    403 or an exceeded quota, are not retried. The failure is raised as
+    IOError by the next save or read of the path.
+
+    Records without a matching 'done' record are replayed on restart.
+    """
+
+    def __init__(self, manager):
+        self.manager = manager
+        key = hashlib.sha1(
+            '|'.join(libraryKey(manager)).encode()
+            ).hexdigest()
+        self.mirrorDir = os.path.join(ensureBase() + 'mirror', key)
+        os.makedirs(self.mirrorDir, mode=0o700, exist_ok=True)
+        self.journalPath = os.path.join(self.mirrorDir, 'journal')
+        self.seq = 0
+        self.pending = OrderedDict()
+        self.inFlight = {}
+        self.knownIDs = {}
+        self.failures = {}
+        self.cond = threading.Condition()
+        self.replay()
+        self.worker = threading.Thread(
+            target=self.run, name='seafile-writeback', daemon=True
+            )
+        self.worker.start()
+
+    def mirrorFile(self, path):
+        return os.path.join(
+            self.mirrorDir, hashlib.sha1(path.encode('utf-8')).hexdigest()
+            )
+
+    def appendJournal(self, record):
+        with open(self.journalPath, 'a') as file:
+            file.write(json.dumps(record) + '\n')
+            file.flush()
+            os.fsync(file.fileno())
+
+    def replay(self):
+        """Re-queue saves from the journal which were not uploaded yet."""
+        try:
+            with open(self.journalPath, 'r') as file:
+                lines = file.readlines()
+        except FileNotFoundError:
+            return
+        records = OrderedDict()
+        for line in lines:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # torn last line after a crash
+                continue
+            self.seq = max(self.seq, record['seq'])
+            if record['op'] == 'put':
+                records[record['seq']] = record
+            elif record['op'] == 'done':
+                records.pop(record['seq'], None)
+        for record in records.values():
+            if os.path.exists(self.mirrorFile(record['path'])):
+                self.pending.pop(record['path'], None)
+                self.pending[record['path']] = record
+        if self.pending:
+            log.info('Replaying %d pending saves', len(self.pending))
+        else:
+            os.remove(self.journalPath)
+
+    def save(self, path, data, replace=True):
+        """Store content in the mirror and queue it for upload."""
+        path = normPath(path)
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        with self.cond:
+            self.raiseFailure(path)
+            busy = self.pending.get(path) or self.inFlight.get(path)
+            if busy is not None:
+                base = busy['base']
+            else:
+                base = self.knownIDs.get(path)
+        if base is None and busy is None:
+            entry = self.manager.statPath(path)
+            base = entry.get('id') if entry else None
+        with self.cond:
+            # the worker removes the mirror file of a path under the
+            # lock once it is no longer pending, so write it under the
+            # lock as well
+            target = self.mirrorFile(path)
+            with open(target + '.tmp', 'wb') as file:
+                file.write(data)
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(target + '.tmp', target)
+            self.seq += 1
+            record = {
+                'seq': self.seq, 'op': 'put', 'path': path,
+                'base': base, 'replace': 1 if replace else 0,
+                'time': time.time()
+                }
+            self.appendJournal(record)
+            if path not in self.pending:
+                self.pending[path] = record
+            else:
+                # coalesce, keep queue position of the first save
+                self.appendJournal({'seq': self.pending[path]['seq'], 'op': 'done'})
+                self.pending[path] = record
+            self.cond.notify()
+        return record
+
+    def read(self, path):
+        """Return (bytes, mtime) of a pending save, None if there is none."""
+        path = normPath(path)
+        with self.cond:
+            self.raiseFailure(path)
+            record = self.pending.get(path) or self.inFlight.get(path)
+            if record is None:
+                return None
+            try:
+                with open(self.mirrorFile(path), 'rb') as file:
+                    return (file.read(), record['time'])
+            except FileNotFoundError:
+                return None
+
+    def raiseFailure(self, path):
+        """Raise a failed upload of path once, called with the lock."""
+        failure = self.failures.pop(path, None)
+        if failure is not None:
+            raise IOError(
+                'Upload of {0} failed and is not retried: {1}'.format(
+                    path, failure
+                    )
+                )
+
+    def pendingIn(self, dirPath):
+        """Return pending paths directly inside a folder."""
+        dirPath = normPath(dirPath)
+        with self.cond:
+            paths = list(self.pending) + list(self.inFlight)
+        return [x for x in set(paths) if splitPath(x)[0] == dirPath]
+
+    def isPending(self, path):
+        path = normPath(path)
+        with self.cond:
+            return path in self.pending or path in self.inFlight
+
+    def wait(self, path=None, timeout=None):
+        """Block until a path, or all paths, are uploaded."""
+        end = None if timeout is None else time.monotonic() + timeout
+        with self.cond:
+            while True:
+                if path is None:
+                    busy = self.pending or self.inFlight
+                else:
+                    busy = self.isPending(path)
+                if not busy:
+                    return True
+                remaining = None if end is None else end - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self.cond.wait(remaining)
+
+    def run(self):
+        with seahttp.priority(seahttp.BACKGROUND):
+            self.serve()
+
+    def serve(self):
+        backoff = 1
+        while True:
+            with self.cond:
+                while not self.pending:
+                    self.cond.wait()
+                path, record = self.pending.popitem(last=False)
+                self.inFlight[path] = record
+            try:
+                with open(self.mirrorFile(path), 'rb') as file:
+                    data = file.read()
+                self.upload(path, record, data)
+            except Exception as e:
+                if retryable(e):
+                    log.warning('Upload of %s failed, retrying: %s', path, e)
+                    with self.cond:
+                        del self.inFlight[path]
+                        if path not in self.pending:
+                            self.pending[path] = record
+                        self.cond.notify_all()
+                    time.sleep(backoff)
+                    backoff = min(backoff * 2, 60)
+                    continue
+                log.error('Upload of %s failed, not retrying: %s', path, e)
+                with self.cond:
+                    if path not in self.pending:
+                        self.failures[path] = e
+                    self.finish(path, record)
+                continue
+            backoff = 1
+            with self.cond:
+                self.finish(path, record)
+
+    def finish(self, path, record):
+        """Drop an uploaded or failed save, called with the lock."""
+        del self.inFlight[path]
+        self.appendJournal({'seq': record['seq'], 'op': 'done'})
+        if path not in self.pending:
+            try:
+                os.remove(self.mirrorFile(path))
+            except FileNotFoundError:
+                pass
+        if not self.pending and not self.inFlight:
+            os.remove(self.journalPath)
+        self.cond.notify_all()
+
+    def upload(self, path, record, data):
+        manager = self.manager
+        if manager.isUnchanged(path, data):
+            return
+        manager.caches.invalidate(path)
+        entry = manager.statPath(path)
+        serverID = entry.get('id') if entry else None
+        known = self.knownIDs.get(path)
+        parent, name = splitPath(path)
+        if record['base'] and serverID not in (None, record['base'], known):
+            stem, dot, ext = name.rpartition('.')
+            if not dot:
+                stem, ext = name, ''
+            name = '{0} (conflict {1}){2}{3}'.format(
+                stem, datetime.now().strftime('%Y-%m-%d %H-%M-%S'), dot, ext
+                )
+            log.warning('%s changed on the server, saving as %s', path, name)
+        res = manager.fileUpload(
+            name, parent.rstrip('/') + '/', data,
+            replace=bool(record['replace'])
+            )
+        if res.status_code != 200:
+            error = IOError('Upload returned {0}: {1}'.format(
+                res.status_code, res.text[:200]
+                ))
+            error.status_code = res.status_code
+            raise error
+        if name == splitPath(path)[1]:
+            entry = manager.statPath(path)
+            self.knownIDs[path] = entry.get('id') if entry else None
+
+
+_writeBacks = {}
+_registryLock = threading.Lock()
+
+
+def writeBackFor(manager):
+    """Return the write-back queue of the manager's library."""
+    key = libraryKey(manager)
+    with _registryLock:
+        if key not in _writeBacks:
+            _writeBacks[key] = WriteBack(manager)
+        return _writeBacks[key]
@@ -0,0 +1,501 @@
+# coding: utf-8
+"""A local stand-in for the Seafile API, keeping libraries in memory.
+
+Implements the calls made by the clients of this package: listings,
+file details, downloads with ranges, single, batch and resumable
+uploads, folder and file operations, deletes, zip downloads, library
+lists and the head commit, history and commit changes of a library.
+Every change of a library is recorded as a commit. Requests are logged
+in server.requests, server.throttle holds (method, path) pairs
+answered once with 429, server.refuse maps (method, path) pairs to a
+status they are answered with and server.delay slows down transfers.
+"""
+import email
+import hashlib
+import io
+import itertools
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+import zipfile
+from email import policy
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, quote, unquote, urlparse
+
+try:
+    import requests
+except ImportError:
+    requests = None
+
+_commitNumbers = itertools.count(1)
+
+
+def sha1(data):
+    return hashlib.sha1(data).hexdigest()
+
+
+class Library(object):
+    """Files and folders of one library, with a commit per change."""
+
+    def __init__(self, libraryID, name):
+        self.id = libraryID
+        self.name = name
+        self.files = {}
+        self.dirs = set()
+        self.mtimes = {}
+        self.uploads = []
+        self.partial = {}
+        # newest first, with the changes of each commit
+        self.commits = []
+        self.changes = {}
+        self.heads = True
+        self.lock = threading.RLock()
+        self.commit()
+
+    @property
+    def head(self):
+        return self.commits[0]
+
+    def commit(self, **changes):
+        commitID = '{0:040x}'.format(next(_commitNumbers))
+        self.commits.insert(0, commitID)
+        self.changes[commitID] = changes
+        return commitID
+
+    def exists(self, path):
+        return path in self.files or path in self.dirs or path == ''
+
+    def write(self, path, data, mtime=None):
+        """Create or change a file, as another client would."""
+        with self.lock:
+            existed = path in self.files
+            parent = path.rsplit('/', 1)[0]
+            while parent and parent not in self.dirs:
+                self.dirs.add(parent)
+                parent = parent.rsplit('/', 1)[0]
+            self.files[path] = data
+            self.mtimes[path] = int(time.time()) if mtime is None else mtime
+            key = 'modified_files' if existed else 'added_files'
+            self.commit(**{key: [path]})
+
+    def mkdir(self, path):
+        with self.lock:
+            self.dirs.add(path)
+            self.commit(added_dirs=[path])
+
+    def remove(self, path):
+        with self.lock:
+            isDir = path in self.dirs
+            for key in [x for x in self.files
+                        if x == path or x.startswith(path + '/')]:
+                del self.files[key]
+            self.dirs = {
+                x for x in self.dirs
+                if x != path and not x.startswith(path + '/')
+                }
+            self.commit(**{'deleted_dirs' if isDir else 'deleted_files': [path]})
+
+    def move(self, old, new):
+        with self.lock:
+            isDir = old in self.dirs
+            for key in [x for x in self.files
+                        if x == old or x.startswith(old + '/')]:
+                self.files[new + key[len(old):]] = self.files.pop(key)
+                self.mtimes[new + key[len(old):]] = self.mtimes.pop(key)
+            for key in [x for x in self.dirs
+                        if x == old or x.startswith(old + '/')]:
+                self.dirs.discard(key)
+                self.dirs.add(new + key[len(old):])
+            self.commit(**{'renamed_dirs' if isDir else 'renamed_files': [old, new]})
+
+    def children(self, folder, recursive=False):
+        prefix = folder.rstrip('/') + '/'
+        paths = sorted(x for x in set(self.files) | self.dirs
+                       if x.startswith(prefix))
+        if not recursive:
+            paths = [x for x in paths if '/' not in x[len(prefix):]]
+        return paths
+
+    def dirID(self, path):
+        """ID of a folder, which changes with everything below it."""
+        return sha1(json.dumps([
+            (x, sha1(self.files[x]) if x in self.files else 'dir')
+            for x in self.children(path, recursive=True)
+            ]).encode() + path.encode())
+
+    def entry(self, path):
+        parent, name = path.rsplit('/', 1)
+        if path in self.dirs:
+            return {'name': name, 'type': 'dir', 'parent_dir': parent or '/',
+                    'mtime': 0, 'permission': 'rw', 'id': self.dirID(path)}
+        data = self.files[path]
+        return {'name': name, 'type': 'file', 'parent_dir': parent or '/',
+                'size': len(data), 'mtime': self.mtimes.get(path, 0),
+                'permission': 'rw', 'id': sha1(data)}
+
+    def zip(self, parent, dirents):
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, 'w') as archive:
+            for name in dirents:
+                path = parent.rstrip('/') + '/' + name
+                for member in [path] + self.children(path, recursive=True):
+                    name = member[len(parent.rstrip('/')) + 1:]
+                    if member in self.files:
+                        archive.writestr(name, self.files[member])
+                    else:
+                        archive.writestr(name + '/', b'')
+        return buffer.getvalue()
+
+
+class LibraryHandler(BaseHTTPRequestHandler):
+    """Seafile API calls on the libraries in server.libraries."""
+
+    def log_message(self, *args):
+        pass
+
+    def reply(self, status, data, headers=()):
+        body = data if isinstance(data, bytes) else json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for key, value in headers:
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    @property
+    def base(self):
+        return 'http://{0}:{1}'.format(*self.server.server_address)
+
+    def parse(self):
+        url = urlparse(self.path)
+        query = {x: y[0] for x, y in parse_qs(url.query).items()}
+        self.server.requests.append((self.command, url.path, query))
+        return url, query
+
+    @staticmethod
+    def target(query):
+        """Path in p, with a leading slash like Seafile, '' for the root."""
+        return ('/' + query.get('p', '').strip('/')).rstrip('/')
+
+    def throttled(self, url):
+        key = (self.command, url.path)
+        if key in self.server.throttle:
+            self.server.throttle.discard(key)
+            self.reply(429, {}, [('Retry-After', '0')])
+            return True
+        if key in self.server.refuse:
+            self.reply(self.server.refuse[key], {'error_msg': 'refused'})
+            return True
+        return False
+
+    def library(self, path):
+        """Return the library and the API path below it, or None."""
+        match = re.match(r'/api2/repos/([^/]+)(/.*)$', path) or \
+            re.match(r'/api/v2\.1/repos/([^/]+)(/.*)$', path)
+        if match:
+            library = self.server.libraries.get(match.group(1))
+            return (library, match.group(2)) if library else (None, None)
+        if path.startswith('/api/v2.1/via-repo-token/'):
+            library = list(self.server.libraries.values())[0]
+            return library, path[len('/api/v2.1/via-repo-token'):]
+        return None, None
+
+    def body(self):
+        return self.rfile.read(int(self.headers['Content-Length'] or 0))
+
+    def form(self, body):
+        if self.headers['Content-Type'].startswith('multipart/'):
+            message = email.message_from_bytes(
+                b'Content-Type: ' + self.headers['Content-Type'].encode() +
+                b'\r\n\r\n' + body, policy=policy.HTTP
+                )
+            fields, files = {}, []
+            for part in message.iter_parts():
+                name = part.get_param('name', header='content-disposition')
+                data = part.get_payload(decode=True)
+                if part.get_filename() is not None:
+                    files.append((part.get_filename(), data))
+                else:
+                    fields[name] = data.decode()
+            return fields, files
+        return {x: y[0] for x, y in parse_qs(body.decode()).items()}, []
+
+    def do_GET(self):
+        url, query = self.parse()
+        if self.throttled(url):
+            return
+        if url.path in ('/api2/server-info/', '/api2/server-info'):
+            return self.reply(200, {'version': '9.0.0'})
+        if url.path == '/api2/auth/ping/':
+            return self.reply(200, 'pong')
+        if url.path == '/api2/repos/':
+            return self.reply(200, [
+                {'id': x.id, 'name': x.name, 'mtime': 0, 'permission': 'rw',
+                 'size': sum(len(y) for y in x.files.values()),
+                 'encrypted': False}
+                for x in self.server.libraries.values()
+                ])
+        if url.path.startswith('/seafhttp/files/'):
+            return self.download(url)
+        if url.path.startswith('/seafhttp/zip/'):
+            data = self.server.zips.pop(url.path.rsplit('/', 1)[1], None)
+            if data is None:
+                return self.reply(404, {})
+            return self.reply(200, data)
+        if url.path == '/api/v2.1/query-zip-progress/':
+            return self.reply(200, {'zipped': 1, 'total': 1})
+        match = re.match(r'/api2/repo_history_changes/([^/]+)/$', url.path)
+        if match:
+            library = self.server.libraries[match.group(1)]
+            changes = library.changes.get(query['commit_id'])
+            if changes is None:
+                return self.reply(404, {})
+            return self.reply(200, changes)
+        library, api = self.library(url.path)
+        if library is None:
+            return self.reply(404, {'error_msg': 'Library not found.'})
+        with library.lock:
+            return self.libraryGET(library, api, url, query)
+
+    def libraryGET(self, library, api, url, query):
+        path = self.target(query)
+        if api == '/':
+            if not library.heads:
+                return self.reply(404, {})
+            return self.reply(200, {
+                'repo_id': library.id, 'repo_name': library.name,
+                'head_commit_id': library.head
+                })
+        if api == '/history/':
+            return self.reply(200, {
+                'data': [{'commit_id': x} for x in library.commits],
+                'more': False
+                })
+        if api == '/dir/':
+            if path and path not in library.dirs:
+                return self.reply(404, {'error_msg': 'Folder not found.'})
+            paths = library.children(path, query.get('recursive') == '1')
+            return self.reply(
+                200, [library.entry(x) for x in paths],
+                [('oid', library.dirID(path))]
+                )
+        if api == '/file/detail/':
+            if path not in library.files:
+                return self.reply(404, {'error_msg': 'File not found.'})
+            return self.reply(200, library.entry(path))
+        if api == '/file/':
+            if path not in library.files:
+                return self.reply(404, {'error_msg': 'File not found.'})
+            return self.reply(200, '{0}/seafhttp/files/{1}{2}'.format(
+                self.base, library.id, quote(path)
+                ))
+        if api in ('/upload-link/', '/update-link/'):
+            return self.reply(
+                200, '{0}/seafhttp/upload-api/{1}'.format(self.base, library.id)
+                )
+        if api == '/zip-task/':
+            token = sha1(os.urandom(8))
+            dirents = query['dirents']
+            if isinstance(dirents, str):
+                dirents = parse_qs(url.query)['dirents']
+            self.server.zips[token] = library.zip(query['parent_dir'], dirents)
+            return self.reply(200, {'zip_token': token})
+        self.reply(404, {})
+
+    def download(self, url):
+        libraryID, _, path = url.path[len('/seafhttp/files/'):].partition('/')
+        library = self.server.libraries[libraryID]
+        data = library.files.get('/' + unquote(path))
+        if data is None:
+            return self.reply(404, {})
+        time.sleep(self.server.delay)
+        match = re.match(r'bytes=(\d*)-(\d*)', self.headers['Range'] or '')
+        status = 200
+        if match:
+            start = int(match.group(1) or 0)
+            end = int(match.group(2)) + 1 if match.group(2) else len(data)
+            data = data[start:end]
+            status = 206
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        url, query = self.parse()
+        body = self.body()
+        if self.throttled(url):
+            return
+        if url.path == '/api2/repos/':
+            fields = self.form(body)[0]
+            libraryID = sha1(fields['name'].encode())[:36]
+            self.server.libraries[libraryID] = Library(libraryID, fields['name'])
+            return self.reply(200, {'repo_id': libraryID})
+        if url.path.startswith('/seafhttp/upload-api/'):
+            library = self.server.libraries[url.path.rsplit('/', 1)[1]]
+            time.sleep(self.server.delay)
+            with library.lock:
+                return self.upload(library, url, body)
+        library, api = self.library(url.path)
+        if library is None:
+            return self.reply(404, {'error_msg': 'Library not found.'})
+        fields = self.form(body)[0]
+        if api == '/' and query.get('op') == 'rename':
+            library.name = fields['repo_name']
+            return self.reply(200, 'success')
+        path = self.target(query)
+        operation = fields.get('operation')
+        with library.lock:
+            if operation == 'mkdir':
+                library.mkdir(path)
+                return self.reply(201, 'success')
+            if operation == 'create':
+                library.write(path, b'')
+                return self.reply(201, 'success')
+            if not library.exists(path):
+                return self.reply(404, {'error_msg': 'File not found.'})
+            if operation == 'rename':
+                new = path.rsplit('/', 1)[0] + '/' + fields['newname']
+                library.move(path, new)
+                return self.reply(200, 'success')
+            if operation == 'move':
+                target = self.server.libraries[fields['dst_repo'] or library.id]
+                new = fields['dst_dir'].rstrip('/') + '/' + path.rsplit('/', 1)[1]
+                if target is library:
+                    library.move(path, new)
+                else:
+                    for key in [path] + library.children(path, True):
+                        if key in library.files:
+                            target.write(new + key[len(path):], library.files[key])
+                        else:
+                            target.mkdir(new + key[len(path):])
+                    library.remove(path)
+                return self.reply(301, 'success')
+        self.reply(400, {'error_msg': 'Unknown operation.'})
+
+    def upload(self, library, url, body):
+        fields, uploaded = self.form(body)
+        parent = fields['parent_dir'].rstrip('/')
+        contentRange = self.headers['Content-Range']
+        if contentRange:
+            start, end, total = map(int, re.match(
+                r'bytes (\d+)-(\d+)/(\d+)', contentRange
+                ).groups())
+            filename, data = uploaded[0]
+            key = parent + '/' + filename
+            stored = library.partial.get(key, b'')
+            if start != len(stored):
+                return self.reply(400, {'error_msg': 'Bad range.'})
+            library.partial[key] = stored + data
+            if end + 1 < total:
+                return self.reply(200, {'success': True})
+            uploaded = [(filename, library.partial.pop(key))]
+        results = []
+        for filename, data in uploaded:
+            path = parent + '/' + filename
+            if fields.get('replace') == '0' and path in library.files:
+                stem, dot, ext = filename.partition('.')
+                filename = '{0} (1){1}{2}'.format(stem, dot, ext)
+                path = parent + '/' + filename
+            library.write(path, data)
+            library.uploads.append(path)
+            results.append({'name': filename, 'size': len(data),
+                            'id': sha1(data)})
+        if 'ret-json=1' in url.query:
+            return self.reply(200, results)
+        self.reply(200, results[0]['id'].encode())
+
+    def do_DELETE(self):
+        url, query = self.parse()
+        if self.throttled(url):
+            return
+        library, api = self.library(url.path)
+        if library is None:
+            return self.reply(404, {'error_msg': 'Library not found.'})
+        path = self.target(query)
+        with library.lock:
+            if library.exists(path):
+                library.remove(path)
+        self.reply(200, 'success')
+
+
+class StandInServer(ThreadingHTTPServer):
+    """Stand-in server with one library, LIB named lib, to begin with."""
+
+    daemon_threads = True
+
+    def reset(self):
+        self.libraries = {'LIB': Library('LIB', 'lib')}
+        self.requests = []
+        self.throttle = set()
+        self.refuse = {}
+        self.zips = {}
+        # seconds each download and upload takes
+        self.delay = 0
+
+    @property
+    def url(self):
+        return 'http://{0}:{1}'.format(*self.server_address)
+
+    @property
+    def lib(self):
+        return self.libraries['LIB']
+
+    def count(self, method, api, path=None):
+        """Number of requests of a method on an API path of LIB."""
+        return sum(
+            1 for x, y, z in self.requests
+            if x == method and y.endswith(api) and
+            (path is None or LibraryHandler.target(z) == path.rstrip('/'))
+            )
+
+
+class StandInCase(object):
+    """Mixin for TestCase running against a shared stand-in server.
+
+    Each test gets empty libraries, its own token, so no caches are
+    shared with other tests, its own settings dir and environment.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = StandInServer(('127.0.0.1', 0), LibraryHandler)
+        cls.thread = threading.Thread(target=cls.server.serve_forever, daemon=True)
+        cls.thread.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        from SeafileContentManager import seafilemixin, seahttp
+        self.server.reset()
+        self.environ = dict(os.environ)
+        self.addCleanup(self.restoreEnviron)
+        self.base = seafilemixin.BASE
+        seafilemixin.BASE = tempfile.mkdtemp() + '/'
+        self.addCleanup(shutil.rmtree, seafilemixin.BASE, True)
+        self.addCleanup(setattr, seafilemixin, 'BASE', self.base)
+        self.token = 'standin-{0}-{1}'.format(id(self), time.monotonic())
+        self.addCleanup(seahttp.dropUser, self.token)
+
+    def restoreEnviron(self):
+        os.environ.clear()
+        os.environ.update(self.environ)
+
+    def connection(self, libraryID='LIB', name='lib', useLibToken='True'):
+        """Connection tuple for a library, without head commit if libraryID is empty."""
+        return (
+            self.server.url, {'Authorization': 'Token ' + self.token},
+            libraryID, name, 9, useLibToken
+            )
+
+    def fs(self, **kwargs):
+        from SeafileContentManager.seaopen import SeafileFS
+        return SeafileFS(self.connection(**kwargs))
@@ -0,0 +1,57 @@
+# coding: utf-8
+"""Batched uploads of many small files against the stand-in server."""
+import os
+from unittest import TestCase, skipUnless
+
+from .standin import StandInCase, requests
+
+
+@skipUnless(requests, 'requests is not installed')
+class TestUploadMany(StandInCase, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.server.lib.mkdir('/a')
+        self.server.lib.mkdir('/b')
+        self.client = self.fs()
+
+    def posts(self):
+        return self.server.count('POST', '/seafhttp/upload-api/LIB')
+
+    def test_one_request_per_folder(self):
+        results = self.client.upload_many({
+            '/a/1.txt': b'one', '/a/2.txt': 'zwei ä', '/b/3.txt': b'three'
+            })
+        self.assertEqual(self.posts(), 2)
+        self.assertEqual(self.server.lib.files['/a/2.txt'], 'zwei ä'.encode())
+        self.assertEqual(results['/b/3.txt']['status'], 200)
+        self.assertEqual(results['/b/3.txt']['size'], 5)
+        self.assertEqual(sorted(self.server.lib.uploads),
+                         ['/a/1.txt', '/a/2.txt', '/b/3.txt'])
+
+    def test_batches_are_limited(self):
+        os.environ['SEAFILE_UPLOAD_BATCH_FILES'] = '2'
+        self.client.upload_many([('/a/{0}.txt'.format(x), b'x') for x in range(5)])
+        self.assertEqual(self.posts(), 3)
+        del self.server.requests[:]
+        os.environ['SEAFILE_UPLOAD_BATCH_FILES'] = '64'
+        os.environ['SEAFILE_UPLOAD_BATCH_BYTES'] = '10'
+        self.client.upload_many([
+            ('/b/small1', b'12345'), ('/b/small2', b'12345'),
+            ('/b/large', b'0' * 20), ('/b/small3', b'1')
+            ])
+        self.assertEqual(self.posts(), 3)
+        self.assertEqual(self.server.lib.files['/b/large'], b'0' * 20)
+
+    def test_without_replace_existing_files_are_kept(self):
+        self.server.lib.write('/a/1.txt', b'old')
+        results = self.client.upload_many({'/a/1.txt': b'new'}, replace=False)
+        self.assertEqual(self.server.lib.files['/a/1.txt'], b'old')
+        self.assertEqual(results['/a/1.txt']['name'], '1 (1).txt')
+        self.assertEqual(self.server.lib.files['/a/1 (1).txt'], b'new')
+
+    def test_listings_are_invalidated(self):
+        self.assertEqual(self.client.listdir('/a'), [])
+        self.client.upload_many({'/a/1.txt': b'one'})
+        self.assertEqual(self.client.listdir('/a'), ['1.txt'])
+        self.assertTrue(self.client.isUnchanged('/a/1.txt', b'one'))
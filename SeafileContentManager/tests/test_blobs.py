@@ -0,0 +1,142 @@
+# coding: utf-8
+"""Blob cache for binary reads, also against the stand-in server."""
+import os
+import shutil
+import tempfile
+import threading
+import time
+from unittest import TestCase, skipUnless
+
+from .standin import StandInCase, requests, sha1
+
+
+class TestBlobCache(TestCase):
+
+    def setUp(self):
+        from SeafileContentManager.seablobs import BlobCache
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.cache = BlobCache(self.directory, maxBytes=10)
+        self.downloads = []
+
+    def chunks(self, data):
+        def fetch():
+            self.downloads.append(data)
+            time.sleep(0.05)
+            return [data[:2], data[2:]]
+        return fetch
+
+    def test_concurrent_fetches_download_once(self):
+        paths = []
+        threads = [
+            threading.Thread(target=lambda: paths.append(
+                self.cache.fetch('ab12', self.chunks(b'blob'))
+                ))
+            for x in range(4)
+            ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.downloads, [b'blob'])
+        self.assertEqual(set(paths), {os.path.join(self.directory, 'ab12')})
+        # the lock file stays, so all processes lock the same file
+        lock = self.cache.lockPath('ab12')
+        self.assertTrue(os.path.exists(lock))
+        self.assertEqual(lock, self.cache.lockPath('ab34'))
+
+    def test_least_recently_used_blobs_are_evicted(self):
+        self.cache.fetch('aa', self.chunks(b'12345'))
+        os.utime(self.cache.blobPath('aa'), (1, 1))
+        self.cache.fetch('bb', self.chunks(b'12345'))
+        self.cache.fetch('cc', self.chunks(b'12345'))
+        self.assertEqual(
+            sorted(x for x in os.listdir(self.directory) if x[0] != '.'),
+            ['bb', 'cc']
+            )
+
+    def test_removed_blob_is_downloaded_again(self):
+        self.cache.fetch('ab', self.chunks(b'blob'))
+        os.remove(self.cache.blobPath('ab'))
+        with self.cache.open('ab', self.chunks(b'blob')) as file:
+            self.assertEqual(file.read(), b'blob')
+        self.assertEqual(self.downloads, [b'blob', b'blob'])
+
+    def test_eviction_waits_for_readers_opening_the_blob(self):
+        from SeafileContentManager.seablobs import fileLock
+        self.cache.fetch('aa', self.chunks(b'12345'))
+        self.cache.fetch('bb', self.chunks(b'12345'))
+        os.utime(self.cache.blobPath('aa'), (1, 1))
+        self.cache.maxBytes = 5
+        with fileLock(self.cache.lockPath('aa'), shared=True):
+            evicting = threading.Thread(target=self.cache.evict)
+            evicting.start()
+            evicting.join(0.2)
+            self.assertTrue(evicting.is_alive())
+            self.assertTrue(os.path.exists(self.cache.blobPath('aa')))
+        evicting.join(5)
+        self.assertFalse(os.path.exists(self.cache.blobPath('aa')))
+
+    def test_stale_partial_downloads_are_removed(self):
+        stale = os.path.join(self.directory, 'aa.1.2.tmp')
+        fresh = os.path.join(self.directory, 'bb.1.2.tmp')
+        for path in (stale, fresh):
+            with open(path, 'wb') as file:
+                file.write(b'part')
+        os.utime(stale, (1, 1))
+        self.cache.evict()
+        self.assertFalse(os.path.exists(stale))
+        self.assertTrue(os.path.exists(fresh))
+
+    def test_file_interface(self):
+        with self.cache.open('ab', self.chunks(b'0123456789')) as file:
+            self.assertEqual(file.read(3), b'012')
+            file.seek(-2, os.SEEK_END)
+            self.assertEqual(file.read(), b'89')
+            buffer = bytearray(4)
+            file.seek(1)
+            self.assertEqual(file.readinto(buffer), 4)
+            self.assertEqual(bytes(buffer), b'1234')
+            view = file.getbuffer()
+            self.assertEqual(bytes(view[5:7]), b'56')
+            view.release()
+
+
+@skipUnless(requests, 'requests is not installed')
+class TestBlobReads(StandInCase, TestCase):
+
+    def setUp(self):
+        from SeafileContentManager import seablobs
+        super().setUp()
+        os.environ['SEAFILE_BLOB_CACHE'] = 'True'
+        seablobs._blobCache = None
+        self.addCleanup(setattr, seablobs, '_blobCache', None)
+        self.server.lib.write('/table.bin', b'\x00\x01' * 100)
+
+    def test_repeated_reads_come_from_the_cache(self):
+        for client in (self.fs(), self.fs()):
+            with client.open('/table.bin', 'rb') as file:
+                self.assertEqual(file.read(), b'\x00\x01' * 100)
+        downloads = [x for x in self.server.requests
+                     if x[1].startswith('/seafhttp/files/')]
+        self.assertEqual(len(downloads), 1)
+        from SeafileContentManager.seablobs import getBlobCache
+        self.assertTrue(os.path.exists(
+            getBlobCache().blobPath(sha1(b'\x00\x01' * 100))
+            ))
+
+    def test_pending_saves_are_read_first(self):
+        os.environ['SEAFILE_WRITE_BACK'] = 'True'
+        client = self.fs()
+        with client.open('/table.bin', 'rb') as file:
+            file.read()
+        self.server.delay = 0.5
+        with client.open('/table.bin', 'w+b') as file:
+            file.write(b'changed')
+        with client.open('/new.bin', 'w+b') as file:
+            file.write(b'new')
+        with client.open('/table.bin', 'rb') as file:
+            self.assertEqual(file.read(), b'changed')
+        with client.open('/new.bin', 'rb') as file:
+            self.assertEqual(file.read(), b'new')
+        self.assertTrue(client.writeBack.wait(timeout=5))
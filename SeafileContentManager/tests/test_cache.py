@@ -0,0 +1,58 @@
+# coding: utf-8
+"""Cache validation by head commit and folder IDs against the stand-in."""
+import os
+from unittest import TestCase, skipUnless
+
+from .standin import StandInCase, requests
+
+
+@skipUnless(requests, 'requests is not installed')
+class TestHeadValidation(StandInCase, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        os.environ['SEAFILE_HEAD_CHECK_INTERVAL'] = '1000'
+        self.server.lib.write('/a/b/one.txt', b'1')
+        self.server.lib.write('/a/two.txt', b'2')
+        self.server.lib.write('/x/y.txt', b'y')
+        self.client = self.fs()
+        for folder in ('/', '/a', '/a/b', '/x'):
+            self.client.listdir(folder)
+
+    def check(self):
+        """Let the next access check the head commit."""
+        self.client.caches.headChecked = None
+        del self.server.requests[:]
+
+    def listings(self):
+        return [x[2].get('p') for x in self.server.requests
+                if x[1].endswith('/dir/')]
+
+    def test_only_changed_paths_are_listed_again(self):
+        self.server.lib.write('/x/z.txt', b'z')
+        self.check()
+        self.assertEqual(self.client.listdir('/a/b'), ['one.txt'])
+        self.assertEqual(self.client.listdir('/x'), ['y.txt', 'z.txt'])
+        self.assertEqual(self.listings(), ['/x'])
+
+    def test_without_head_unchanged_folders_are_kept(self):
+        self.server.lib.heads = False
+        self.server.lib.write('/x/z.txt', b'z')
+        self.check()
+        self.assertEqual(self.client.listdir('/'), ['a', 'x'])
+        self.assertEqual(self.client.listdir('/a'), ['b', 'two.txt'])
+        self.assertEqual(self.client.listdir('/a/b'), ['one.txt'])
+        self.assertEqual(self.client.listdir('/x'), ['y.txt', 'z.txt'])
+        self.assertEqual(self.listings(), ['/', '/x'])
+
+    def test_without_head_changed_folders_are_listed_again(self):
+        self.server.lib.heads = False
+        self.server.lib.write('/a/b/new.txt', b'new')
+        self.check()
+        self.assertEqual(self.client.listdir('/a/b'), ['new.txt', 'one.txt'])
+        self.assertEqual(self.client.listdir('/a'), ['b', 'two.txt'])
+        self.assertEqual(self.listings(), ['/a/b', '/a'])
+        del self.server.requests[:]
+        self.assertEqual(self.client.listdir('/'), ['a', 'x'])
+        self.assertEqual(self.client.listdir('/x'), ['y.txt'])
+        self.assertEqual(self.listings(), ['/'])
@@ -0,0 +1,51 @@
+# coding: utf-8
+"""Chunked JupyterLab uploads against the stand-in server."""
+import base64
+from unittest import TestCase, skipUnless
+
+from .standin import StandInCase, requests
+
+
+def chunkModel(data, chunk):
+    return {'type': 'file', 'format': 'base64', 'chunk': chunk,
+            'content': base64.b64encode(data).decode('ascii')}
+
+
+@skipUnless(requests, 'requests is not installed')
+class TestChunkedUpload(StandInCase, TestCase):
+
+    def setUp(self):
+        from SeafileContentManager import seachunks
+        super().setUp()
+        self.pieceSize = seachunks.PIECE_SIZE
+        self.addCleanup(setattr, seachunks, 'PIECE_SIZE', self.pieceSize)
+        self.client = self.fs()
+
+    def test_chunks_are_sent_with_the_last_one(self):
+        from SeafileContentManager import seachunks
+        seachunks.PIECE_SIZE = 4
+        model = self.client.save(chunkModel(b'first ', 1), 'up/big.bin')
+        self.assertEqual(model['size'], 6)
+        self.client.save(chunkModel(b'second ', 2), 'up/big.bin')
+        self.assertNotIn('/up/big.bin', self.server.lib.files)
+        model = self.client.save(chunkModel(b'last', -1), 'up/big.bin')
+        self.assertEqual(self.server.lib.files['/up/big.bin'], b'first second last')
+        self.assertEqual(model['path'], 'up/big.bin')
+        # sent in pieces of four bytes with Content-Range
+        self.assertEqual(
+            self.server.count('POST', '/seafhttp/upload-api/LIB'), 5
+            )
+
+    def test_small_upload_is_sent_in_one_request(self):
+        self.client.save(chunkModel(b'tiny', 1), 'tiny.bin')
+        self.client.save(chunkModel(b'!', -1), 'tiny.bin')
+        self.assertEqual(self.server.lib.files['/tiny.bin'], b'tiny!')
+        self.assertEqual(
+            self.server.count('POST', '/seafhttp/upload-api/LIB'), 1
+            )
+
+    def test_chunk_without_upload_is_rejected(self):
+        from SeafileContentManager.seaclient import SeafileAPIError
+        with self.assertRaises(SeafileAPIError) as raised:
+            self.client.save(chunkModel(b'lost', 2), 'lost.bin')
+        self.assertEqual(raised.exception.status_code, 400)
@@ -0,0 +1,181 @@
+# coding: utf-8
+"""SeafileClient and SeafileFS against the stand-in server of standin."""
+import os
+from unittest import TestCase, skipUnless
+
+from .standin import StandInCase, requests
+
+
+@skipUnless(requests, 'requests is not installed')
+class TestExistence(StandInCase, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.server.lib.write('/a/x.txt', b'x')
+        self.server.lib.write('/a/y.txt', b'y')
+        self.server.lib.mkdir('/a/sub')
+        self.client = self.fs()
+
+    def test_exists_many_lists_each_parent_once(self):
+        result = self.client.exists_many(
+            ['/a/x.txt', '/a/y.txt', '/a/sub', '/a/missing', '/b/z.txt', '/']
+            )
+        self.assertEqual(result, {
+            '/a/x.txt': True, '/a/y.txt': True, '/a/sub': True,
+            '/a/missing': False, '/b/z.txt': False, '/': True
+            })
+        self.assertEqual(self.server.count('GET', '/dir/', '/a'), 1)
+        self.assertEqual(self.server.count('GET', '/dir/', '/b'), 1)
+
+    def test_checks_use_cached_listing(self):
+        self.client.listdir('/a')
+        self.assertTrue(self.client.file_exists('/a/x.txt'))
+        self.assertFalse(self.client.file_exists('/a/sub'))
+        self.assertTrue(self.client.dir_exists('/a/sub'))
+        self.assertFalse(self.client.dir_exists('/a/none'))
+        self.assertEqual(self.server.count('GET', '/dir/'), 1)
+        self.assertEqual(self.server.count('GET', '/file/detail/'), 0)
+
+    def test_uncached_file_check_needs_one_request(self):
+        self.assertTrue(self.client.file_exists('/a/x.txt'))
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_uncached_dir_check_needs_one_request(self):
+        self.assertTrue(self.client.dir_exists('/a/sub'))
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertEqual(self.server.count('GET', '/file/detail/'), 0)
+
+    def test_upload_invalidates_listing(self):
+        self.client.listdir('/a')
+        self.client.upload('/a/new.txt', b'new')
+        self.assertTrue(self.client.file_exists('/a/new.txt'))
+
+
+@skipUnless(requests, 'requests is not installed')
+class TestFileModel(StandInCase, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.server.lib.write('/data.csv', b'a,b\n1,2\n')
+        self.server.lib.write('/image.png', b'\x89PNG\r\n\x00\xff')
+        self.client = self.fs()
+
+    def test_read_non_text_file(self):
+        self.assertEqual(self.client.open('/data.csv').read(), 'a,b\n1,2\n')
+        self.assertEqual(
+            self.client.open('/data.csv').readlines(), ['a,b\n', '1,2\n']
+            )
+        self.assertEqual(self.client.open('/data.csv', 'rb').read(), b'a,b\n1,2\n')
+        self.assertEqual(
+            self.client.open('/image.png', 'rb').read(), b'\x89PNG\r\n\x00\xff'
+            )
+
+    def test_append_to_non_text_file(self):
+        self.client.open('/data.csv', 'a').write('3,4\n')
+        self.assertEqual(self.server.lib.files['/data.csv'], b'a,b\n1,2\n3,4\n')
+        self.client.open('/image.png', 'a+b').write(b'\x00\x01')
+        self.assertEqual(
+            self.server.lib.files['/image.png'], b'\x89PNG\r\n\x00\xff\x00\x01'
+            )
+
+    def test_write_binary_file(self):
+        self.client.open('/new.bin', 'w+b').write(b'\xff\xfe')
+        self.assertEqual(self.server.lib.files['/new.bin'], b'\xff\xfe')
+        self.assertEqual(self.client.open('/new.bin', 'rb').read(), b'\xff\xfe')
+
+    def test_writes_append_like_local_files(self):
+        file = self.client.open('/new.txt', 'w')
+        file.write('one ')
+        file.write('two')
+        self.assertEqual(self.server.lib.files['/new.txt'], b'one two')
+        self.client.open('/data.csv', 'r+').write('x,y')
+        self.assertEqual(self.server.lib.files['/data.csv'], b'x,y\n1,2')
+
+    def test_with_block_uploads_once(self):
+        with self.client.open('/new.bin', 'w+b') as file:
+            for number in range(3):
+                file.write(bytes([number]))
+        self.assertTrue(file.closed)
+        self.assertEqual(self.server.lib.files['/new.bin'], b'\x00\x01\x02')
+        self.assertEqual(self.server.lib.uploads, ['/new.bin'])
+
+    def test_large_writes_are_sent_in_pieces(self):
+        from unittest import mock
+        from SeafileContentManager import seachunks
+        with mock.patch.object(seachunks, 'PIECE_SIZE', 4):
+            with self.client.open('/data.csv', 'a') as file:
+                file.write('3,4\n5,6\n')
+        self.assertEqual(self.server.lib.files['/data.csv'],
+                         b'a,b\n1,2\n3,4\n5,6\n')
+        self.assertEqual(self.server.count('POST', '/seafhttp/upload-api/LIB'), 4)
+
+    def test_write_back_keeps_the_content(self):
+        os.environ['SEAFILE_WRITE_BACK'] = 'True'
+        client = self.fs()
+        client.open('/data.csv', 'a').write('3,4\n')
+        self.assertEqual(client.open('/data.csv').read(), 'a,b\n1,2\n3,4\n')
+        self.assertTrue(client.writeBack.wait(timeout=5))
+        self.assertEqual(self.server.lib.files['/data.csv'], b'a,b\n1,2\n3,4\n')
+
+    def test_base64_model_of_binary_file(self):
+        import base64
+        model = self.client.get('image.png')
+        self.assertEqual(model['format'], 'base64')
+        self.assertEqual(
+            base64.b64decode(model['content']), b'\x89PNG\r\n\x00\xff'
+            )
+        os.environ['SEAFILE_MAX_INLINE_BASE64'] = '4'
+        model = self.client.get('image.png')
+        self.assertEqual(model['content'], '')
+        self.assertTrue(model['download_url'].endswith('/image.png'))
+
+
+class TestJSONArray(TestCase):
+
+    def test_elements_are_parsed_across_chunks(self):
+        from SeafileContentManager.seadirent import iterJSONArray
+        document = '{"user_perm": "rw", "dirent_list": [{"name": "ä"}, ' \
+            '{"name": "b", "size": 2}]}'.encode('utf-8')
+        chunks = [document[x:x + 1] for x in range(len(document))]
+        self.assertEqual(
+            list(iterJSONArray(chunks, key='dirent_list')),
+            [{'name': 'ä'}, {'name': 'b', 'size': 2}]
+            )
+        self.assertEqual(list(iterJSONArray([b' [1, 2', b']'])), [1, 2])
+        self.assertEqual(list(iterJSONArray([b'[1, 2]'], key='x')), [1, 2])
+        with self.assertRaises(ValueError):
+            list(iterJSONArray([b'[1, 2']))
+
+
+@skipUnless(requests, 'requests is not installed')
+class TestScandir(StandInCase, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.server.lib.write('/docs/a.ipynb', b'{}', mtime=1500000000)
+        self.server.lib.write('/docs/b.txt', b'text')
+        self.server.lib.mkdir('/docs/sub')
+        self.client = self.fs()
+
+    def test_entries(self):
+        entries = {x.name: x for x in self.client.scandir('/docs')}
+        self.assertEqual(sorted(entries), ['a.ipynb', 'b.txt', 'sub'])
+        self.assertTrue(entries['sub'].is_dir())
+        self.assertEqual(entries['a.ipynb'].modelType, 'notebook')
+        self.assertEqual(entries['b.txt']['size'], 4)
+        self.assertEqual(entries['b.txt'].path, 'docs/b.txt')
+        attrib = {x['name']: x for x in self.client.listdir_attrib('/docs')}
+        self.assertEqual(attrib['sub']['type'], 'directory')
+        self.assertEqual(attrib['a.ipynb']['last_modified'].year, 2017)
+
+    def test_listing_is_cached_once_read_completely(self):
+        iterator = self.client.scandir('/docs')
+        next(iterator)
+        self.assertIsNone(self.client.caches.listing('/docs'))
+        list(iterator)
+        self.assertEqual(self.client.listdir('/docs'), ['a.ipynb', 'b.txt', 'sub'])
+        self.assertEqual(self.server.count('GET', '/dir/'), 1)
+
+    def test_missing_folder(self):
+        with self.assertRaises(FileNotFoundError):
+            list(self.client.scandir('/none'))
@@ -0,0 +1,89 @@
+# coding: utf-8
+"""Skipped and debounced saves against the stand-in server."""
+import os
+import time
+from unittest import TestCase, skipUnless
+
+from .standin import StandInCase, requests
+
+
+def textModel(content):
+    return {'type': 'file', 'format': 'text', 'content': content}
+
+
+class FlakyUpload(object):
+    """Upload callable failing the first times it is called."""
+
+    def __init__(self, failures):
+        self.failures = failures
+        self.uploaded = []
+
+    def __call__(self, data):
+        if self.failures:
+            self.failures -= 1
+            raise IOError('server unavailable')
+        self.uploaded.append(data)
+
+
+@skipUnless(requests, 'requests is not installed')
+class TestSaves(StandInCase, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.client = self.fs()
+
+    def test_unchanged_content_is_not_uploaded(self):
+        self.client.save(textModel('same'), 'notes.txt')
+        self.client.save(textModel('same'), 'notes.txt')
+        self.assertEqual(self.server.lib.uploads, ['/notes.txt'])
+        self.server.lib.write('/notes.txt', b'changed elsewhere')
+        self.client.caches.invalidate('/notes.txt')
+        self.client.save(textModel('same'), 'notes.txt')
+        self.assertEqual(self.server.lib.files['/notes.txt'], b'same')
+
+    def test_bursts_are_debounced(self):
+        os.environ['SEAFILE_SAVE_DEBOUNCE'] = '0.3'
+        for number in range(4):
+            self.client.save(textModel(str(number)), 'notes.txt')
+        self.assertEqual(self.client.get('notes.txt')['content'], '3')
+        self.assertEqual(self.server.lib.files['/notes.txt'], b'0')
+        self.client.debouncer.flush()
+        self.assertEqual(self.server.lib.files['/notes.txt'], b'3')
+        self.assertEqual(self.server.lib.uploads, ['/notes.txt'] * 2)
+
+
+class TestDebouncerFailures(TestCase):
+
+    def setUp(self):
+        from SeafileContentManager.seadebounce import SaveDebouncer
+        self.debouncer = SaveDebouncer(0.05, retryDelay=0.05)
+
+    def waitFor(self, condition, timeout=5):
+        end = time.monotonic() + timeout
+        while not condition():
+            self.assertLess(time.monotonic(), end, 'timed out')
+            time.sleep(0.01)
+
+    def test_failed_upload_is_kept_and_retried(self):
+        upload = FlakyUpload(2)
+        self.debouncer.submit('/a.txt', b'first', lambda data: None)
+        self.assertTrue(self.debouncer.submit('/a.txt', b'second', upload))
+        self.waitFor(lambda: '/a.txt' in self.debouncer.failures)
+        self.assertEqual(self.debouncer.read('/a.txt')[0], b'second')
+        self.waitFor(lambda: upload.uploaded)
+        self.assertEqual(upload.uploaded, [b'second'])
+        self.assertIsNone(self.debouncer.read('/a.txt'))
+        self.assertEqual(self.debouncer.failures, {})
+
+    def test_saves_report_the_failure(self):
+        upload = FlakyUpload(100)
+        self.debouncer.submit('/a.txt', b'first', lambda data: None)
+        self.debouncer.submit('/a.txt', b'second', upload)
+        self.waitFor(lambda: '/a.txt' in self.debouncer.failures)
+        with self.assertRaises(IOError):
+            self.debouncer.submit('/a.txt', b'third', upload)
+        # the newest content is the one retried
+        self.assertEqual(self.debouncer.read('/a.txt')[0], b'third')
+        upload.failures = 0
+        self.waitFor(lambda: upload.uploaded)
+        self.assertEqual(upload.uploaded, [b'third'])
@@ -0,0 +1,78 @@
+# coding: utf-8
+"""fsspec filesystem against the stand-in server."""
+import os
+import shutil
+import tempfile
+from unittest import TestCase, skipUnless
+
+from .standin import StandInCase, requests
+
+try:
+    import fsspec
+except ImportError:
+    fsspec = None
+
+
+@skipUnless(requests and fsspec, 'requests or fsspec is not installed')
+class TestFileSystem(StandInCase, TestCase):
+
+    def setUp(self):
+        from SeafileContentManager.seafsspec import SeafileFileSystem
+        super().setUp()
+        self.server.lib.write('/data/a.txt', b'alpha')
+        self.server.lib.write('/data/b.bin', bytes(range(256)))
+        self.fs = SeafileFileSystem(
+            connection=self.connection(), skip_instance_cache=True
+            )
+
+    def test_ls_and_info(self):
+        self.assertEqual(self.fs.ls('lib', detail=False), ['lib/data'])
+        self.assertEqual(
+            sorted(self.fs.ls('seafile://lib/data', detail=False)),
+            ['lib/data/a.txt', 'lib/data/b.bin']
+            )
+        info = self.fs.info('lib/data/b.bin')
+        self.assertEqual((info['type'], info['size']), ('file', 256))
+        self.assertEqual(self.fs.info('lib/data')['type'], 'directory')
+        with self.assertRaises(FileNotFoundError):
+            self.fs.info('lib/missing.txt')
+
+    def test_ranged_reads(self):
+        self.assertEqual(self.fs.cat_file('lib/data/b.bin', 10, 13), b'\n\x0b\x0c')
+        self.assertEqual(self.fs.cat_file('lib/data/b.bin', -2), b'\xfe\xff')
+        with self.fs.open('lib/data/b.bin', 'rb', block_size=16) as file:
+            file.seek(100)
+            self.assertEqual(file.read(3), bytes([100, 101, 102]))
+        ranges = [x for x in self.server.requests
+                  if x[1].startswith('/seafhttp/files/')]
+        self.assertEqual(len(ranges), 3)
+
+    def test_write(self):
+        with self.fs.open('lib/data/new.txt', 'wb') as file:
+            file.write(b'written ')
+            file.write(b'with fsspec')
+        self.assertEqual(
+            self.server.lib.files['/data/new.txt'], b'written with fsspec'
+            )
+
+    def test_put_get_and_rm(self):
+        local = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, local)
+        os.makedirs(os.path.join(local, 'up', 'sub'))
+        for name, data in (('one.txt', b'1'), ('sub/two.txt', b'2')):
+            with open(os.path.join(local, 'up', name), 'wb') as file:
+                file.write(data)
+        self.fs.put(os.path.join(local, 'up'), 'lib/up', recursive=True)
+        self.assertEqual(self.server.lib.files['/up/one.txt'], b'1')
+        self.assertEqual(self.server.lib.files['/up/sub/two.txt'], b'2')
+        self.fs.invalidate_cache()
+        self.fs.get('lib/up', os.path.join(local, 'down'), recursive=True)
+        with open(os.path.join(local, 'down', 'sub', 'two.txt'), 'rb') as file:
+            self.assertEqual(file.read(), b'2')
+        self.assertEqual(
+            self.fs.cat(['lib/up/one.txt', 'lib/up/sub/two.txt']),
+            {'lib/up/one.txt': b'1', 'lib/up/sub/two.txt': b'2'}
+            )
+        self.fs.rm('lib/up', recursive=True)
+        self.assertEqual(sorted(self.server.lib.files), ['/data/a.txt', '/data/b.bin'])
+        self.assertEqual(self.server.count('DELETE', '/dir/'), 1)
@@ -0,0 +1,75 @@
+# coding: utf-8
+"""Guard the import time of SeafileFS.
+
+SeafileFS is used from kernels and batch jobs, importing it must not pull
+in the Jupyter server packages or touch the home directory. The budget
+for the cumulative import time of the package can be changed with
+SEAFILE_IMPORT_BUDGET_MS.
+"""
+import os
+import subprocess
+import sys
+import tempfile
+from unittest import TestCase, skipUnless
+
+try:
+    import requests
+except ImportError:
+    requests = None
+
+SERVER_MODULES = ('notebook', 'jupyter_server', 'tornado', 'traitlets', 'nbformat')
+
+
+def runPython(code, home, *options):
+    """Run code in a fresh interpreter, return completed process."""
+    env = dict(os.environ, HOME=home)
+    root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    env['PYTHONPATH'] = os.pathsep.join(
+        [root] + [x for x in [env.get('PYTHONPATH')] if x]
+        )
+    return subprocess.run(
+        [sys.executable] + list(options) + ['-c', code],
+        env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+        universal_newlines=True, check=True
+        )
+
+
+@skipUnless(requests, 'requests is not installed')
+class TestImportTime(TestCase):
+
+    def setUp(self):
+        self.home = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.home.cleanup()
+
+    def test_no_server_imports(self):
+        code = (
+            'import sys\n'
+            'from SeafileContentManager import SeafileFS\n'
+            'from SeafileContentManager.seaopen import SeafileFileModel\n'
+            'print(",".join(x for x in {0!r} if x in sys.modules))\n'
+            ).format(SERVER_MODULES)
+        res = runPython(code, self.home.name)
+        self.assertEqual(res.stdout.strip(), '')
+
+    def test_no_settings_dir(self):
+        runPython('from SeafileContentManager import SeafileFS', self.home.name)
+        self.assertEqual(os.listdir(self.home.name), [])
+
+    def test_import_budget(self):
+        budget = float(os.environ.get('SEAFILE_IMPORT_BUDGET_MS', 300))
+        res = runPython(
+            'from SeafileContentManager import SeafileFS',
+            self.home.name, '-X', 'importtime'
+            )
+        # lines are "import time: self | cumulative | name", top level
+        # packages are not indented
+        total = 0
+        for line in res.stderr.splitlines():
+            parts = line.split('|')
+            if len(parts) != 3 or not parts[2].startswith(' SeafileContentManager'):
+                continue
+            total += int(parts[1])
+        self.assertGreater(total, 0)
+        self.assertLess(total / 1000, budget)
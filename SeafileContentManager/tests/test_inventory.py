@@ -0,0 +1,68 @@
+# coding: utf-8
+"""Inventories of folders against the stand-in server."""
+from unittest import TestCase, skipUnless
+
+from .standin import StandInCase, requests
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+
+@skipUnless(requests and numpy, 'requests or numpy is not installed')
+class TestInventory(StandInCase, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.server.lib.write('/data/a.csv', b'12345', mtime=1500000000)
+        self.server.lib.write('/data/B.CSV', b'123')
+        self.server.lib.write('/data/raw/c.json', b'1234567')
+        self.server.lib.write('/readme', b'1')
+        self.client = self.fs()
+
+    def test_columns(self):
+        inventory = self.client.inventory('/')
+        self.assertEqual(len(inventory), 6)
+        self.assertEqual(sorted(inventory.paths()), [
+            '/data', '/data/B.CSV', '/data/a.csv', '/data/raw',
+            '/data/raw/c.json', '/readme'
+            ])
+        entries = inventory.entries
+        self.assertEqual(int(entries['size'][~entries['isdir']].sum()), 16)
+        first = list(entries['name']).index('a.csv')
+        self.assertEqual(entries['mtime'][first], 1500000000)
+        self.assertEqual(self.server.count('GET', '/dir/'), 1)
+
+    def test_aggregations(self):
+        inventory = self.client.inventory('/data')
+        byExtension = inventory.sizeByExtension()
+        self.assertEqual(list(byExtension['key']), ['csv', 'json'])
+        self.assertEqual(list(byExtension['files']), [2, 1])
+        self.assertEqual(list(byExtension['size']), [8, 7])
+        byFolder = inventory.sizeByDirectory()
+        self.assertEqual(list(byFolder['key']), ['/data', '/data/raw'])
+        top = self.client.inventory('/').sizeByDirectory(depth=1)
+        self.assertEqual(dict(zip(top['key'], top['size'])),
+                         {'/data': 15, '/': 1})
+
+    def test_flat_listing(self):
+        inventory = self.client.inventory('/data', recursive=False)
+        self.assertEqual(sorted(inventory.entries['name']),
+                         ['B.CSV', 'a.csv', 'raw'])
+
+    @skipUnless(pyarrow, 'pyarrow is not installed')
+    def test_arrow_table(self):
+        table = self.client.inventory('/data').toArrow()
+        self.assertEqual(table.num_rows, 4)
+        self.assertEqual(sorted(table.column('name').to_pylist()),
+                         ['B.CSV', 'a.csv', 'c.json', 'raw'])
+
+    def test_missing_folder(self):
+        with self.assertRaises(FileNotFoundError):
+            self.client.inventory('/none')
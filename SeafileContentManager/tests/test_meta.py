@@ -0,0 +1,79 @@
+# coding: utf-8
+"""Persistent metadata store against the stand-in server."""
+import os
+import threading
+from unittest import TestCase, skipUnless
+
+from .standin import StandInCase, requests
+
+
+@skipUnless(requests, 'requests is not installed')
+class TestMetadataStore(StandInCase, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        os.environ['SEAFILE_METADATA_STORE'] = 'True'
+        self.server.lib.write('/a/b/one.txt', b'1')
+        self.server.lib.write('/x/y.txt', b'y')
+
+    def restart(self, **kwargs):
+        """Return a client with fresh in-memory caches."""
+        from SeafileContentManager import seacache
+        seacache._libraryCaches.clear()
+        client = self.fs(**kwargs)
+        del self.server.requests[:]
+        return client
+
+    def listings(self):
+        return [x[2].get('p') for x in self.server.requests
+                if x[1].endswith('/dir/')]
+
+    def listAll(self, client):
+        for folder in ('/', '/a', '/a/b', '/x'):
+            client.listdir(folder)
+
+    def test_listings_survive_a_restart(self):
+        self.listAll(self.fs())
+        client = self.restart()
+        self.listAll(client)
+        self.assertEqual(self.listings(), [])
+        self.server.lib.write('/x/z.txt', b'z')
+        client = self.restart()
+        self.assertEqual(client.listdir('/a/b'), ['one.txt'])
+        self.assertEqual(client.listdir('/x'), ['y.txt', 'z.txt'])
+        self.assertEqual(self.listings(), ['/x'])
+
+    def test_store_is_kept_without_head(self):
+        self.server.lib.heads = False
+        self.listAll(self.fs(libraryID='', useLibToken=False))
+        self.server.lib.write('/x/z.txt', b'z')
+        client = self.restart(libraryID='', useLibToken=False)
+        self.assertEqual(client.listdir('/'), ['a', 'x'])
+        self.assertEqual(client.listdir('/a/b'), ['one.txt'])
+        self.assertEqual(client.listdir('/x'), ['y.txt', 'z.txt'])
+        self.assertEqual(self.listings(), ['/', '/x'])
+        self.assertIsNotNone(client.caches.store.listing('/a/b'))
+
+    def test_head_check_does_not_block_readers(self):
+        client = self.fs()
+        self.listAll(client)
+        caches = client.caches
+        caches.headChecked = None
+        started = threading.Event()
+        release = threading.Event()
+        headCommit = client.headCommit
+
+        def slowHeadCommit():
+            started.set()
+            release.wait(5)
+            return headCommit()
+
+        client.headCommit = slowHeadCommit
+        checker = threading.Thread(target=caches.validate, args=(client,))
+        checker.start()
+        self.assertTrue(started.wait(5))
+        other = self.fs()
+        self.assertEqual(other.listdir('/a/b'), ['one.txt'])
+        release.set()
+        checker.join(5)
+        self.assertFalse(caches.checking)
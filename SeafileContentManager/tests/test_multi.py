@@ -0,0 +1,142 @@
+# coding: utf-8
+"""All libraries of an account through SeafileMultiContentManager."""
+import io
+import json
+import os
+import time
+import zipfile
+from unittest import TestCase, skipUnless
+from urllib.parse import urlparse
+
+from .standin import Library, StandInCase, requests
+
+try:
+    from tornado import web
+    from tornado.testing import AsyncHTTPTestCase
+    from tornado.web import Application
+    from SeafileContentManager.seamulti import SeafileMultiContentManager
+    from SeafileContentManager import seahandlers
+except ImportError:
+    AsyncHTTPTestCase = TestCase
+    SeafileMultiContentManager = None
+
+
+def textModel(content):
+    return {'type': 'file', 'format': 'text', 'content': content}
+
+
+class MultiCase(StandInCase):
+
+    def setUp(self):
+        super().setUp()
+        self.server.libraries['DOCS'] = Library('DOCS', 'docs')
+        self.server.lib.write('/notes.txt', b'harbour plans')
+        self.server.lib.write('/image.png', b'\x89PNG\x00\xff')
+        self.server.libraries['DOCS'].write('/sub/readme.md', b'# docs')
+        self.manager = SeafileMultiContentManager(
+            server=(self.server.url, self.token)
+            )
+
+
+@skipUnless(requests and SeafileMultiContentManager, 'notebook is not installed')
+class TestMultiManager(MultiCase, TestCase):
+
+    def test_root_lists_libraries(self):
+        model = self.manager.get('')
+        self.assertEqual(sorted(x['path'] for x in model['content']),
+                         ['docs', 'lib'])
+        model = self.manager.get('docs/sub')
+        self.assertEqual([x['path'] for x in model['content']],
+                         ['docs/sub/readme.md'])
+
+    def test_get_and_save(self):
+        self.assertEqual(self.manager.get('lib/notes.txt')['content'],
+                         'harbour plans')
+        model = self.manager.save(textModel('new'), 'docs/sub/new.txt')
+        self.assertEqual(model['path'], 'docs/sub/new.txt')
+        self.assertEqual(self.server.libraries['DOCS'].files['/sub/new.txt'],
+                         b'new')
+
+    def test_download_url_names_the_library(self):
+        os.environ['SEAFILE_MAX_INLINE_BASE64'] = '4'
+        model = self.manager.get('lib/image.png')
+        self.assertEqual(model['content'], '')
+        self.assertEqual(model['download_url'],
+                         '/seafile/download/lib/image.png')
+
+    def test_only_missing_paths_are_reported_as_missing(self):
+        from SeafileContentManager import seahttp
+        self.assertFalse(self.manager.file_exists('nolib/notes.txt'))
+        self.assertFalse(self.manager.dir_exists('nolib/sub'))
+        self.addCleanup(seahttp._schedulers.pop,
+                        urlparse(self.server.url).netloc, None)
+        self.addCleanup(setattr, seahttp, 'MAX_RETRIES', seahttp.MAX_RETRIES)
+        seahttp.MAX_RETRIES = 0
+        self.server.throttle.add(('GET', '/api2/repos/LIB/file/detail/'))
+        with self.assertRaises(web.HTTPError) as raised:
+            self.manager.file_exists('lib/notes.txt')
+        self.assertEqual(raised.exception.status_code, 429)
+
+    def test_streams_are_routed(self):
+        self.assertEqual(b''.join(self.manager.streamFile('/lib/notes.txt')),
+                         b'harbour plans')
+        archive = zipfile.ZipFile(io.BytesIO(
+            b''.join(self.manager.streamZip('/docs/sub'))
+            ))
+        self.assertIn('sub/readme.md', archive.namelist())
+        self.assertEqual(self.manager.seafileURL, self.server.url)
+
+
+def authenticated(handler):
+    class Handler(handler):
+        def get_current_user(self):
+            return 'user'
+
+        @property
+        def contents_manager(self):
+            return self.settings['contents_manager']
+    return Handler
+
+
+@skipUnless(requests and SeafileMultiContentManager, 'notebook is not installed')
+class TestMultiHandlers(MultiCase, AsyncHTTPTestCase):
+
+    def setUp(self):
+        MultiCase.setUp(self)
+        AsyncHTTPTestCase.setUp(self)
+
+    def get_app(self):
+        return Application([
+            ('/seafile/download/(.*)',
+             authenticated(seahandlers.SeafileDownloadHandler)),
+            ('/seafile/zip/(.*)', authenticated(seahandlers.SeafileZipHandler)),
+            ('/seafile/search', authenticated(seahandlers.SeafileSearchHandler)),
+            ], contents_manager=self.manager)
+
+    def test_download(self):
+        response = self.fetch('/seafile/download/lib/image.png')
+        self.assertEqual(response.code, 200)
+        self.assertEqual(response.body, b'\x89PNG\x00\xff')
+
+    def test_zip(self):
+        response = self.fetch('/seafile/zip/docs')
+        self.assertEqual(response.code, 200)
+        self.assertIn('filename="docs.zip"',
+                      response.headers['Content-Disposition'])
+        names = zipfile.ZipFile(io.BytesIO(response.body)).namelist()
+        self.assertIn('sub/readme.md', names)
+        self.assertEqual(self.fetch('/seafile/zip/').code, 400)
+
+    def test_search_all_libraries(self):
+        for name, manager in self.manager.libraryManagers():
+            index = seahandlers.indexFor(manager)
+            index.ensureBuilt()
+            while index.fetching:
+                time.sleep(0.01)
+        response = self.fetch('/seafile/search?q=harbour')
+        self.assertEqual(response.code, 200)
+        self.assertEqual([x['path'] for x in json.loads(response.body)],
+                         ['lib/notes.txt'])
+        response = self.fetch('/seafile/search?q=readme')
+        self.assertEqual([x['path'] for x in json.loads(response.body)],
+                         ['docs/sub/readme.md'])
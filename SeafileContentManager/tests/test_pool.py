@@ -0,0 +1,65 @@
+# coding: utf-8
+"""SeafilePool serving several users of the stand-in server."""
+import threading
+from unittest import TestCase, skipUnless
+
+from .standin import StandInCase, requests
+
+
+@skipUnless(requests, 'requests is not installed')
+class TestPool(StandInCase, TestCase):
+
+    def setUp(self):
+        from SeafileContentManager import seafilemixin, seahttp
+        from SeafileContentManager.seapool import SeafilePool
+        super().setUp()
+        seafilemixin._resolved.clear()
+        self.pool = SeafilePool(self.server.url, maxPerUser=2)
+        self.users = [self.token + '-a', self.token + '-b']
+        for user in self.users:
+            self.addCleanup(seahttp.dropUser, user)
+        self.server.lib.write('/shared.txt', b'shared')
+
+    def test_bootstrap_is_resolved_once(self):
+        connections = [self.pool.connect(x, 'lib', 'True') for x in self.users]
+        again = self.pool.connect(self.users[0], 'lib', 'True')
+        self.assertEqual([x[2] for x in connections], ['LIB', 'LIB'])
+        self.assertEqual(again, connections[0])
+        self.assertEqual(self.server.count('GET', '/api2/server-info'), 1)
+        # the library is looked up once per user
+        self.assertEqual(self.server.count('GET', '/api2/repos/'), 2)
+
+    def test_users_get_their_own_limits(self):
+        from SeafileContentManager import seahttp
+        self.pool.fs(self.users[0], 'lib', 'True').listdir('/')
+        limit = seahttp.getLimit(self.users[0])
+        self.assertIsNot(limit, seahttp.getLimit(self.users[1]))
+        for x in range(2):
+            self.assertTrue(limit.acquire(blocking=False))
+        self.assertFalse(limit.acquire(blocking=False))
+        limit.release()
+        limit.release()
+        self.pool.release(self.users[0])
+        self.assertNotIn(self.users[0], seahttp._sessions)
+
+    def test_concurrent_downloads_are_shared(self):
+        clients = [self.pool.fs(x, 'lib', 'True') for x in self.users]
+        self.server.delay = 0.3
+        results = []
+        threads = [
+            threading.Thread(
+                target=lambda x=x: results.append(x.open('/shared.txt').read())
+                )
+            for x in clients
+            ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, ['shared', 'shared'])
+        # each user asked for a download link, the file was fetched once
+        self.assertEqual(self.server.count('GET', '/file/'), 2)
+        self.assertEqual(
+            len([x for x in self.server.requests
+                 if x[1].startswith('/seafhttp/files/')]), 1
+            )
@@ -0,0 +1,43 @@
+# coding: utf-8
+"""Prefetching after listings against the stand-in server."""
+import os
+import time
+from unittest import TestCase, skipUnless
+
+from .standin import StandInCase, requests
+
+
+@skipUnless(requests, 'requests is not installed')
+class TestPrefetch(StandInCase, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        os.environ['SEAFILE_PREFETCH'] = 'True'
+        os.environ['SEAFILE_PREFETCH_FILES'] = '2'
+        os.environ['SEAFILE_PREFETCH_CONTENT_BYTES'] = '100'
+        library = self.server.lib
+        library.write('/old.txt', b'old', mtime=1000)
+        library.write('/new.txt', b'new', mtime=3000)
+        library.write('/big.txt', b'b' * 1000, mtime=2000)
+        library.write('/sub/inner.txt', b'inner')
+        self.client = self.fs()
+
+    def waitFor(self, condition, timeout=5):
+        end = time.monotonic() + timeout
+        while not condition():
+            self.assertLess(time.monotonic(), end, 'timed out')
+            time.sleep(0.01)
+
+    def test_listing_warms_recent_entries(self):
+        caches = self.client.caches
+        self.client.get('', type='directory')
+        self.waitFor(lambda: '/big.txt' in caches.details and
+                     caches.listing('/sub') is not None)
+        # only the two most recent files
+        self.assertIn('/new.txt', caches.details)
+        self.assertNotIn('/old.txt', caches.details)
+        self.waitFor(lambda: len(caches.contents) == 1)
+        requests = len(self.server.requests)
+        self.assertEqual(self.client.get('new.txt')['content'], 'new')
+        self.assertEqual(self.client.listdir('/sub'), ['inner.txt'])
+        self.assertEqual(len(self.server.requests), requests)
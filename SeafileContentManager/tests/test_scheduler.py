@@ -0,0 +1,186 @@
+# coding: utf-8
+"""Request scheduling per host and priority class."""
+import threading
+import time
+from unittest import TestCase, skipUnless
+from urllib.parse import urlparse
+
+from .standin import StandInCase, requests
+
+
+class TestScheduler(TestCase):
+
+    def serveInOrder(self, scheduler, levels):
+        """Queue one waiter per level behind a held slot, return the serving order."""
+        order = []
+
+        def wait(number, level):
+            scheduler.acquire(level)
+            order.append(number)
+            scheduler.release()
+        scheduler.acquire(0)
+        threads = []
+        for number, level in enumerate(levels):
+            thread = threading.Thread(target=wait, args=(number, level))
+            thread.start()
+            threads.append(thread)
+            while sum(len(x) for x in scheduler.queues) <= number:
+                time.sleep(0.001)
+        scheduler.release()
+        for thread in threads:
+            thread.join(5)
+        return order
+
+    def test_interactive_requests_overtake_background_work(self):
+        from SeafileContentManager.seahttp import BACKGROUND, INTERACTIVE, Scheduler
+        scheduler = Scheduler(1)
+        order = self.serveInOrder(
+            scheduler, [BACKGROUND, BACKGROUND, INTERACTIVE, INTERACTIVE]
+            )
+        self.assertEqual(order, [2, 3, 0, 1])
+        self.assertEqual(scheduler.active, 0)
+
+    def test_background_work_still_advances(self):
+        from SeafileContentManager.seahttp import BACKGROUND, INTERACTIVE, Scheduler
+        scheduler = Scheduler(1, weights=(2, 1, 1))
+        order = self.serveInOrder(
+            scheduler, [INTERACTIVE] * 4 + [BACKGROUND]
+            )
+        self.assertEqual(order, [0, 1, 4, 2, 3])
+
+    def test_free_slots_are_taken_without_waiting(self):
+        from SeafileContentManager.seahttp import KERNEL, Scheduler
+        scheduler = Scheduler(2)
+        scheduler.acquire(KERNEL)
+        scheduler.acquire(KERNEL)
+        self.assertEqual(scheduler.active, 2)
+        scheduler.release()
+        scheduler.release()
+        self.assertEqual(scheduler.active, 0)
+
+    def test_limit_is_halved_once_per_burst_and_regrows(self):
+        from SeafileContentManager.seahttp import Scheduler
+        scheduler = Scheduler(8)
+        started = time.monotonic()
+        scheduler.throttled(started)
+        scheduler.throttled(started)
+        self.assertEqual(scheduler.limit, 4)
+        scheduler.throttled(time.monotonic())
+        self.assertEqual(scheduler.slots, 2)
+        for x in range(10):
+            scheduler.succeeded(0.01)
+        self.assertGreater(scheduler.limit, 4)
+        limit = scheduler.limit
+        scheduler.succeeded(1)
+        self.assertEqual(scheduler.limit, limit)
+        for x in range(200):
+            scheduler.succeeded(0.01)
+        self.assertEqual(scheduler.limit, 8)
+
+    def test_retry_after_pauses_the_host(self):
+        from SeafileContentManager.seahttp import Scheduler
+        scheduler = Scheduler(2)
+        scheduler.throttled(time.monotonic(), retryAfter=0.2)
+        started = time.monotonic()
+        with scheduler.slot(0):
+            self.assertGreaterEqual(time.monotonic() - started, 0.15)
+
+    def test_replayable_bodies(self):
+        from SeafileContentManager.seahttp import replayable
+        self.assertTrue(replayable({'data': b'x'}))
+        self.assertTrue(replayable({'files': {'file': ('a', b'x')}}))
+        self.assertTrue(replayable({'files': [('file', ('a', b'x')),
+                                              ('file', ('b', 'y'))]}))
+        self.assertFalse(replayable({'files': [('file', ('a', iter([])))]}))
+        self.assertFalse(replayable({'data': iter([b'x'])}))
+
+    def test_priority_context_overrides_the_caller(self):
+        from SeafileContentManager import seahttp
+        self.assertIsNone(seahttp._priority.get())
+        with seahttp.priority(seahttp.BACKGROUND):
+            self.assertEqual(seahttp._priority.get(), seahttp.BACKGROUND)
+        self.assertIsNone(seahttp._priority.get())
+
+
+@skipUnless(requests, 'requests is not installed')
+class TestHostScheduling(StandInCase, TestCase):
+
+    def test_interactive_listing_is_sent_first(self):
+        from SeafileContentManager import seahttp
+        client = self.fs()
+        self.server.lib.mkdir('/early')
+        self.server.lib.mkdir('/late')
+        scheduler = seahttp.getScheduler(urlparse(self.server.url).netloc)
+        for x in range(scheduler.slots):
+            scheduler.acquire(seahttp.INTERACTIVE)
+
+        def listBackground():
+            with seahttp.priority(seahttp.BACKGROUND):
+                client.listdir('/early')
+        threads = [threading.Thread(target=listBackground),
+                   threading.Thread(target=client.listdir, args=('/late',))]
+        for number, thread in enumerate(threads):
+            thread.start()
+            while sum(len(x) for x in scheduler.queues) <= number:
+                time.sleep(0.001)
+        scheduler.release()
+        for thread in threads:
+            thread.join(5)
+        for x in range(scheduler.slots - 1):
+            scheduler.release()
+        self.assertEqual(
+            [x[2]['p'] for x in self.server.requests], ['/late', '/early']
+            )
+
+    def test_throttled_batch_upload_is_retried(self):
+        from SeafileContentManager import seahttp
+        # the halved limit would slow down the following tests
+        self.addCleanup(seahttp._schedulers.pop,
+                        urlparse(self.server.url).netloc, None)
+        client = self.fs()
+        self.server.throttle.add(('POST', '/seafhttp/upload-api/LIB'))
+        results = client.upload_many({'/a.txt': b'a', '/b.txt': b'b'})
+        self.assertEqual(results['/a.txt']['status'], 200)
+        self.assertEqual(self.server.lib.files['/b.txt'], b'b')
+        self.assertEqual(self.server.count('POST', '/seafhttp/upload-api/LIB'), 2)
+
+    def test_streamed_body_holds_the_slot(self):
+        from SeafileContentManager import seahttp
+        self.addCleanup(seahttp.dropUser, self.token)
+        self.server.lib.write('/big.bin', b'0123456789' * 10)
+        self.server.lib.mkdir('/other')
+        client = self.fs()
+        seahttp.setUserLimit(self.token, 1)
+        chunks = client.streamFile('/big.bin', 10)
+        self.assertEqual(next(chunks), b'0123456789')
+        other = threading.Thread(target=client.listdir, args=('/other',))
+        other.start()
+        other.join(0.3)
+        self.assertTrue(other.is_alive())
+        chunks.close()
+        other.join(5)
+        self.assertFalse(other.is_alive())
+        self.assertEqual(self.server.count('GET', '/dir/', '/other'), 1)
+
+    def test_throttled_delete_and_save_are_reported(self):
+        from SeafileContentManager import seahttp
+        try:
+            from tornado import web
+            from SeafileContentManager.seamanager import SeafileContentManager
+        except ImportError:
+            self.skipTest('notebook is not installed')
+        self.addCleanup(seahttp._schedulers.pop,
+                        urlparse(self.server.url).netloc, None)
+        self.addCleanup(setattr, seahttp, 'MAX_RETRIES', seahttp.MAX_RETRIES)
+        seahttp.MAX_RETRIES = 0
+        self.server.lib.write('/a.txt', b'a')
+        manager = SeafileContentManager(connection=self.connection())
+        self.server.throttle.add(('DELETE', '/api2/repos/LIB/file/'))
+        with self.assertRaises(web.HTTPError) as raised:
+            manager.delete_file('a.txt')
+        self.assertEqual(raised.exception.status_code, 429)
+        self.server.throttle.add(('POST', '/seafhttp/upload-api/LIB'))
+        with self.assertRaises(web.HTTPError) as raised:
+            manager.save({'type': 'file', 'format': 'text', 'content': 'b'},
+                         'b.txt')
+        self.assertEqual(raised.exception.status_code, 429)
@@ -0,0 +1,113 @@
+# coding: utf-8
+"""Search index and search handler against the stand-in server."""
+import json
+import threading
+import time
+from unittest import TestCase, skipUnless
+
+from .standin import StandInCase, requests
+
+try:
+    from tornado.testing import AsyncHTTPTestCase
+    from tornado.web import Application
+    from SeafileContentManager.seahandlers import SeafileSearchHandler
+except ImportError:
+    AsyncHTTPTestCase = TestCase
+    SeafileSearchHandler = None
+
+
+@skipUnless(requests, 'requests is not installed')
+class TestSearch(StandInCase, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.server.lib.write('/notes/plan.txt', b'budget for the harbour')
+        self.server.lib.write('/other.txt', b'nothing here')
+        self.client = self.fs()
+
+    def waitForContent(self, index):
+        end = time.monotonic() + 5
+        while index.fetching:
+            self.assertLess(time.monotonic(), end, 'timed out')
+            time.sleep(0.01)
+
+    def test_first_search_lists_then_indexes_content(self):
+        from SeafileContentManager.seaindex import indexFor
+        index = indexFor(self.client)
+        release = threading.Event()
+        streamFile = self.client.streamFile
+
+        def slowStreamFile(path, *args):
+            release.wait(5)
+            return streamFile(path, *args)
+
+        self.client.streamFile = slowStreamFile
+        self.assertEqual([x['path'] for x in self.client.search('plan')],
+                         ['notes/plan.txt'])
+        self.assertEqual(self.client.search('harbour'), [])
+        release.set()
+        self.waitForContent(index)
+        hits = self.client.search('harbour')
+        self.assertEqual([x['path'] for x in hits], ['notes/plan.txt'])
+
+    def test_index_follows_new_commits(self):
+        from SeafileContentManager.seaindex import indexFor
+        self.client.search('harbour')
+        self.server.lib.write('/notes/harbour.txt', b'')
+        self.server.lib.write('/notes/plan.txt', b'budget for the pier')
+        indexFor(self.client).refresh()
+        self.waitForContent(indexFor(self.client))
+        self.assertEqual([x['path'] for x in self.client.search('pier')],
+                         ['notes/plan.txt'])
+        hits = self.client.search('harbour')
+        self.assertEqual([x['path'] for x in hits], ['notes/harbour.txt'])
+
+
+class BuildingHandler(SeafileSearchHandler or object):
+
+    def get_current_user(self):
+        return 'user'
+
+    @property
+    def contents_manager(self):
+        return self.settings['contents_manager']
+
+
+@skipUnless(requests and SeafileSearchHandler, 'tornado is not installed')
+class TestSearchHandler(StandInCase, AsyncHTTPTestCase):
+
+    def setUp(self):
+        StandInCase.setUp(self)
+        self.server.lib.write('/plan.txt', b'budget for the harbour')
+        self.client = self.fs()
+        AsyncHTTPTestCase.setUp(self)
+
+    def get_app(self):
+        return Application(
+            [('/seafile/search', BuildingHandler)],
+            contents_manager=self.client
+            )
+
+    def test_building_then_results(self):
+        from SeafileContentManager.seaindex import indexFor
+        index = indexFor(self.client)
+        release = threading.Event()
+        refresh = index.refresh
+
+        def slowRefresh():
+            release.wait(5)
+            refresh()
+
+        index.refresh = slowRefresh
+        response = self.fetch('/seafile/search?q=harbour')
+        self.assertEqual(response.code, 202)
+        self.assertEqual(json.loads(response.body), {'status': 'building'})
+        release.set()
+        end = time.monotonic() + 5
+        while (index.refreshing or index.fetching) and \
+                time.monotonic() < end:
+            time.sleep(0.01)
+        response = self.fetch('/seafile/search?q=harbour')
+        self.assertEqual(response.code, 200)
+        hits = json.loads(response.body)
+        self.assertEqual([x['path'] for x in hits], ['plan.txt'])
@@ -0,0 +1,252 @@
+# coding: utf-8
+"""Sync local folders with a library served by a local stand-in server.
+
+Extends the stand-in of test_transport with folders, recursive listings,
+batch uploads and deletes.
+"""
+import email
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+import time
+from email import policy
+from http.server import ThreadingHTTPServer
+from unittest import TestCase, skipUnless
+from urllib.parse import parse_qs, urlparse
+
+from .test_transport import StandInHandler
+
+try:
+    import requests
+except ImportError:
+    requests = None
+
+
+class FolderHandler(StandInHandler):
+    """Library with folders in server.dirs, counts uploaded files."""
+
+    def entry(self, path):
+        files = self.server.files
+        parent, name = path.rsplit('/', 1)
+        if path in self.server.dirs:
+            return {'name': name, 'type': 'dir', 'parent_dir': parent or '/',
+                    'mtime': 0, 'permission': 'rw', 'id': '0' * 40}
+        return {'name': name, 'type': 'file', 'parent_dir': parent or '/',
+                'size': len(files[path]), 'mtime': self.server.mtimes[path],
+                'permission': 'rw', 'id': hashlib.sha1(files[path]).hexdigest()}
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = {x: y[0] for x, y in parse_qs(url.query).items()}
+        if url.path != '/api2/repos/LIB/dir/':
+            return StandInHandler.do_GET(self)
+        folder = query['p'].rstrip('/') or '/'
+        if folder != '/' and folder not in self.server.dirs:
+            return self.reply(404, {'error_msg': 'Folder not found.'})
+        prefix = folder.rstrip('/') + '/'
+        paths = [x for x in sorted(set(self.server.files) | self.server.dirs)
+                 if x.startswith(prefix)]
+        if query.get('recursive') != '1':
+            paths = [x for x in paths if '/' not in x[len(prefix):]]
+        self.reply(200, [self.entry(x) for x in paths])
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        length = int(self.headers['Content-Length'] or 0)
+        body = self.rfile.read(length)
+        if url.path == '/api2/repos/LIB/dir/':
+            path = parse_qs(url.query)['p'][0].rstrip('/')
+            self.server.dirs.add(path)
+            return self.reply(201, 'success')
+        if url.path != '/seafhttp/upload-api/tok':
+            return self.reply(404, {})
+        message = email.message_from_bytes(
+            b'Content-Type: ' + self.headers['Content-Type'].encode() +
+            b'\r\n\r\n' + body, policy=policy.HTTP
+            )
+        parent = None
+        uploaded = []
+        for part in message.iter_parts():
+            name = part.get_param('name', header='content-disposition')
+            if name == 'parent_dir':
+                parent = part.get_payload(decode=True).decode()
+            elif name == 'file':
+                uploaded.append((part.get_filename(), part.get_payload(decode=True)))
+        results = []
+        for filename, data in uploaded:
+            path = parent + filename
+            self.server.files[path] = data
+            self.server.mtimes[path] = int(time.time())
+            self.server.uploads.append(path)
+            results.append({'name': filename, 'size': len(data),
+                            'id': hashlib.sha1(data).hexdigest()})
+        if 'ret-json=1' in url.query:
+            return self.reply(200, results)
+        self.reply(200, results[0]['id'])
+
+    def do_DELETE(self):
+        url = urlparse(self.path)
+        path = parse_qs(url.query)['p'][0].rstrip('/')
+        for key in [x for x in self.server.files
+                    if x == path or x.startswith(path + '/')]:
+            del self.server.files[key]
+        self.server.dirs = {
+            x for x in self.server.dirs
+            if x != path and not x.startswith(path + '/')
+            }
+        self.reply(200, 'success')
+
+
+@skipUnless(requests, 'requests is not installed')
+class TestSync(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), FolderHandler)
+        cls.thread = threading.Thread(target=cls.server.serve_forever, daemon=True)
+        cls.thread.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        from SeafileContentManager import seafilemixin, seahttp
+        from SeafileContentManager.seaopen import SeafileFS
+        self.server.files = {}
+        self.server.dirs = set()
+        self.server.mtimes = {}
+        self.server.uploads = []
+        self.environ = dict(os.environ)
+        os.environ['SEAFILE_TREE_CHECK_INTERVAL'] = '0'
+        self.base = seafilemixin.BASE
+        seafilemixin.BASE = tempfile.mkdtemp() + '/'
+        self.addCleanup(shutil.rmtree, seafilemixin.BASE)
+        token = 'sync-{0}'.format(time.monotonic())
+        url = 'http://{0}:{1}'.format(*self.server.server_address)
+        self.fs = SeafileFS((
+            url, {'Authorization': 'Token ' + token}, 'LIB', 'lib', 9, 'True'
+            ))
+        self.addCleanup(seahttp.dropUser, token)
+        self.local = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.local)
+        self.write('a.txt', b'alpha')
+        self.write('sub/b.txt', b'beta')
+        self.write('sub/deep/c.bin', b'\x00' * 5000)
+        self.write('skip.pyc', b'compiled')
+        self.write('.git/HEAD', b'ref')
+
+    def tearDown(self):
+        from SeafileContentManager import seafilemixin
+        seafilemixin.BASE = self.base
+        os.environ.clear()
+        os.environ.update(self.environ)
+
+    def write(self, path, data, root=None):
+        target = os.path.join(root or self.local, *path.split('/'))
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(target, 'wb') as file:
+            file.write(data)
+
+    def sync(self, **kwargs):
+        kwargs.setdefault('exclude', ('*.pyc', '.git'))
+        return self.fs.sync(self.local, '/proj', **kwargs)
+
+    def test_first_sync_uploads_all_but_excluded(self):
+        # c.bin is too large for a batch and sent on its own
+        os.environ['SEAFILE_UPLOAD_BATCH_BYTES'] = '8000'
+        result = self.sync()
+        self.assertEqual(result.failed, {})
+        self.assertEqual(
+            sorted(self.server.files),
+            ['/proj/a.txt', '/proj/sub/b.txt', '/proj/sub/deep/c.bin']
+            )
+        self.assertEqual(self.server.files['/proj/sub/deep/c.bin'], b'\x00' * 5000)
+
+    def test_second_sync_transfers_only_changes(self):
+        self.sync()
+        del self.server.uploads[:]
+        result = self.sync()
+        self.assertEqual(self.server.uploads, [])
+        self.assertEqual(result.unchanged, 3)
+        self.write('sub/b.txt', b'beta, changed')
+        result = self.sync()
+        self.assertEqual(self.server.uploads, ['/proj/sub/b.txt'])
+        self.assertEqual(self.server.files['/proj/sub/b.txt'], b'beta, changed')
+
+    def test_checksum_skips_touched_files(self):
+        self.sync(checksum=True)
+        del self.server.uploads[:]
+        path = os.path.join(self.local, 'a.txt')
+        os.utime(path, (time.time() + 100, time.time() + 100))
+        self.sync(checksum=True)
+        self.assertEqual(self.server.uploads, [])
+
+    def test_delete_and_dry_run(self):
+        self.sync()
+        shutil.rmtree(os.path.join(self.local, 'sub'))
+        reported = []
+        result = self.sync(delete=True, dryRun=True,
+                           report=lambda x, y: reported.append((x, y)))
+        self.assertEqual(result.deleted, ['sub'])
+        self.assertEqual(reported, [('delete', '/proj/sub')])
+        self.assertIn('/proj/sub/b.txt', self.server.files)
+        self.sync(delete=True)
+        self.assertEqual(sorted(self.server.files), ['/proj/a.txt'])
+
+    def test_download(self):
+        self.sync()
+        self.server.files['/proj/sub/new.txt'] = b'from the library'
+        self.server.mtimes['/proj/sub/new.txt'] = 1500000000
+        target = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, target)
+        result = self.fs.sync(target, '/proj', download=True)
+        self.assertEqual(result.failed, {})
+        path = os.path.join(target, 'sub', 'new.txt')
+        with open(path, 'rb') as file:
+            self.assertEqual(file.read(), b'from the library')
+        self.assertEqual(os.path.getmtime(path), 1500000000)
+        result = self.fs.sync(target, '/proj', download=True)
+        self.assertEqual(result.transferred, [])
+
+    def test_first_sync_compares_existing_copies(self):
+        self.server.files['/proj/a.txt'] = b'ALPHA'
+        self.server.mtimes['/proj/a.txt'] = int(time.time()) + 100
+        self.server.dirs.add('/proj')
+        self.sync()
+        self.assertEqual(self.server.files['/proj/a.txt'], b'alpha')
+        target = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, target)
+        self.write('a.txt', b'ALPHA', root=target)
+        result = self.fs.sync(target, '/proj', download=True)
+        self.assertIn('a.txt', result.transferred)
+        with open(os.path.join(target, 'a.txt'), 'rb') as file:
+            self.assertEqual(file.read(), b'alpha')
+
+    def test_first_sync_with_checksum_skips_equal_copies(self):
+        self.server.files['/proj/a.txt'] = b'alpha'
+        self.server.mtimes['/proj/a.txt'] = 0
+        self.server.dirs.add('/proj')
+        self.sync(checksum=True)
+        self.assertNotIn('/proj/a.txt', self.server.uploads)
+        self.assertIn('/proj/sub/b.txt', self.server.uploads)
+        del self.server.uploads[:]
+        self.assertEqual(self.sync().unchanged, 3)
+
+    def test_records_are_dropped_by_concurrent_deletes(self):
+        for number in range(20):
+            self.write('many/{0}.txt'.format(number), b'x')
+            self.write('other{0}/x.txt'.format(number), b'x')
+        self.sync(workers=8)
+        for number in range(20):
+            shutil.rmtree(os.path.join(self.local, 'other{0}'.format(number)))
+        result = self.sync(delete=True, workers=8)
+        self.assertEqual(result.failed, {})
+        self.assertEqual(len(result.deleted), 20)
+        from SeafileContentManager.seasync import SyncState
+        records = SyncState(self.local, self.fs, '/proj').records
+        self.assertEqual([x for x in records if x.startswith('other')], [])
+        self.assertIn('many/0.txt', records)
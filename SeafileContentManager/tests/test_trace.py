@@ -0,0 +1,56 @@
+# coding: utf-8
+"""Tracing of operations and requests against the stand-in server."""
+import os
+from unittest import TestCase, skipUnless
+
+from .standin import StandInCase, requests
+
+
+@skipUnless(requests, 'requests is not installed')
+class TestTrace(StandInCase, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.server.lib.write('/notes.txt', b'text')
+        self.client = self.fs()
+
+    def test_operations_and_requests_are_recorded(self):
+        from SeafileContentManager.seatrace import trace
+        with trace() as root:
+            self.client.listdir('/')
+            self.client.listdir('/')
+        self.assertEqual([x.name for x in root.children],
+                         ['SeafileFS.listdir', 'SeafileFS.listdir'])
+        first, second = root.children
+        self.assertEqual(first.attributes['path'], '/')
+        self.assertEqual(first.roundTrips, 1)
+        self.assertEqual(second.roundTrips, 0)
+        request = first.requests()[0]
+        self.assertEqual(request.name, 'GET')
+        self.assertEqual(request.attributes['status'], 200)
+        self.assertIn('queued_ms', request.attributes)
+        self.assertIsNotNone(root.duration)
+        self.assertIn('SeafileFS.listdir', root.format())
+
+    def test_fileserver_tokens_are_redacted(self):
+        from SeafileContentManager.seatrace import trace
+        with trace() as root:
+            self.assertEqual(b''.join(self.client.streamFile('/notes.txt')),
+                             b'text')
+        urls = [x.attributes['url'] for x in root.requests()]
+        download = [x for x in urls if '/seafhttp/files/' in x]
+        self.assertEqual(len(download), 1)
+        self.assertNotIn('LIB', download[0])
+
+    def test_budget_warning(self):
+        from SeafileContentManager import seatrace
+        os.environ['SEAFILE_TRACE_BUDGET'] = '0'
+        with self.assertLogs(seatrace.log, 'WARNING') as logged:
+            self.client.listdir('/')
+        self.assertIn('SeafileFS.listdir', logged.output[0])
+
+    def test_nothing_is_recorded_without_trace(self):
+        from SeafileContentManager.seatrace import span, tracing
+        self.assertFalse(tracing())
+        with span('x') as current:
+            self.assertIsNone(current)
@@ -0,0 +1,198 @@
+# coding: utf-8
+"""Run SeafileFS over each HTTP transport against a local stand-in server.
+
+The stand-in implements the few Seafile API calls used by listing,
+uploading, reading and retrying throttled requests, keeping files in
+memory.
+"""
+import email
+import hashlib
+import json
+import os
+import threading
+import time
+from email import policy
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import TestCase, skipUnless
+from urllib.parse import parse_qs, unquote, urlparse
+
+try:
+    import requests
+except ImportError:
+    requests = None
+
+try:
+    import httpx
+    import h2
+except ImportError:
+    httpx = None
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """Seafile API calls of one library, served from server.files."""
+
+    def log_message(self, *args):
+        pass
+
+    def reply(self, status, data, headers=()):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for key, value in headers:
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = {x: y[0] for x, y in parse_qs(url.query).items()}
+        files = self.server.files
+        base = 'http://{0}:{1}'.format(*self.server.server_address)
+        if url.path == '/api2/server-info/':
+            return self.reply(200, {'version': '9.0.0'})
+        if url.path == '/api2/repos/LIB/dir/':
+            if query['p'] == '/busy' and not self.server.throttled:
+                self.server.throttled = True
+                return self.reply(429, {}, [('Retry-After', '0')])
+            entries = [
+                {'name': x.lstrip('/'), 'type': 'file', 'size': len(y),
+                 'mtime': 0, 'permission': 'rw',
+                 'id': hashlib.sha1(y).hexdigest()}
+                for x, y in sorted(files.items())
+                ]
+            return self.reply(200, entries if query['p'] in ('/', '/busy') else [])
+        if url.path == '/api2/repos/LIB/file/detail/':
+            data = files.get(query['p'])
+            if data is None:
+                return self.reply(404, {})
+            return self.reply(200, {
+                'name': query['p'].lstrip('/'), 'size': len(data), 'mtime': 0,
+                'permission': 'rw', 'id': hashlib.sha1(data).hexdigest()
+                })
+        if url.path == '/api2/repos/LIB/file/':
+            return self.reply(200, base + '/seafhttp/files/tok' + query['p'])
+        if url.path == '/api2/repos/LIB/upload-link/':
+            return self.reply(200, base + '/seafhttp/upload-api/tok')
+        if url.path.startswith('/seafhttp/files/tok/'):
+            data = files['/' + unquote(url.path[len('/seafhttp/files/tok/'):])]
+            self.send_response(200)
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+            return
+        self.reply(404, {})
+
+    def do_POST(self):
+        if self.path != '/seafhttp/upload-api/tok':
+            return self.reply(404, {})
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        message = email.message_from_bytes(
+            b'Content-Type: ' + self.headers['Content-Type'].encode() +
+            b'\r\n\r\n' + body, policy=policy.HTTP
+            )
+        fields = {}
+        for part in message.iter_parts():
+            name = part.get_param('name', header='content-disposition')
+            fields[name] = (part.get_filename(), part.get_payload(decode=True))
+        filename, data = fields['file']
+        self.server.files[fields['parent_dir'][1].decode() + filename] = data
+        self.reply(200, hashlib.sha1(data).hexdigest())
+
+
+class TransportTests(object):
+    """Tests run for each transport, mixed into TestCase below."""
+
+    transport = None
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), StandInHandler)
+        cls.server.files = {'/hello.txt': b'hello'}
+        cls.server.throttled = False
+        cls.thread = threading.Thread(target=cls.server.serve_forever, daemon=True)
+        cls.thread.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        from SeafileContentManager import seahttp
+        from SeafileContentManager.seaopen import SeafileFS
+        self.environ = dict(os.environ)
+        os.environ['SEAFILE_HTTP_TRANSPORT'] = self.transport
+        token = '{0}-{1}'.format(self.transport, time.monotonic())
+        url = 'http://{0}:{1}'.format(*self.server.server_address)
+        self.fs = SeafileFS((
+            url, {'Authorization': 'Token ' + token}, 'LIB', 'lib', 9, 'True'
+            ))
+        self.addCleanup(seahttp.dropUser, token)
+
+    def tearDown(self):
+        os.environ.clear()
+        os.environ.update(self.environ)
+
+    def test_listdir(self):
+        self.assertIn('hello.txt', self.fs.listdir('/'))
+
+    def test_upload_and_read(self):
+        result = self.fs.upload('/up.txt', b'uploaded', checksums=('sha256',))
+        self.assertEqual(result['status'], 200)
+        self.assertEqual(result['id'], hashlib.sha1(b'uploaded').hexdigest())
+        self.assertEqual(result['sha256'], hashlib.sha256(b'uploaded').hexdigest())
+        self.assertEqual(self.fs.open('/up.txt').read(), 'uploaded')
+
+    def test_streamed_upload(self):
+        blocks = [b'x' * 1000] * 50
+        result = self.fs.upload('/stream.bin', iter(blocks), size=50000)
+        self.assertEqual(result['status'], 200)
+        self.assertEqual(self.server.files['/stream.bin'], b''.join(blocks))
+
+    def test_concurrent_reads(self):
+        results = []
+        threads = [
+            threading.Thread(
+                target=lambda: results.append(b''.join(self.fs.streamFile('/hello.txt')))
+                )
+            for x in range(8)
+            ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, [b'hello'] * 8)
+
+    def test_response_interface(self):
+        from SeafileContentManager.seatransport import createTransport
+        transport = createTransport(2)
+        self.addCleanup(transport.close)
+        base = 'http://{0}:{1}'.format(*self.server.server_address)
+        res = transport.request(
+            'GET', base + '/api2/server-info/', timeout=5, allow_redirects=False
+            )
+        self.assertTrue(res.ok)
+        res.raise_for_status()
+        self.assertEqual(res.json(), {'version': '9.0.0'})
+        res = transport.request('GET', base + '/missing', json={'a': 1})
+        self.assertFalse(res.ok)
+        with self.assertRaises(requests.HTTPError) as raised:
+            res.raise_for_status()
+        self.assertEqual(raised.exception.response.status_code, 404)
+        with self.assertRaises(TypeError):
+            transport.request('GET', base + '/', unknown=1)
+
+    def test_throttled_request_is_retried(self):
+        self.assertIn('hello.txt', self.fs.listdir('/busy'))
+        self.assertTrue(self.server.throttled)
+
+
+@skipUnless(requests, 'requests is not installed')
+class TestRequestsTransport(TransportTests, TestCase):
+    transport = 'requests'
+
+
+@skipUnless(httpx, 'httpx with the http2 extra is not installed')
+class TestHttpxTransport(TransportTests, TestCase):
+    transport = 'httpx'
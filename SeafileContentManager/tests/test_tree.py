@@ -0,0 +1,73 @@
+# coding: utf-8
+"""glob and find on tree snapshots against the stand-in server."""
+import os
+from unittest import TestCase, skipUnless
+
+from .standin import StandInCase, requests
+
+
+@skipUnless(requests, 'requests is not installed')
+class TestTree(StandInCase, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        os.environ['SEAFILE_TREE_CHECK_INTERVAL'] = '1000'
+        self.server.lib.write('/a/one.ipynb', b'{}')
+        self.server.lib.write('/a/b/two.ipynb', b'{}')
+        self.server.lib.write('/a/b/notes.txt', b'')
+        self.server.lib.write('/top.ipynb', b'{}')
+        self.client = self.fs()
+
+    def recursiveListings(self):
+        return len([x for x in self.server.requests
+                    if x[2].get('recursive') == '1'])
+
+    def test_glob_and_find(self):
+        self.assertEqual(self.client.glob('/a/*.ipynb'), ['/a/one.ipynb'])
+        self.assertEqual(self.client.glob('/**/*.ipynb'),
+                         ['/a/b/two.ipynb', '/a/one.ipynb', '/top.ipynb'])
+        self.assertEqual(self.client.find('/a', type='dir'), ['/a/b'])
+        self.assertEqual(self.client.find('/a', name='*.txt'), ['/a/b/notes.txt'])
+        self.assertEqual(self.client.find('/a', maxdepth=1),
+                         ['/a/b', '/a/one.ipynb'])
+        self.assertEqual(self.client.find('/none'), [])
+        # one listing for /a, one for the whole library
+        self.assertEqual(self.server.count('GET', '/dir/'), 2)
+
+    def test_snapshot_is_reused_for_subfolders(self):
+        self.client.find('/a')
+        self.assertEqual(self.client.find('/a/b'),
+                         ['/a/b/notes.txt', '/a/b/two.ipynb'])
+        self.assertEqual(self.server.count('GET', '/dir/'), 1)
+
+    def test_deleting_a_folder_drops_trees_below_it(self):
+        self.assertEqual(len(self.client.find('/a/b')), 2)
+        self.client.delete_file('/a')
+        self.assertEqual(self.client.find('/a/b'), [])
+        self.assertEqual(self.client.glob('/a/b/*'), [])
+
+    def test_renaming_a_folder_drops_trees_below_it(self):
+        self.assertEqual(len(self.client.find('/a/b')), 2)
+        self.client.rename_file('/a', '/c')
+        self.assertEqual(self.client.find('/a/b'), [])
+        self.assertEqual(self.client.find('/c/b'),
+                         ['/c/b/notes.txt', '/c/b/two.ipynb'])
+
+    def test_snapshot_is_checked_by_folder_ids_without_head(self):
+        os.environ['SEAFILE_TREE_CHECK_INTERVAL'] = '0'
+        client = self.fs(libraryID='', useLibToken=False)
+        for x in range(3):
+            self.assertEqual(client.glob('/**/*.txt'), ['/a/b/notes.txt'])
+        self.assertEqual(self.recursiveListings(), 1)
+        self.server.lib.write('/a/b/more.txt', b'')
+        self.assertEqual(client.glob('/**/*.txt'),
+                         ['/a/b/more.txt', '/a/b/notes.txt'])
+        self.assertEqual(self.recursiveListings(), 2)
+
+    def test_tree_checks_keep_other_caches(self):
+        os.environ['SEAFILE_TREE_CHECK_INTERVAL'] = '0'
+        self.client.getFileDetail('/top.ipynb')
+        self.client.glob('/**/*.ipynb')
+        self.client.glob('/**/*.ipynb')
+        self.client.getFileDetail('/top.ipynb')
+        self.assertEqual(self.server.count('GET', '/file/detail/'), 1)
@@ -0,0 +1,125 @@
+# coding: utf-8
+"""Write-back saves against the stand-in server."""
+import os
+import threading
+import time
+from unittest import TestCase, skipUnless
+
+from .standin import StandInCase, requests
+
+
+def textModel(content):
+    return {'type': 'file', 'format': 'text', 'content': content}
+
+
+@skipUnless(requests, 'requests is not installed')
+class TestWriteBack(StandInCase, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        os.environ['SEAFILE_WRITE_BACK'] = 'True'
+        self.client = self.fs()
+
+    def waitFor(self, condition, timeout=5):
+        end = time.monotonic() + timeout
+        while not condition():
+            self.assertLess(time.monotonic(), end, 'timed out')
+            time.sleep(0.01)
+
+    def test_save_returns_before_upload_and_flushes(self):
+        self.server.delay = 0.3
+        self.client.save(textModel('first'), 'notes.txt')
+        self.assertEqual(self.client.get('notes.txt')['content'], 'first')
+        listed = self.client.get('', type='directory')['content']
+        self.assertEqual([x['name'] for x in listed], ['notes.txt'])
+        self.assertTrue(self.client.writeBack.wait(timeout=5))
+        self.assertEqual(self.server.lib.files['/notes.txt'], b'first')
+        writeBack = self.client.writeBack
+        self.assertEqual(os.listdir(writeBack.mirrorDir), [])
+
+    def test_save_while_previous_upload_runs(self):
+        self.server.delay = 0.3
+        writeBack = self.client.writeBack
+        self.client.save(textModel('v1'), 'notes.txt')
+        self.waitFor(lambda: writeBack.inFlight)
+        self.client.save(textModel('v2'), 'notes.txt')
+        self.assertEqual(self.client.get('notes.txt')['content'], 'v2')
+        self.assertTrue(writeBack.wait(timeout=5))
+        self.assertEqual(self.server.lib.files['/notes.txt'], b'v2')
+        self.assertEqual(os.listdir(writeBack.mirrorDir), [])
+
+    def test_bursts_of_saves_are_coalesced(self):
+        writeBack = self.client.writeBack
+        self.server.delay = 0.3
+        self.client.save(textModel('other'), 'other.txt')
+        self.waitFor(lambda: writeBack.inFlight)
+        for number in range(5):
+            self.client.save(textModel(str(number)), 'notes.txt')
+        self.assertTrue(writeBack.wait(timeout=5))
+        self.assertEqual(self.server.lib.uploads, ['/other.txt', '/notes.txt'])
+        self.assertEqual(self.server.lib.files['/notes.txt'], b'4')
+
+    def test_server_change_gives_conflict_copy(self):
+        self.server.lib.write('/notes.txt', b'original')
+        writeBack = self.client.writeBack
+        self.server.delay = 0.3
+        self.client.save(textModel('other'), 'other.txt')
+        self.waitFor(lambda: writeBack.inFlight)
+        self.client.save(textModel('mine'), 'notes.txt')
+        self.server.lib.write('/notes.txt', b'theirs')
+        self.assertTrue(writeBack.wait(timeout=5))
+        self.assertEqual(self.server.lib.files['/notes.txt'], b'theirs')
+        copies = [x for x in self.server.lib.files if 'conflict' in x]
+        self.assertEqual(len(copies), 1)
+        self.assertEqual(self.server.lib.files[copies[0]], b'mine')
+
+    def test_saves_are_replayed_after_a_crash(self):
+        from SeafileContentManager.seawriteback import WriteBack
+        stuck = threading.Event()
+        crashed = WriteBack(self.client)
+        # the upload never finishes, like a process killed while uploading
+        crashed.upload = lambda *args: stuck.wait()
+        crashed.save('/notes.txt', b'unsaved')
+        self.waitFor(lambda: crashed.inFlight)
+        restarted = WriteBack(self.client)
+        self.assertTrue(restarted.isPending('/notes.txt'))
+        self.assertTrue(restarted.wait(timeout=5))
+        self.assertEqual(self.server.lib.files['/notes.txt'], b'unsaved')
+        self.assertFalse(os.path.exists(restarted.journalPath))
+
+    def test_failed_upload_is_retried_behind_other_paths(self):
+        writeBack = self.client.writeBack
+        upload = writeBack.upload
+        failed = []
+
+        def flaky(path, record, data):
+            if path == '/a.txt' and not failed:
+                failed.append(path)
+                raise IOError('connection reset')
+            return upload(path, record, data)
+
+        writeBack.upload = flaky
+        self.server.delay = 0.3
+        self.client.save(textModel('other'), 'other.txt')
+        self.waitFor(lambda: writeBack.inFlight)
+        self.client.save(textModel('a'), 'a.txt')
+        self.client.save(textModel('b'), 'b.txt')
+        self.assertTrue(writeBack.wait(timeout=10))
+        self.assertEqual(self.server.lib.uploads,
+                         ['/other.txt', '/b.txt', '/a.txt'])
+
+    def test_refused_upload_is_reported_not_retried(self):
+        writeBack = self.client.writeBack
+        self.server.refuse[('POST', '/seafhttp/upload-api/LIB')] = 403
+        self.client.save(textModel('mine'), 'notes.txt')
+        self.assertTrue(writeBack.wait(timeout=5))
+        self.assertEqual(self.server.count('POST', '/seafhttp/upload-api/LIB'), 1)
+        self.assertEqual(os.listdir(writeBack.mirrorDir), [])
+        with self.assertRaises(Exception) as raised:
+            self.client.save(textModel('again'), 'notes.txt')
+        self.assertIn('403', str(raised.exception))
+        # reported once, the next save is queued again
+        self.server.refuse.clear()
+        self.client.save(textModel('again'), 'notes.txt')
+        self.assertTrue(writeBack.wait(timeout=5))
+        self.assertEqual(self.server.lib.files['/notes.txt'], b'again')
@@ -0,0 +1,63 @@
+# coding: utf-8
+"""Folder downloads as zip archives against the stand-in server."""
+import io
+import os
+import shutil
+import tempfile
+import zipfile
+from unittest import TestCase, skipUnless
+
+from .standin import StandInCase, requests
+
+
+@skipUnless(requests, 'requests is not installed')
+class TestZipDownload(StandInCase, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.server.lib.write('/proj/a.txt', b'alpha')
+        self.server.lib.write('/proj/sub/b.bin', b'\x00\x01')
+        self.server.lib.mkdir('/proj/empty')
+        self.server.lib.write('/top.txt', b'top')
+        self.local = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.local)
+
+    def read(self, *parts):
+        with open(os.path.join(self.local, *parts), 'rb') as file:
+            return file.read()
+
+    def test_stream_zip(self):
+        data = b''.join(self.fs().streamZip('/proj'))
+        names = zipfile.ZipFile(io.BytesIO(data)).namelist()
+        self.assertIn('proj/a.txt', names)
+        self.assertIn('proj/sub/b.bin', names)
+        self.assertEqual(self.server.count('GET', '/zip-task/'), 1)
+
+    def test_download_dir_extracts(self):
+        self.fs().download_dir('/proj', self.local)
+        self.assertEqual(self.read('a.txt'), b'alpha')
+        self.assertEqual(self.read('sub', 'b.bin'), b'\x00\x01')
+        self.assertTrue(os.path.isdir(os.path.join(self.local, 'empty')))
+
+    def test_download_library_root(self):
+        self.fs().download_dir('/', self.local)
+        self.assertEqual(self.read('top.txt'), b'top')
+        self.assertEqual(self.read('proj', 'a.txt'), b'alpha')
+
+    def test_download_dir_as_archive(self):
+        target = os.path.join(self.local, 'proj.zip')
+        self.fs().download_dir('/proj', target, extract=False)
+        with zipfile.ZipFile(target) as archive:
+            self.assertEqual(archive.read('proj/a.txt'), b'alpha')
+        self.assertFalse(os.path.exists(target + '.part'))
+
+    def test_library_token_downloads_file_by_file(self):
+        client = self.fs(libraryID='', useLibToken=False)
+        client.download_dir('/proj', self.local)
+        self.assertEqual(self.read('a.txt'), b'alpha')
+        self.assertEqual(self.read('sub', 'b.bin'), b'\x00\x01')
+        self.assertEqual(self.server.count('GET', '/zip-task/'), 0)
+        target = os.path.join(self.local, 'proj.zip')
+        client.download_dir('/proj', target, extract=False)
+        with zipfile.ZipFile(target) as archive:
+            self.assertEqual(archive.read('proj/sub/b.bin'), b'\x00\x01')
@@ -54,6 +54,17 @@ setup(
         "nbformat",
         "requests"
         ],
+    extras_require={
+        "fsspec": ["fsspec"],
+        "otel": ["opentelemetry-api"],
+        "http2": ["httpx[http2]"],
+        "inventory": ["numpy", "pyarrow"],
+        },
+    entry_points={
+        "fsspec.specs": [
+            "seafile=SeafileContentManager.seafsspec.SeafileFileSystem",
+            ],
+        },
     test_suite='nose.collector',
     tests_require=['nose'],
 )